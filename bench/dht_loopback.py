@@ -0,0 +1,116 @@
+"""
+Benchmark DHT trên loopback.
+
+  python bench/dht_loopback.py --nodes 300 --torrents 50 --lookups 200
+  python bench/dht_loopback.py --nodes 500 --bootstrap-nodes 5 --peers-per-torrent 3
+
+Khởi động --nodes DHTNode trong tiến trình này, mỗi node join qua vài node đã
+chạy, rồi cho các node ngẫu nhiên announce --torrents info_hash và các node khác
+get_peers. In một dòng JSON: thời gian join, kích thước bảng định tuyến, tỉ lệ
+tìm thấy peer, độ trễ lookup (p50/p90/p99) và số thông điệp mỗi lookup.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+import dht  # noqa: E402
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(values, scale=1, digits=2):
+    return {name: round(percentile(values, fraction) * scale, digits)
+            for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99))} if values else None
+
+
+def timed_lookup(node, target, query):
+    """ (giây, số thông điệp, kết quả lookup) """
+    start = time.perf_counter()
+    result = node.lookup(target, query)
+    return time.perf_counter() - start, result[2], result
+
+
+def run(args):
+    random.seed(args.seed)
+    nodes = []
+    start = time.perf_counter()
+    try:
+        for index in range(args.nodes):
+            node = dht.DHTNode('127.0.0.1', 0).start()
+            if nodes:
+                seeds = random.sample(nodes, min(args.bootstrap_nodes, len(nodes)))
+                node.bootstrap([seed.address for seed in seeds])
+            nodes.append(node)
+        join_seconds = time.perf_counter() - start
+        table_sizes = [len(node.table) for node in nodes]
+
+        # Announce: mỗi torrent có vài peer, port giả lập là chỉ số node
+        torrents = {os.urandom(dht.ID_LENGTH): random.sample(range(len(nodes)), args.peers_per_torrent)
+                    for _ in range(args.torrents)}
+        announce_latency, announce_messages, stored_on = [], [], []
+        for info_hash, holders in torrents.items():
+            for index in holders:
+                node = nodes[index]
+                sent = node.stats['sent']
+                started = time.perf_counter()
+                stored_on.append(node.announce_peer(info_hash, 10000 + index))
+                announce_latency.append(time.perf_counter() - started)
+                announce_messages.append(node.stats['sent'] - sent)
+
+        # get_peers từ các node ngẫu nhiên
+        latency, messages, found = [], [], 0
+        hashes = list(torrents)
+        for _ in range(args.lookups):
+            info_hash = random.choice(hashes)
+            elapsed, count, (_, peers, _) = timed_lookup(random.choice(nodes), info_hash, 'get_peers')
+            latency.append(elapsed)
+            messages.append(count)
+            expected = {('127.0.0.1', 10000 + index) for index in torrents[info_hash]}
+            found += expected <= set(peers)
+        totals = {name: sum(node.stats[name] for node in nodes) for name in ('sent', 'received', 'timeouts')}
+        return {
+            'nodes': args.nodes,
+            'join_seconds': round(join_seconds, 2),
+            'routing_table': {'min': min(table_sizes), 'mean': round(sum(table_sizes) / len(table_sizes), 1),
+                              'max': max(table_sizes)},
+            'announces': len(stored_on),
+            'announce_stored_on': round(sum(stored_on) / len(stored_on), 2) if stored_on else None,
+            'announce_ms': summarize(announce_latency, 1000),
+            'announce_messages': summarize(announce_messages, digits=1),
+            'lookups': args.lookups,
+            'found_all_peers': round(found / args.lookups, 3) if args.lookups else None,
+            'lookup_ms': summarize(latency, 1000),
+            'lookup_messages': summarize(messages, digits=1),
+            'lookup_messages_mean': round(sum(messages) / len(messages), 1) if messages else None,
+            'messages_sent': totals['sent'],
+            'messages_received': totals['received'],
+            'timeouts': totals['timeouts'],
+        }
+    finally:
+        for node in nodes:
+            node.close()
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark DHT lookups with many nodes on loopback.")
+    parser.add_argument('--nodes', type=int, default=300, help="Number of DHT nodes to start")
+    parser.add_argument('--bootstrap-nodes', type=int, default=3, help="Number of running nodes each new node joins through")
+    parser.add_argument('--torrents', type=int, default=50, help="Number of info_hashes announced")
+    parser.add_argument('--peers-per-torrent', type=int, default=2, help="Number of nodes announcing each info_hash")
+    parser.add_argument('--lookups', type=int, default=200, help="Number of get_peers lookups measured")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed for choosing nodes and info_hashes")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(parse_arguments())), flush=True)
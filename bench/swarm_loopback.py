@@ -0,0 +1,211 @@
+"""
+Benchmark truyền file đầu-cuối trên loopback.
+
+  python bench/swarm_loopback.py --size-mb 64 --seeders 1 --leechers 4
+  python bench/swarm_loopback.py --size-mb 16 --files 3 --seeders 2 --leechers 8 --repeat 3
+  python bench/swarm_loopback.py --leechers 8 --magnet
+
+Khởi động tracker.py ở tiến trình riêng và các Peer trong tiến trình này (không
+cần menu), tạo file ngẫu nhiên, cho các seeder chia sẻ rồi cho mọi leecher tải
+song song. Mỗi lần chạy in một dòng JSON: thời gian hoàn tất, MB/s tổng, tỉ lệ
+upload của từng peer, tốc độ request tới tracker (từ /metrics) và RSS cao nhất.
+Với --magnet, leecher không nhận file .torrent mà tải chỉ với info_hash.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+import node  # noqa: E402
+
+TRACKER_SCRIPT = os.path.join(REPO, 'tracker.py')
+CHUNK = 1024 * 1024
+
+
+def write_random_file(path, size):
+    """ Ghi size byte ngẫu nhiên; trả về SHA-1 để kiểm tra file tải về """
+    digest = hashlib.sha1()
+    with open(path, 'wb') as file:
+        for start in range(0, size, CHUNK):
+            data = os.urandom(min(CHUNK, size - start))
+            digest.update(data)
+            file.write(data)
+    return digest.hexdigest()
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(CHUNK), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def peak_rss_mb(pid=None):
+    """ RSS cao nhất (MiB) của tiến trình pid, hoặc của tiến trình này nếu pid là None """
+    if pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def tracker_request_count(tracker_url):
+    """ Tổng số request tracker đã xử lý, đọc từ /metrics """
+    total = 0
+    for line in requests.get(f"{tracker_url}/metrics", timeout=5).text.splitlines():
+        if line.startswith('tracker_requests_total{') and 'route="/metrics"' not in line:
+            total += float(line.rsplit(' ', 1)[1])
+    return int(total)
+
+
+def wait_for_tracker(tracker_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{tracker_url}/metrics", timeout=1)
+            return True
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    return False
+
+
+def make_peer(peer_id, args):
+    return node.Peer(peer_id, 'localhost', 'localhost', tracker_port=args.port,
+                     max_in_flight=args.max_in_flight,
+                     piece_cache_size=args.piece_cache_mb * 1024 * 1024)
+
+
+def run_once(args):
+    """ Một lượt: dựng swarm, cho mọi leecher tải xong, trả về kết quả dạng dict """
+    size = int(args.size_mb * 1024 * 1024)
+    names = [f"bench_{i}.bin" for i in range(args.files)]
+    seeders = [make_peer(f"s{i}", args) for i in range(args.seeders)]
+    leechers = [make_peer(f"l{i}", args) for i in range(args.leechers)]
+
+    # Seeder đầu tiên tạo file và torrent, các seeder khác nhận bản sao
+    source_dir = f"peer_{seeders[0].peer_id}"
+    os.makedirs(source_dir)
+    digests = {name: write_random_file(os.path.join(source_dir, name), size) for name in names}
+    for name in names:
+        seeders[0].create_torrent_file(name)
+    for peer in seeders[1:] + leechers:
+        os.makedirs(f"peer_{peer.peer_id}")
+    for peer in seeders[1:]:
+        for name in names:
+            shutil.copy(os.path.join(source_dir, name), f"peer_{peer.peer_id}")
+    for peer in seeders[1:] + ([] if args.magnet else leechers):
+        for name in names:
+            shutil.copy(os.path.join(source_dir, f"{name}.torrent"), f"peer_{peer.peer_id}")
+    for peer in seeders:
+        for name in names:
+            peer.upload_info_hash_to_tracker(name)
+        peer.start_seeder_in_background()
+    for peer in leechers:
+        peer.connect_to_tracker()
+    time.sleep(0.5)
+
+    tracker_url = f"http://localhost:{args.port}"
+    requests_before = tracker_request_count(tracker_url)
+    finished = {}
+
+    info_hashes = [file['info_hash'] for file in seeders[0].files]
+
+    def download(peer):
+        if args.magnet:
+            for info_hash in info_hashes:
+                peer.download_info_hash(info_hash)
+        else:
+            for name in names:
+                peer.download_torrent(f"{name}.torrent")
+        finished[peer.peer_id] = time.perf_counter() - start
+
+    threads = [threading.Thread(target=download, args=(peer,), daemon=True) for peer in leechers]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(args.timeout)
+    elapsed = time.perf_counter() - start
+    tracker_requests = tracker_request_count(tracker_url) - requests_before
+
+    ok = all(
+        os.path.exists(os.path.join(f"peer_{peer.peer_id}", name))
+        and file_sha1(os.path.join(f"peer_{peer.peer_id}", name)) == digests[name]
+        for peer in leechers for name in names)
+    uploaded = {peer.peer_id: peer.uploaded_bytes for peer in seeders + leechers}
+    total_uploaded = sum(uploaded.values()) or 1
+    times = sorted(finished.values())
+    downloaded = size * len(names) * len(leechers)
+    return {
+        'ok': ok and len(finished) == len(leechers),
+        'size_mb': args.size_mb, 'files': args.files,
+        'seeders': args.seeders, 'leechers': args.leechers, 'magnet': args.magnet,
+        'seconds': round(elapsed, 3),
+        'leecher_seconds': {'min': round(times[0], 3), 'median': round(times[len(times) // 2], 3),
+                            'max': round(times[-1], 3)} if times else None,
+        'aggregate_mb_per_sec': round(downloaded / (1024 * 1024) / elapsed, 2),
+        'upload_share': {peer_id: round(value / total_uploaded, 3) for peer_id, value in uploaded.items()},
+        'tracker_requests': tracker_requests,
+        'tracker_requests_per_sec': round(tracker_requests / elapsed, 1),
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end transfer throughput on loopback.")
+    parser.add_argument('--size-mb', type=float, default=32, help="Size of each generated file in MiB")
+    parser.add_argument('--files', type=int, default=1, help="Number of files every leecher downloads")
+    parser.add_argument('--seeders', type=int, default=1)
+    parser.add_argument('--leechers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=1, help="Number of runs, each in a fresh swarm")
+    parser.add_argument('--max-in-flight', type=int, default=node.MAX_IN_FLIGHT)
+    parser.add_argument('--piece-cache-mb', type=int, default=node.PIECE_CACHE_SIZE // (1024 * 1024))
+    parser.add_argument('--port', type=int, default=8300, help="Port of the benchmark tracker")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds to wait for the downloads")
+    parser.add_argument('--magnet', action='store_true', help="Leechers start from the info_hash only and fetch the metadata")
+    parser.add_argument('--keep', action='store_true', help="Keep the working directory")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    for run in range(args.repeat):
+        workdir = tempfile.mkdtemp(prefix='swarm_bench_')
+        tracker = subprocess.Popen(
+            [sys.executable, TRACKER_SCRIPT, '--port', str(args.port), '--udp-port', '0', '--log-level', 'WARNING'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        cwd = os.getcwd()
+        try:
+            if not wait_for_tracker(f"http://localhost:{args.port}"):
+                raise RuntimeError("Tracker did not start")
+            os.chdir(workdir)
+            # Peer in log ra stdout/stderr; chỉ giữ dòng JSON kết quả
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+                    contextlib.redirect_stderr(devnull):
+                result = run_once(args)
+            result['run'] = run
+            result['peak_rss_mb'] = {'peers': peak_rss_mb(), 'tracker': peak_rss_mb(tracker.pid)}
+        finally:
+            os.chdir(cwd)
+            tracker.terminate()
+            tracker.wait()
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+        print(json.dumps(result), flush=True)
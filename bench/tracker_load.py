@@ -0,0 +1,297 @@
+"""
+Sinh tải cho tracker và microbenchmark các thao tác trên trạng thái swarm.
+
+  python bench/tracker_load.py http --peers 5000 --torrents 2000 --clients 4 --duration 30
+  python bench/tracker_load.py http --tracker-url http://10.0.0.5:8000 --churn 0.05
+  python bench/tracker_load.py store --torrents 10000 --peers 50000 --ops 20000
+
+Chế độ http: các tiến trình client mô phỏng hàng nghìn peer ảo gửi /connect,
+/info_hash, /peer_list, /seeding, /leeching, /scrape và /disconnect theo tỉ lệ
+cấu hình; mỗi bước một peer có thể rời đi và được thay bằng peer mới (--churn);
+độ phổ biến của torrent theo phân phối Zipf (--swarm-dist) nên có vài swarm rất
+lớn và nhiều swarm nhỏ. Kết quả: thông lượng và độ trễ p50/p99/p999 theo endpoint.
+Chế độ store: đo thẳng từng thao tác của ShardedSwarmStore, không có HTTP.
+Mỗi dòng kết quả là một đối tượng JSON.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from swarm import ShardedSwarmStore, NUM_SHARDS  # noqa: E402
+
+TRACKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tracker.py')
+# Tỉ lệ mặc định của các thao tác của một peer đã kết nối
+DEFAULT_MIX = 'info_hash=2,peer_list=10,seeding=2,leeching=2,scrape=1'
+
+
+def make_torrents(count):
+    """ Các (info_hash, filename) giả """
+    return [(hashlib.sha1(str(i).encode()).hexdigest(), f"file_{i}") for i in range(count)]
+
+
+def popularity_weights(count, dist, zipf_s):
+    """ Trọng số cộng dồn để chọn torrent: 'zipf' (swarm lớn nhỏ lệch nhau) hoặc 'uniform' """
+    if dist == 'uniform':
+        weights = [1.0] * count
+    else:
+        weights = [1.0 / (rank ** zipf_s) for rank in range(1, count + 1)]
+    return list(itertools.accumulate(weights))
+
+
+def parse_mix(text):
+    """ 'peer_list=10,scrape=1' -> ([tên thao tác], [trọng số]) """
+    actions, weights = [], []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        actions.append(name.strip())
+        weights.append(float(weight or 1))
+    return actions, weights
+
+
+def percentile(values, q):
+    """ Phân vị q (0..1) của danh sách đã sắp xếp """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# Sinh tải qua HTTP
+
+class VirtualPeers:
+    """ Các peer ảo của một tiến trình client và torrent mà mỗi peer đã chia sẻ """
+
+    def __init__(self, worker, count):
+        self.worker = worker
+        self.serial = itertools.count()
+        self.peers = [self.new_peer() for _ in range(count)]
+
+    def new_peer(self):
+        serial = next(self.serial)
+        return {'peer_id': f"v{self.worker}-{serial}", 'peer_host': '127.0.0.1',
+                'peer_port': 10000 + (self.worker * 7919 + serial) % 50000,
+                'connected': False, 'torrents': []}
+
+
+def run_client(args):
+    """ Một tiến trình client: trả về {endpoint: [độ trễ]} và số lỗi theo endpoint """
+    (tracker_url, worker, peers_per_client, torrents, cum_weights, mix, churn,
+     duration, max_requests, seed) = args
+    rng = random.Random(seed)
+    session = requests.Session()
+    virtual = VirtualPeers(worker, peers_per_client)
+    actions, weights = mix
+    latencies = {}
+    errors = {}
+
+    def call(endpoint, method, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = session.request(method, f"{tracker_url}/{endpoint}", timeout=10, **kwargs)
+            ok = response.status_code < 500
+        except requests.exceptions.RequestException:
+            ok = False
+        latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        if not ok:
+            errors[endpoint] = errors.get(endpoint, 0) + 1
+
+    def address(peer):
+        return {'peer_id': peer['peer_id'], 'peer_host': peer['peer_host'], 'peer_port': peer['peer_port']}
+
+    deadline = time.monotonic() + duration
+    done = 0
+    while time.monotonic() < deadline and (not max_requests or done < max_requests):
+        done += 1
+        index = rng.randrange(len(virtual.peers))
+        peer = virtual.peers[index]
+        if not peer['connected']:
+            call('connect', 'POST', json=address(peer))
+            peer['connected'] = True
+            continue
+        if rng.random() < churn:
+            # Peer rời swarm, một peer mới vào thay
+            call('disconnect', 'POST', json=address(peer))
+            virtual.peers[index] = virtual.new_peer()
+            continue
+        action = rng.choices(actions, weights)[0]
+        info_hash, filename = torrents[rng.choices(range(len(torrents)), cum_weights=cum_weights)[0]]
+        if action == 'info_hash' or (not peer['torrents'] and action in ('seeding', 'leeching')):
+            call('info_hash', 'POST', json=dict(address(peer), info_hash=info_hash, filename=filename))
+            peer['torrents'].append(filename)
+        elif action == 'peer_list':
+            call('peer_list', 'GET', params=dict(address(peer), info_hash=info_hash, numwant=50, compact=1))
+        elif action in ('seeding', 'leeching'):
+            flag = rng.choice(('start', 'end'))
+            call(action, 'POST', json=dict(address(peer), filename=rng.choice(peer['torrents']), flag=flag))
+        elif action == 'scrape':
+            call('scrape', 'GET', params={'filename': filename})
+    return latencies, errors
+
+
+def wait_for_tracker(tracker_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{tracker_url}/scrape", timeout=1)
+            return True
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    return False
+
+
+def bench_http(args):
+    tracker = None
+    tracker_url = args.tracker_url
+    if tracker_url is None:
+        tracker_url = f"http://127.0.0.1:{args.port}"
+        tracker = subprocess.Popen(
+            [sys.executable, TRACKER_SCRIPT, '--host', '127.0.0.1', '--port', str(args.port), '--udp-port', '0',
+             '--shards', str(args.shards), '--log-level', 'WARNING'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_tracker(tracker_url):
+            raise RuntimeError("Tracker did not start")
+        torrents = make_torrents(args.torrents)
+        cum_weights = popularity_weights(args.torrents, args.swarm_dist, args.zipf_s)
+        mix = parse_mix(args.mix)
+        peers_per_client = max(1, args.peers // args.clients)
+        jobs = [(tracker_url, c, peers_per_client, torrents, cum_weights, mix, args.churn,
+                 args.duration, args.requests, args.seed + c) for c in range(args.clients)]
+        with Pool(args.clients) as pool:
+            start = time.perf_counter()
+            results = pool.map(run_client, jobs)
+            elapsed = time.perf_counter() - start
+    finally:
+        if tracker is not None:
+            tracker.terminate()
+            tracker.wait()
+
+    latencies, errors = {}, {}
+    for client_latencies, client_errors in results:
+        for endpoint, values in client_latencies.items():
+            latencies.setdefault(endpoint, []).extend(values)
+        for endpoint, count in client_errors.items():
+            errors[endpoint] = errors.get(endpoint, 0) + count
+    latencies['all'] = [value for values in latencies.values() for value in values]
+    errors['all'] = sum(errors.values())
+    for endpoint in sorted(latencies):
+        values = sorted(latencies[endpoint])
+        print(json.dumps({
+            'mode': 'http', 'endpoint': endpoint, 'requests': len(values), 'errors': errors.get(endpoint, 0),
+            'seconds': round(elapsed, 3), 'requests_per_sec': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+            'p999_ms': round(percentile(values, 0.999) * 1000, 3),
+            'peers': args.peers, 'torrents': args.torrents, 'clients': args.clients, 'churn': args.churn,
+            'swarm_dist': args.swarm_dist,
+        }), flush=True)
+
+
+# Microbenchmark trong tiến trình
+
+def populate(store, torrents, peers, cum_weights, rng):
+    """ Mỗi peer kết nối và tham gia vài torrent chọn theo độ phổ biến """
+    addresses = [(f"p{i}", '127.0.0.1', 10000 + i % 50000) for i in range(peers)]
+    for peer_id, host, port in addresses:
+        store.connect(peer_id, host, port)
+        for index in rng.choices(range(len(torrents)), cum_weights=cum_weights, k=3):
+            info_hash, filename = torrents[index]
+            store.add_torrent_peer(info_hash, filename, peer_id, host, port)
+    return addresses
+
+
+def time_operation(name, operation, ops):
+    """ Chạy operation(i) ops lần; trả về kết quả dạng dict """
+    samples = []
+    for i in range(ops):
+        start = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    total = sum(samples)
+    return {'mode': 'store', 'operation': name, 'ops': ops, 'ops_per_sec': round(ops / total),
+            'mean_us': round(total / ops * 1e6, 3),
+            'p50_us': round(percentile(samples, 0.5) * 1e6, 3),
+            'p99_us': round(percentile(samples, 0.99) * 1e6, 3),
+            'p999_us': round(percentile(samples, 0.999) * 1e6, 3)}
+
+
+def bench_store(args):
+    rng = random.Random(args.seed)
+    torrents = make_torrents(args.torrents)
+    cum_weights = popularity_weights(args.torrents, args.swarm_dist, args.zipf_s)
+    store = ShardedSwarmStore(args.shards)
+    start = time.perf_counter()
+    addresses = populate(store, torrents, args.peers, cum_weights, rng)
+    populate_seconds = time.perf_counter() - start
+    picks = [torrents[index] for index in rng.choices(range(len(torrents)), cum_weights=cum_weights, k=args.ops)]
+    peers = [addresses[rng.randrange(len(addresses))] for _ in range(args.ops)]
+    newcomers = [(f"n{i}", '127.0.0.1', 60000 + i % 5000) for i in range(args.ops)]
+
+    operations = [
+        ('connect', lambda i: store.connect(*newcomers[i])),
+        ('add_torrent_peer', lambda i: store.add_torrent_peer(picks[i][0], picks[i][1], *newcomers[i])),
+        ('peer_list_all', lambda i: store.peer_list(picks[i][0])),
+        ('peer_list_numwant50', lambda i: store.peer_list(picks[i][0], 50)),
+        ('torrent_info', lambda i: store.torrent_info(picks[i][0])),
+        ('announce', lambda i: store.announce(picks[i][0], *peers[i], i % 2, None, 50)),
+        ('set_seeding', lambda i: store.set_seeding(picks[i][1], *peers[i], 'start' if i % 2 else 'end')),
+        ('set_leeching', lambda i: store.set_leeching(picks[i][1], *peers[i], 'start' if i % 2 else 'end')),
+        ('scrape', lambda i: store.scrape(picks[i][1])),
+        ('scrape_counts', lambda i: store.scrape_counts(picks[i][0])),
+        ('disconnect', lambda i: store.disconnect(*newcomers[i])),
+    ]
+    selected = set(args.operations) if args.operations else None
+    for name, operation in operations:
+        if selected is None or name in selected:
+            result = time_operation(name, operation, args.ops)
+            result.update(torrents=args.torrents, peers=args.peers, shards=args.shards, swarm_dist=args.swarm_dist,
+                          largest_swarm=len(store.peer_list(torrents[0][0]) or []),
+                          populate_seconds=round(populate_seconds, 3))
+            print(json.dumps(result), flush=True)
+    if selected is None or 'expire' in selected:
+        # Đẩy đồng hồ qua ttl: mọi mục đều hết hạn trong một lần quét
+        start = time.perf_counter()
+        evicted = store.expire(time.monotonic() + store.ttl + 1)
+        print(json.dumps({'mode': 'store', 'operation': 'expire_all', 'evicted': evicted,
+                          'seconds': round(time.perf_counter() - start, 3)}), flush=True)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Tracker load generator and swarm-state microbenchmarks.")
+    parser.add_argument('mode', choices=['http', 'store'])
+    parser.add_argument('--peers', type=int, default=5000, help="Number of virtual peers")
+    parser.add_argument('--torrents', type=int, default=2000)
+    parser.add_argument('--swarm-dist', choices=['zipf', 'uniform'], default='zipf', help="Torrent popularity distribution")
+    parser.add_argument('--zipf-s', type=float, default=1.0, help="Zipf exponent; larger means a few much bigger swarms")
+    parser.add_argument('--shards', type=int, default=NUM_SHARDS)
+    parser.add_argument('--seed', type=int, default=1)
+    # http
+    parser.add_argument('--tracker-url', type=str, default=None, help="Load an already running tracker instead of starting one")
+    parser.add_argument('--port', type=int, default=8400, help="Port of the tracker started by the benchmark")
+    parser.add_argument('--clients', type=int, default=4, help="Number of load-generating processes")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds of load")
+    parser.add_argument('--requests', type=int, default=0, help="Stop each client after this many requests (0 = duration only)")
+    parser.add_argument('--churn', type=float, default=0.01, help="Probability that a step replaces a peer with a new one")
+    parser.add_argument('--mix', type=str, default=DEFAULT_MIX, help="Weights of the actions of connected peers")
+    # store
+    parser.add_argument('--ops', type=int, default=20000, help="Operations timed per store benchmark")
+    parser.add_argument('--operations', nargs='*', default=None, help="Only run these store benchmarks")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    if args.mode == 'http':
+        bench_http(args)
+    else:
+        bench_store(args)
@@ -0,0 +1,108 @@
+"""
+Benchmark khôi phục trạng thái tracker từ snapshot và nhật ký ghi trước.
+
+  python bench/tracker_restore.py --torrents 10000 --peers-per-torrent 10 --tail 20000
+  python bench/tracker_restore.py --torrents 2000 --peers-per-torrent 50 --tail 20000 --fsync
+
+Dựng một ShardedSwarmStore với --torrents x --peers-per-torrent mục swarm (mặc định
+khoảng 100k) và ghi nhật ký qua StateJournal, chụp snapshot, rồi thêm --tail bản ghi
+(announce mới, completed, stopped) chỉ nằm trong nhật ký. Sau đó nạp thư mục vào
+một store rỗng như tracker.py --state-dir khi khởi động, so sánh với store gốc và
+in một dòng JSON: số mục, số bản ghi đã phát lại, dung lượng và thời gian nạp.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from swarm import ShardedSwarmStore  # noqa: E402
+from persistence import StateJournal  # noqa: E402
+
+
+def normalized(state):
+    """ Trạng thái export() không phụ thuộc thứ tự, để so sánh hai store """
+    return (sorted(map(tuple, state['peers'])),
+            sorted((info_hash, filename, completed,
+                    sorted(map(tuple, peers)), sorted(map(tuple, seeders)), sorted(map(tuple, leechers)))
+                   for info_hash, filename, completed, peers, seeders, leechers in state['swarms']))
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def build_state(directory, args):
+    """ Ghi snapshot + nhật ký đuôi vào directory; trả về (store gốc, số mục swarm, số bản ghi đuôi) """
+    random.seed(args.seed)
+    store = ShardedSwarmStore(args.shards)
+    # Không chạy luồng nền: snapshot chỉ chụp khi được gọi nên đuôi nhật ký giữ nguyên
+    journal = StateJournal(directory, fsync=args.fsync)
+    store.set_journal(journal)
+    torrents = [(hashlib.sha1(str(i).encode()).hexdigest(), f"file_{i}") for i in range(args.torrents)]
+    peers = [(f"peer_{i}", f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", 6881)
+             for i in range(args.peers_per_torrent * 4)]
+    for peer_id, host, port in peers:
+        store.connect(peer_id, host, port)
+    for info_hash, filename in torrents:
+        for peer_id, host, port in random.sample(peers, args.peers_per_torrent):
+            if random.random() < 0.5:
+                store.add_torrent_peer(info_hash, filename, peer_id, host, port)
+            else:
+                store.announce(info_hash, peer_id, host, port, 1, 'started')
+    journal.snapshot(store)
+
+    # Đuôi nhật ký: peer mới vào swarm, leecher hoàn tất, peer rời đi
+    for _ in range(args.tail):
+        info_hash, _ = random.choice(torrents)
+        peer_id, host, port = random.choice(peers)
+        event = random.choice(('started', 'completed', 'stopped'))
+        store.announce(info_hash, peer_id, host, port, 0 if event == 'completed' else 1, event)
+    journal.close()
+    return store, store.stats()['swarm_peers'], journal.records_since_snapshot
+
+
+def run(args):
+    directory = tempfile.mkdtemp(prefix='tracker_restore_')
+    try:
+        start = time.perf_counter()
+        original, entries, tail = build_state(directory, args)
+        build_seconds = time.perf_counter() - start
+
+        restored = ShardedSwarmStore(args.shards)
+        start = time.perf_counter()
+        replayed = StateJournal(directory).load(restored)
+        restore_seconds = time.perf_counter() - start
+        return {
+            'torrents': args.torrents,
+            'swarm_entries': entries,
+            'tail_records': tail,
+            'replayed': replayed,
+            'state_bytes': directory_bytes(directory),
+            'fsync': args.fsync,
+            'build_seconds': round(build_seconds, 2),
+            'restore_seconds': round(restore_seconds, 3),
+            'identical': normalized(restored.export()) == normalized(original.export()),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark restoring tracker state from a snapshot plus a log tail.")
+    parser.add_argument('--torrents', type=int, default=10000, help="Number of swarms in the snapshot")
+    parser.add_argument('--peers-per-torrent', type=int, default=10, help="Swarm entries per torrent in the snapshot")
+    parser.add_argument('--tail', type=int, default=20000, help="Number of announces logged after the snapshot")
+    parser.add_argument('--shards', type=int, default=16, help="Number of store shards")
+    parser.add_argument('--fsync', action='store_true', help="fsync the journal while building the state")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(parse_arguments())), flush=True)
@@ -0,0 +1,135 @@
+"""
+Benchmark thông lượng announce của tracker theo số worker.
+
+  python bench/tracker_shards.py --workers 1 2 4 8 --shards 1 16
+  python bench/tracker_shards.py --mode http --workers 1 2 4 8
+
+Chế độ store: các thread gọi thẳng ShardedSwarmStore (đo tranh chấp lock).
+Chế độ http: khởi động một cluster W tiến trình tracker.py (--cluster), mỗi tiến trình
+sở hữu các info_hash được HashRing giao cho nó; các tiến trình client gửi announce
+tới đúng tracker qua HTTP. Thông lượng tăng theo W khi máy có đủ nhân.
+Kết quả in ra dạng JSON, mỗi dòng một cấu hình.
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import Pool
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from swarm import ShardedSwarmStore  # noqa: E402
+from cluster import HashRing  # noqa: E402
+
+CLIENTS_PER_WORKER = 2  # Số tiến trình client cho mỗi tracker worker ở chế độ http
+TRACKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tracker.py')
+
+
+def make_torrents(count):
+    """ Các (info_hash, filename) giả """
+    return [(hashlib.sha1(str(i).encode()).hexdigest(), f"file_{i}") for i in range(count)]
+
+
+def announce_store(store, torrents, worker, requests_per_worker):
+    """ Một worker announce trực tiếp vào store: đăng ký torrent rồi bắt đầu/kết thúc leeching """
+    peer_id = f"w{worker}"
+    for i in range(requests_per_worker):
+        info_hash, filename = torrents[(worker * 7919 + i) % len(torrents)]
+        port = 10000 + i % 1000
+        store.add_torrent_peer(info_hash, filename, peer_id, '127.0.0.1', port)
+        store.set_state(info_hash, 'leechers', peer_id, '127.0.0.1', port, 'start' if i % 2 else 'end')
+        store.peer_list(info_hash)
+
+
+def bench_store(workers, shards, torrents, requests_per_worker):
+    store = ShardedSwarmStore(shards)
+    threads = [threading.Thread(target=announce_store, args=(store, torrents, w, requests_per_worker))
+               for w in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = workers * requests_per_worker
+    return {'mode': 'store', 'workers': workers, 'shards': shards, 'announces': total,
+            'seconds': round(elapsed, 3), 'announces_per_sec': round(total / elapsed)}
+
+
+def announce_http(args):
+    """ Một tiến trình client announce qua HTTP; trả về số yêu cầu thành công """
+    tracker_urls, torrents, worker, requests_per_worker = args
+    session = requests.Session()
+    ring = HashRing(tracker_urls)
+    done = 0
+    for i in range(requests_per_worker):
+        info_hash, filename = torrents[(worker * 7919 + i) % len(torrents)]
+        tracker_url = ring.owner(info_hash)
+        peer = {'peer_id': f"w{worker}", 'peer_host': '127.0.0.1', 'peer_port': 10000 + i % 1000}
+        response = session.post(f"{tracker_url}/info_hash",
+                                json=dict(peer, filename=filename, info_hash=info_hash))
+        if response.status_code == 200:
+            done += 1
+    return done
+
+
+def wait_for_tracker(tracker_url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{tracker_url}/scrape", timeout=1)
+            return True
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.1)
+    return False
+
+
+def bench_http(workers, shards, torrents, requests_per_worker, port):
+    tracker_urls = [f"http://127.0.0.1:{port + w}" for w in range(workers)]
+    trackers = [subprocess.Popen(
+        [sys.executable, TRACKER_SCRIPT, '--host', '127.0.0.1', '--port', str(port + w), '--shards', str(shards),
+         '--cluster', ','.join(tracker_urls), '--self-url', tracker_urls[w]],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for w in range(workers)]
+    try:
+        if not all(wait_for_tracker(url) for url in tracker_urls):
+            raise RuntimeError("Tracker did not start")
+        clients = workers * CLIENTS_PER_WORKER
+        jobs = [(tracker_urls, torrents, c, requests_per_worker) for c in range(clients)]
+        with Pool(clients) as pool:
+            start = time.perf_counter()
+            total = sum(pool.map(announce_http, jobs))
+            elapsed = time.perf_counter() - start
+    finally:
+        for tracker in trackers:
+            tracker.terminate()
+            tracker.wait()
+    return {'mode': 'http', 'workers': workers, 'shards': shards, 'announces': total,
+            'seconds': round(elapsed, 3), 'announces_per_sec': round(total / elapsed)}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark tracker announce throughput.")
+    parser.add_argument('--mode', choices=['store', 'http'], default='store')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--torrents', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20000, help="Announces per worker (per client process in http mode)")
+    parser.add_argument('--port', type=int, default=8100, help="First tracker port in http mode")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    torrents = make_torrents(args.torrents)
+    for shards in args.shards:
+        for workers in args.workers:
+            if args.mode == 'store':
+                result = bench_store(workers, shards, torrents, args.requests)
+            else:
+                result = bench_http(workers, shards, torrents, args.requests, args.port)
+            print(json.dumps(result), flush=True)
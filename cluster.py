@@ -0,0 +1,188 @@
+import bisect
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+
+VNODES = 64              # Số điểm ảo của mỗi tracker trên vòng băm
+HEARTBEAT_INTERVAL = 2   # Chu kỳ (giây) kiểm tra các tracker khác còn sống
+MAX_MISSES = 3           # Số lần không phản hồi liên tiếp trước khi loại tracker khỏi cluster
+FORWARD_TIMEOUT = 5      # Timeout (giây) khi chuyển tiếp yêu cầu giữa các tracker
+TRANSFER_BATCH = 1000    # Số swarm tối đa trong một lần chuyển khi cân bằng lại
+FORWARDED_HEADER = 'X-Tracker-Forwarded'  # Yêu cầu đã được một tracker khác chuyển tới
+
+log = logging.getLogger('cluster')
+
+
+def ring_hash(key):
+    """ Vị trí 64 bit của key trên vòng băm """
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """ Băm nhất quán với các điểm ảo: thêm/bớt một tracker chỉ chuyển phần key của nó """
+
+    def __init__(self, members=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self.members = sorted(set(members))
+        self.points = []
+        self.owners = []
+        points = sorted((ring_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes))
+        for point, member in points:
+            self.points.append(point)
+            self.owners.append(member)
+
+    def owner(self, key):
+        """ Tracker sở hữu key, hoặc None nếu vòng rỗng """
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, ring_hash(key)) % len(self.points)
+        return self.owners[index]
+
+
+def peer_ring_key(peer_id):
+    """ Key trên vòng băm của đăng ký /connect của một peer """
+    return f"peer:{peer_id}"
+
+
+class TrackerCluster:
+    """
+    Nhiều tracker chia nhau các info_hash theo HashRing. Mỗi tracker biết toàn bộ
+    danh sách thành viên (kèm version); thay đổi được phát tới mọi thành viên, và
+    sau mỗi thay đổi các swarm không còn thuộc về tracker này được chuyển cho chủ mới.
+    Hai thay đổi cùng version được phân xử bằng danh sách thành viên đã sắp xếp nên
+    mọi tracker chọn cùng một bản; thay đổi bị loại được làm lại ở heartbeat sau
+    (tracker chết bị loại lại, tracker bị loại nhầm tự join lại).
+    """
+
+    def __init__(self, self_url, members, store):
+        self.self_url = self_url
+        self.store = store
+        self.lock = threading.Lock()
+        self.version = 0
+        self.ring = HashRing(set(members) | {self_url})
+        self.misses = {}
+        self.session = requests.Session()
+        self.rebalance_lock = threading.Lock()
+        self.pending = False  # Còn swarm chưa chuyển được cho chủ mới
+        self.leaving = False  # Đang rời cluster, không tự join lại
+
+    @property
+    def members(self):
+        return self.ring.members
+
+    def owner(self, key):
+        return self.ring.owner(key)
+
+    def is_local(self, key):
+        return self.ring.owner(key) == self.self_url
+
+    def to_dict(self):
+        return {'members': self.members, 'version': self.version}
+
+    def set_members(self, members, version):
+        """ Nhận danh sách thành viên mới nếu (version, danh sách) lớn hơn bản hiện có; trả về True nếu đã đổi """
+        members = sorted(set(members))
+        with self.lock:
+            if (version, members) <= (self.version, self.members):
+                return False
+            self.version = version
+            self.ring = HashRing(members)
+        log.info("Cluster members (v%d): %s", version, ', '.join(members))
+        threading.Thread(target=self.rebalance, daemon=True).start()
+        return True
+
+    def change_members(self, add=(), remove=()):
+        """ Thêm/bớt thành viên rồi phát danh sách mới tới cả cluster """
+        with self.lock:
+            members = (set(self.members) | set(add)) - set(remove)
+            version = self.version + 1
+        self.set_members(sorted(members), version)
+        self.broadcast(sorted(members | set(remove)), '/cluster/members',
+                       {'members': sorted(members), 'version': version})
+
+    def broadcast(self, members, path, data):
+        for member in members:
+            if member == self.self_url:
+                continue
+            try:
+                self.session.post(member + path, json=data, timeout=FORWARD_TIMEOUT,
+                                  headers={FORWARDED_HEADER: '1'})
+            except requests.exceptions.RequestException:
+                pass  # Heartbeat của thành viên đó sẽ phát hiện và xử lý
+
+    def forward(self, member, method, path, **kwargs):
+        """ Chuyển tiếp một yêu cầu tới tracker khác, đánh dấu để nó xử lý tại chỗ """
+        headers = dict(kwargs.pop('headers', {}), **{FORWARDED_HEADER: '1'})
+        return self.session.request(method, member + path, headers=headers,
+                                    timeout=FORWARD_TIMEOUT, allow_redirects=False, **kwargs)
+
+    def join(self, seed_url):
+        """ Gia nhập cluster qua một thành viên bất kỳ """
+        response = self.session.post(seed_url + '/cluster/join', json={'url': self.self_url},
+                                     timeout=FORWARD_TIMEOUT)
+        data = response.json()
+        self.set_members(data['members'], data['version'])
+
+    def leave(self):
+        """ Rời cluster: bỏ mình khỏi vòng băm rồi chuyển hết swarm cho các chủ mới """
+        if len(self.members) <= 1:
+            return
+        self.leaving = True
+        self.change_members(remove=[self.self_url])
+        self.rebalance()
+
+    def rebalance(self):
+        """ Chuyển các swarm không còn thuộc về tracker này cho chủ của chúng """
+        with self.rebalance_lock:
+            self.pending = False
+            ring = self.ring
+            moves = {}
+            for data in self.store.export_swarms(lambda info_hash: ring.owner(info_hash) != self.self_url):
+                owner = ring.owner(data[0])
+                if owner is not None:
+                    moves.setdefault(owner, []).append(data)
+            for owner, swarms in moves.items():
+                for start in range(0, len(swarms), TRANSFER_BATCH):
+                    batch = swarms[start:start + TRANSFER_BATCH]
+                    try:
+                        response = self.forward(owner, 'POST', '/cluster/import', json={'swarms': batch})
+                    except requests.exceptions.RequestException:
+                        response = None
+                    if response is None or not response.ok:
+                        self.pending = True  # Giữ lại, heartbeat sẽ thử lại
+                        break
+                    self.store.drop_swarms([data[0] for data in batch])
+                if swarms:
+                    log.info("Moved %d swarms to %s", len(swarms), owner)
+
+    def heartbeat_loop(self):
+        """ Loại các tracker không phản hồi liên tiếp MAX_MISSES lần """
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            for member in self.members:
+                if member == self.self_url:
+                    continue
+                try:
+                    response = self.session.get(member + '/cluster', timeout=FORWARD_TIMEOUT)
+                    data = response.json()
+                    self.misses.pop(member, None)
+                    # Đồng bộ khi thành viên khác có danh sách mới hơn
+                    self.set_members(data['members'], data['version'])
+                except (requests.exceptions.RequestException, ValueError, KeyError):
+                    self.misses[member] = self.misses.get(member, 0) + 1
+                    if self.misses[member] >= MAX_MISSES:
+                        log.warning("Tracker %s is unreachable, removing it from the cluster", member)
+                        self.misses.pop(member, None)
+                        self.change_members(remove=[member])
+            if self.self_url not in self.members and not self.leaving:
+                # Vẫn chạy nhưng bị loại: thua một thay đổi cùng version hoặc từng bị coi là không phản hồi
+                log.warning("Tracker was dropped from the cluster, joining again")
+                self.change_members(add=[self.self_url])
+            if self.pending:
+                self.rebalance()
+
+    def start(self):
+        threading.Thread(target=self.heartbeat_loop, daemon=True).start()
@@ -0,0 +1,511 @@
+import hashlib
+import heapq
+import hmac
+import logging
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from queue import Queue, Empty
+
+from bencodepy import encode as bencode, decode as bdecode, DecodingError
+
+from message.tracker2peer import pack_compact_peers, unpack_compact_peers, COMPACT_IPV4_LENGTH
+
+# DHT kiểu Kademlia trên UDP (theo BEP 5): thông điệp KRPC bencode, node ID 160 bit,
+# khoảng cách XOR, truy vấn ping / find_node / get_peers / announce_peer.
+ID_LENGTH = 20
+ID_BITS = ID_LENGTH * 8
+K = 8                     # Số node tối đa của một k-bucket, cũng là số node gần nhất lookup giữ lại
+ALPHA = 3                 # Số truy vấn song song trong một lookup
+QUERY_TIMEOUT = 1.0       # Timeout (giây) chờ phản hồi của một truy vấn
+NODE_FAILURES = 2         # Node lỗi chừng này lần liên tiếp thì bị bỏ qua và được thay khi bucket đầy
+TOKEN_INTERVAL = 300      # Chu kỳ (giây) đổi secret sinh token; token của secret trước vẫn hợp lệ
+PEER_EXPIRY = 30 * 60     # Peer đã announce bị xóa sau chừng này giây nếu không announce lại
+REANNOUNCE_INTERVAL = 15 * 60  # Chu kỳ (giây) announce lại các torrent đang chia sẻ
+REFRESH_INTERVAL = 15 * 60     # Bucket không có hoạt động trong chừng này giây được làm mới bằng lookup
+MAINTENANCE_INTERVAL = 60      # Chu kỳ (giây) của luồng bảo trì
+MAX_INFO_HASHES = 2000    # Số info_hash tối đa lưu peer; vượt quá thì bỏ info_hash ít dùng nhất
+MAX_PEERS_PER_HASH = 200  # Số peer tối đa lưu cho một info_hash
+MAX_VALUES = 50           # Số peer tối đa trả về trong một get_peers
+MAX_DATAGRAM = 8192
+
+ERROR_GENERIC = 201
+ERROR_PROTOCOL = 203
+ERROR_METHOD = 204
+
+_NODE = struct.Struct('>20s4sH')  # Node dạng compact: ID + IPv4 + port
+
+log = logging.getLogger('dht')
+
+
+def pack_nodes(nodes):
+    """ Đóng gói các (node_id, (ip, port)) thành chuỗi compact; node không phải IPv4 bị bỏ qua """
+    data = bytearray()
+    for node_id, (host, port) in nodes:
+        try:
+            data += _NODE.pack(node_id, socket.inet_aton(host), port)
+        except OSError:
+            continue
+    return bytes(data)
+
+
+def unpack_nodes(data):
+    """ Giải mã chuỗi compact thành các (node_id, (ip, port)) """
+    if not isinstance(data, bytes):
+        return []
+    return [(node_id, (socket.inet_ntoa(ip), port))
+            for node_id, ip, port in (_NODE.unpack_from(data, offset)
+                                      for offset in range(0, len(data) - _NODE.size + 1, _NODE.size))]
+
+
+def distance(a, b):
+    return int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')
+
+
+class RoutingTable:
+    """
+    Các k-bucket theo độ dài tiền tố chung với node_id của mình. Mỗi bucket giữ tối
+    đa K node, sắp theo lần liên lạc gần nhất; khi bucket đầy, node cũ còn trả lời
+    được giữ lại (như Kademlia), chỉ node đã lỗi NODE_FAILURES lần bị thay.
+    """
+
+    def __init__(self, node_id, k=K):
+        self.node_id = node_id
+        self.id_int = int.from_bytes(node_id, 'big')
+        self.k = k
+        self.buckets = [OrderedDict() for _ in range(ID_BITS)]  # node_id -> [địa chỉ, lần cuối thấy, số lỗi]
+        self.bucket_updated = [time.monotonic()] * ID_BITS
+        self.lock = threading.Lock()
+
+    def bucket_index(self, node_id):
+        """ Chỉ số bucket của node (độ dài bit của khoảng cách - 1), -1 nếu là chính mình """
+        return (self.id_int ^ int.from_bytes(node_id, 'big')).bit_length() - 1
+
+    def update(self, node_id, address):
+        """ Ghi nhận node vừa liên lạc; trả về True nếu node có trong bảng sau khi cập nhật """
+        index = self.bucket_index(node_id)
+        if index < 0:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets[index]
+            self.bucket_updated[index] = now
+            if node_id in bucket:
+                bucket[node_id] = [address, now, 0]
+                bucket.move_to_end(node_id)
+                return True
+            if len(bucket) >= self.k:
+                oldest = next(iter(bucket))
+                if bucket[oldest][2] < NODE_FAILURES:
+                    return False
+                del bucket[oldest]
+            bucket[node_id] = [address, now, 0]
+            return True
+
+    def failed(self, node_id):
+        """ Node không trả lời một truy vấn """
+        index = self.bucket_index(node_id)
+        if index < 0:
+            return
+        with self.lock:
+            entry = self.buckets[index].get(node_id)
+            if entry is not None:
+                entry[2] += 1
+                # Đưa lên đầu để bị thay trước khi có node mới
+                self.buckets[index].move_to_end(node_id, last=False)
+
+    def closest(self, target, count=K):
+        """ count node còn sống gần target nhất, dạng (node_id, địa chỉ) """
+        target_int = int.from_bytes(target, 'big')
+        with self.lock:
+            nodes = [(node_id, entry[0]) for bucket in self.buckets for node_id, entry in bucket.items()
+                     if entry[2] < NODE_FAILURES]
+        return heapq.nsmallest(count, nodes, key=lambda node: int.from_bytes(node[0], 'big') ^ target_int)
+
+    def stale_buckets(self, now):
+        """ Chỉ số các bucket có node nhưng không hoạt động trong REFRESH_INTERVAL giây """
+        with self.lock:
+            return [index for index, bucket in enumerate(self.buckets)
+                    if bucket and now - self.bucket_updated[index] >= REFRESH_INTERVAL]
+
+    def random_id(self, index):
+        """ Một ID ngẫu nhiên rơi vào bucket index """
+        offset = (1 << index) | random.getrandbits(index) if index else 1
+        return (self.id_int ^ offset).to_bytes(ID_LENGTH, 'big')
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(bucket) for bucket in self.buckets)
+
+
+class TokenStore:
+    """
+    Token trả về trong get_peers, bắt buộc khi announce_peer: HMAC của IP người hỏi
+    với secret đổi mỗi TOKEN_INTERVAL giây. Không cần lưu token đã phát.
+    """
+
+    def __init__(self, interval=TOKEN_INTERVAL):
+        self.interval = interval
+        self.secrets = [os.urandom(16), os.urandom(16)]
+        self.rotated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def current_secrets(self):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.rotated >= self.interval:
+                self.secrets = [os.urandom(16), self.secrets[0]]
+                self.rotated = now
+            return list(self.secrets)
+
+    def issue(self, ip):
+        return hmac.new(self.current_secrets()[0], ip.encode(), hashlib.sha1).digest()[:8]
+
+    def valid(self, ip, token):
+        if not isinstance(token, bytes):
+            return False
+        return any(hmac.compare_digest(hmac.new(secret, ip.encode(), hashlib.sha1).digest()[:8], token)
+                   for secret in self.current_secrets())
+
+
+class PeerStorage:
+    """
+    Peer đã announce theo info_hash. Bảng có giới hạn: tối đa max_hashes info_hash
+    (bỏ info_hash ít dùng nhất) và max_peers peer mỗi info_hash; mỗi peer hết hạn
+    sau expiry giây nếu không announce lại.
+    """
+
+    def __init__(self, max_hashes=MAX_INFO_HASHES, max_peers=MAX_PEERS_PER_HASH, expiry=PEER_EXPIRY):
+        self.max_hashes = max_hashes
+        self.max_peers = max_peers
+        self.expiry = expiry
+        self.table = OrderedDict()  # info_hash -> OrderedDict((ip, port) -> hạn), sắp theo lần announce
+        self.lock = threading.Lock()
+
+    def add(self, info_hash, address, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            peers = self.table.get(info_hash)
+            if peers is None:
+                if len(self.table) >= self.max_hashes:
+                    self.table.popitem(last=False)
+                peers = self.table[info_hash] = OrderedDict()
+            else:
+                self.table.move_to_end(info_hash)
+            peers.pop(address, None)
+            peers[address] = now + self.expiry
+            if len(peers) > self.max_peers:
+                peers.popitem(last=False)
+
+    def get(self, info_hash, count=MAX_VALUES, now=None):
+        """ Tối đa count peer còn hạn, chọn ngẫu nhiên """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            peers = self.table.get(info_hash)
+            if peers is None:
+                return []
+            self._expire(info_hash, peers, now)
+            addresses = list(peers)
+        return random.sample(addresses, min(count, len(addresses)))
+
+    def _expire(self, info_hash, peers, now):
+        # Peer sắp theo lần announce nên các peer hết hạn nằm ở đầu
+        while peers and next(iter(peers.values())) <= now:
+            peers.popitem(last=False)
+        if not peers:
+            del self.table[info_hash]
+
+    def expire(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for info_hash, peers in list(self.table.items()):
+                self._expire(info_hash, peers, now)
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(peers) for peers in self.table.values())
+
+
+class DHTNode:
+    """
+    Một node DHT: luồng nhận trả lời các truy vấn và chuyển phản hồi cho truy vấn
+    đang chờ; find_node/get_peers/announce_peer là các lookup lặp, gọi được từ
+    nhiều luồng cùng lúc. stats ghi số thông điệp và độ trễ lookup.
+    """
+
+    def __init__(self, host='0.0.0.0', port=0, node_id=None):
+        self.node_id = node_id or os.urandom(ID_LENGTH)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+        self.table = RoutingTable(self.node_id)
+        self.tokens = TokenStore()
+        self.storage = PeerStorage()
+        self.pending = {}       # transaction id -> (hàng đợi phản hồi, địa chỉ được hỏi)
+        self.pending_lock = threading.Lock()
+        self.next_tid = random.getrandbits(32)
+        self.announced = {}     # info_hash -> (port, lần announce gần nhất)
+        self.running = False
+        self.stats_lock = threading.Lock()
+        self.stats = {'sent': 0, 'received': 0, 'timeouts': 0,
+                      'lookups': 0, 'lookup_messages': 0, 'lookup_seconds': 0.0}
+
+    def count(self, name, value=1):
+        with self.stats_lock:
+            self.stats[name] += value
+
+    # Gửi/nhận
+
+    def send(self, address, message):
+        try:
+            self.sock.sendto(bencode(message), address)
+        except OSError:
+            return
+        self.count('sent')
+
+    def send_query(self, address, query, arguments, replies):
+        """ Gửi truy vấn; phản hồi (tid, địa chỉ, thông điệp) được đưa vào hàng đợi replies """
+        with self.pending_lock:
+            self.next_tid = (self.next_tid + 1) & 0xFFFFFFFF
+            tid = struct.pack('>I', self.next_tid)
+            self.pending[tid] = (replies, address)
+        self.send(address, {'t': tid, 'y': 'q', 'q': query, 'a': dict(arguments, id=self.node_id)})
+        return tid
+
+    def cancel(self, tid):
+        with self.pending_lock:
+            self.pending.pop(tid, None)
+
+    def query(self, address, query, arguments, timeout=QUERY_TIMEOUT):
+        """ Truy vấn một node và chờ; trả về dict phản hồi 'r' hoặc None """
+        replies = Queue()
+        tid = self.send_query(address, query, arguments, replies)
+        try:
+            _, _, message = replies.get(timeout=timeout)
+        except Empty:
+            self.cancel(tid)
+            self.count('timeouts')
+            return None
+        response = message.get(b'r')
+        return response if message.get(b'y') == b'r' and isinstance(response, dict) else None
+
+    def serve_forever(self):
+        while self.running:
+            try:
+                data, address = self.sock.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                if not self.running:
+                    return
+                continue
+            self.count('received')
+            try:
+                self.handle_datagram(data, address)
+            except Exception:
+                # Một datagram lỗi không được dừng luồng nhận của node
+                log.exception("Failed to handle DHT message from %s:%s", *address[:2])
+
+    def handle_datagram(self, data, address):
+        """ Trả lời truy vấn, hoặc chuyển phản hồi cho truy vấn đang chờ """
+        try:
+            message = bdecode(data)
+            kind, tid = message[b'y'], message[b't']
+        except (DecodingError, KeyError, TypeError, IndexError):
+            return
+        if not isinstance(kind, bytes) or not isinstance(tid, bytes):
+            return
+        if kind == b'q':
+            self.handle_query(message, address)
+        elif kind in (b'r', b'e'):
+            with self.pending_lock:
+                waiting = self.pending.get(tid)
+                if waiting is None or waiting[1] != address:
+                    return
+                del self.pending[tid]
+            waiting[0].put((tid, address, message))
+
+    def handle_query(self, message, address):
+        """ Trả lời ping / find_node / get_peers / announce_peer """
+        tid = message.get(b't')
+        query = message.get(b'q')
+        arguments = message.get(b'a')
+        if not isinstance(tid, bytes) or not isinstance(query, bytes):
+            return
+        if not isinstance(arguments, dict) or not isinstance(arguments.get(b'id'), bytes) \
+                or len(arguments[b'id']) != ID_LENGTH:
+            self.send(address, {'t': tid, 'y': 'e', 'e': [ERROR_PROTOCOL, 'Invalid arguments']})
+            return
+        self.table.update(arguments[b'id'], address)
+        response = {'id': self.node_id}
+        if query == b'ping':
+            pass
+        elif query in (b'find_node', b'get_peers'):
+            target = arguments.get(b'target' if query == b'find_node' else b'info_hash')
+            if not isinstance(target, bytes) or len(target) != ID_LENGTH:
+                self.send(address, {'t': tid, 'y': 'e', 'e': [ERROR_PROTOCOL, 'Invalid target']})
+                return
+            response['nodes'] = pack_nodes(self.table.closest(target))
+            if query == b'get_peers':
+                response['token'] = self.tokens.issue(address[0])
+                peers = self.storage.get(target)
+                if peers:
+                    packed = pack_compact_peers({'peer_host': host, 'peer_port': port} for host, port in peers)[0]
+                    response['values'] = [packed[offset:offset + COMPACT_IPV4_LENGTH]
+                                          for offset in range(0, len(packed), COMPACT_IPV4_LENGTH)]
+        elif query == b'announce_peer':
+            info_hash = arguments.get(b'info_hash')
+            port = address[1] if arguments.get(b'implied_port') else arguments.get(b'port')
+            if not isinstance(info_hash, bytes) or len(info_hash) != ID_LENGTH \
+                    or not isinstance(port, int) or not 0 < port < 65536:
+                self.send(address, {'t': tid, 'y': 'e', 'e': [ERROR_PROTOCOL, 'Invalid announce']})
+                return
+            if not self.tokens.valid(address[0], arguments.get(b'token')):
+                self.send(address, {'t': tid, 'y': 'e', 'e': [ERROR_PROTOCOL, 'Bad token']})
+                return
+            self.storage.add(info_hash, (address[0], port))
+        else:
+            self.send(address, {'t': tid, 'y': 'e', 'e': [ERROR_METHOD, 'Method Unknown']})
+            return
+        self.send(address, {'t': tid, 'y': 'r', 'r': response})
+
+    # Lookup
+
+    def lookup(self, target, query='find_node'):
+        """
+        Lookup lặp: luôn giữ tối đa ALPHA truy vấn tới các node gần target nhất chưa
+        hỏi, cho tới khi K node gần nhất đã biết đều đã trả lời hoặc lỗi.
+        Trả về ([(node_id, địa chỉ, token)] của K node gần nhất đã trả lời, [peer], số thông điệp).
+        """
+        start = time.perf_counter()
+        key = 'target' if query == 'find_node' else 'info_hash'
+        candidates = dict(self.table.closest(target, K))
+        queried, failed = set(), set()
+        responded = {}   # node_id -> (địa chỉ, token)
+        peers = {}
+        replies = Queue()
+        in_flight = {}   # tid -> (node_id, hạn chờ)
+        messages = 0
+        if query == 'get_peers':
+            # Node này cũng là một phần của DHT: có thể chính nó đang lưu peer của info_hash
+            peers.update(dict.fromkeys(self.storage.get(target)))
+
+        def by_distance(node_id):
+            return distance(node_id, target)
+
+        while True:
+            ranked = sorted((node_id for node_id in candidates if node_id not in failed), key=by_distance)[:K]
+            for node_id in ranked:
+                if len(in_flight) >= ALPHA:
+                    break
+                if node_id in queried:
+                    continue
+                queried.add(node_id)
+                tid = self.send_query(candidates[node_id], query, {key: target}, replies)
+                in_flight[tid] = (node_id, time.monotonic() + QUERY_TIMEOUT)
+                messages += 1
+            if not in_flight:
+                break
+            wait = max(0.0, min(deadline for _, deadline in in_flight.values()) - time.monotonic())
+            try:
+                tid, address, message = replies.get(timeout=wait)
+            except Empty:
+                now = time.monotonic()
+                for tid, (node_id, deadline) in list(in_flight.items()):
+                    if deadline <= now:
+                        del in_flight[tid]
+                        self.cancel(tid)
+                        failed.add(node_id)
+                        self.table.failed(node_id)
+                        self.count('timeouts')
+                continue
+            node_id, _ = in_flight.pop(tid, (None, None))
+            if node_id is None:
+                continue
+            response = message.get(b'r')
+            if message.get(b'y') != b'r' or not isinstance(response, dict):
+                failed.add(node_id)
+                continue
+            self.table.update(node_id, address)
+            responded[node_id] = (address, response.get(b'token'))
+            for found_id, found_address in unpack_nodes(response.get(b'nodes', b'')):
+                if found_id != self.node_id and found_id not in candidates:
+                    candidates[found_id] = found_address
+            values = response.get(b'values')
+            if isinstance(values, list):
+                for peer in unpack_compact_peers(b''.join(value for value in values if isinstance(value, bytes))):
+                    peers[(peer['peer_host'], peer['peer_port'])] = None
+
+        closest = sorted(responded, key=by_distance)[:K]
+        with self.stats_lock:
+            self.stats['lookups'] += 1
+            self.stats['lookup_messages'] += messages
+            self.stats['lookup_seconds'] += time.perf_counter() - start
+        return [(node_id,) + responded[node_id] for node_id in closest], list(peers), messages
+
+    def find_node(self, target):
+        """ K node gần target nhất, dạng (node_id, địa chỉ) """
+        return [(node_id, address) for node_id, address, _ in self.lookup(target)[0]]
+
+    def get_peers(self, info_hash):
+        """ Các (ip, port) đã announce info_hash (20 byte) """
+        return self.lookup(info_hash, 'get_peers')[1]
+
+    def announce_peer(self, info_hash, port):
+        """ Announce port của mình cho K node gần info_hash nhất; trả về số node đã nhận """
+        self.announced[info_hash] = (port, time.monotonic())
+        nodes, _, _ = self.lookup(info_hash, 'get_peers')
+        replies = Queue()
+        tids = [self.send_query(address, 'announce_peer', {'info_hash': info_hash, 'port': port, 'token': token}, replies)
+                for _, address, token in nodes if token is not None]
+        accepted = 0
+        deadline = time.monotonic() + QUERY_TIMEOUT
+        for _ in tids:
+            try:
+                _, _, message = replies.get(timeout=max(0.0, deadline - time.monotonic()))
+            except Empty:
+                break
+            accepted += message.get(b'y') == b'r'
+        for tid in tids:
+            self.cancel(tid)
+        return accepted
+
+    def bootstrap(self, addresses):
+        """ Liên lạc các node đã biết rồi tìm chính mình để lấp đầy bảng định tuyến; trả về số node trong bảng """
+        for host, port in addresses:
+            try:
+                address = (socket.gethostbyname(host), int(port))
+            except OSError:
+                continue
+            response = self.query(address, 'ping', {})
+            if response is not None and isinstance(response.get(b'id'), bytes):
+                self.table.update(response[b'id'], address)
+        self.find_node(self.node_id)
+        return len(self.table)
+
+    # Bảo trì
+
+    def maintenance_loop(self):
+        """ Xóa peer hết hạn, làm mới bucket lâu không hoạt động và announce lại định kỳ """
+        while self.running:
+            time.sleep(MAINTENANCE_INTERVAL)
+            now = time.monotonic()
+            self.storage.expire()
+            for index in self.table.stale_buckets(now):
+                self.find_node(self.table.random_id(index))
+            for info_hash, (port, announced) in list(self.announced.items()):
+                if now - announced >= REANNOUNCE_INTERVAL:
+                    self.announce_peer(info_hash, port)
+
+    def start(self):
+        """ Chạy luồng nhận và luồng bảo trì """
+        self.running = True
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        threading.Thread(target=self.maintenance_loop, daemon=True).start()
+        return self
+
+    def close(self):
+        self.running = False
+        self.sock.close()
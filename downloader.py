@@ -0,0 +1,319 @@
+import hashlib
+import os
+import select
+import socket
+import threading
+import time
+from threading import Thread
+
+from bencodepy import encode as bencode
+
+from message.peer2peer import (
+    HAVE, BITFIELD, REQUEST, PIECE, CANCEL, PEX, METADATA_REQUEST, METADATA_PIECE, METADATA_REJECT,
+    ProtocolError, PexState, send_handshake, read_handshake, send_message, read_message,
+    pack_request, unpack_have, unpack_piece, pack_pex, unpack_pex, normalize_address,
+    metadata_piece_count, pack_metadata_request, unpack_metadata_piece,
+)
+from piece_picker import PiecePicker
+from storage import Bitfield, TorrentStorage, HASH_LENGTH
+
+MAX_CONNECTIONS = 30    # Số kết nối tối đa tới các peer khi tải
+MAX_PEER_FAILURES = 3   # Số lần lỗi trước khi tạm bỏ qua một peer
+PEER_TIMEOUT = 10       # Timeout (giây) cho mỗi kết nối tới peer
+RESUME_SAVE_INTERVAL = 5  # Chu kỳ (giây) lưu file resume khi đang tải
+IDLE_POLL_INTERVAL = 0.5  # Thời gian chờ thông điệp khi không có yêu cầu nào đang chờ
+
+
+class TorrentDownload:
+    """ Một lượt tải torrent: kết nối tới các peer, chọn mảnh hiếm nhất trước và ghi xuống đĩa """
+
+    def __init__(self, peer, info_hash, info, tracker_url):
+        self.peer = peer
+        self.info_hash = info_hash
+        self.tracker_url = tracker_url
+        self.filename = info[b'name'].decode()
+        self.piece_hashes = info[b'pieces']
+        self.piece_length = info[b'piece length']
+        self.length = info[b'length']
+        self.num_pieces = len(self.piece_hashes) // HASH_LENGTH
+
+        self.storage = TorrentStorage(
+            os.path.join(f"peer_{peer.peer_id}", self.filename), self.length, self.piece_length)
+        # Chỉ tải các mảnh chưa có từ lần tải trước
+        self.have = self.storage.load_resume(info_hash, self.piece_hashes)
+        self.picker = PiecePicker(self.num_pieces, self.have, self.piece_size)
+
+        # Thông tin chia sẻ cho server seeding để phục vụ các mảnh đã có
+        self.file_entry = {
+            'filename': self.filename,
+            'info_hash': info_hash,
+            'pieces': self.piece_hashes,
+            'piece_length': self.piece_length,
+            'length': self.length,
+            'have': self.have,
+            'have_log': [],
+            'metadata': bencode(info),
+        }
+
+        # Trạng thái dùng chung giữa các kết nối
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.open_sockets = {}
+        self.peer_failures = {}
+        self.pex_candidates = {}   # (host, port) -> None: peer biết qua PEX, chưa kết nối
+        self.tracker_requests = 0  # Số lần phải hỏi tracker danh sách peer
+        self.done = threading.Event()
+
+    def piece_size(self, index):
+        return min(self.piece_length, self.length - index * self.piece_length)
+
+    def is_complete(self):
+        return self.have.complete()
+
+    def save_resume(self):
+        """ Lưu bitfield hiện tại vào file resume """
+        with self.lock:
+            snapshot = self.have.copy()
+        self.storage.save_resume(self.info_hash, snapshot)
+
+    def on_piece(self, index, piece, sources):
+        """ Kiểm tra SHA-1 rồi ghi mảnh đã ghép đủ block; trả về False nếu mảnh bị hỏng """
+        piece_hash = self.piece_hashes[index * HASH_LENGTH:(index + 1) * HASH_LENGTH]
+        if hashlib.sha1(piece).digest() != piece_hash:
+            self.picker.piece_failed(index)
+            # Không biết block nào hỏng nên tính lỗi cho mọi peer đã gửi
+            with self.lock:
+                for key in sources:
+                    self.peer_failures[key] = self.peer_failures.get(key, 0) + 1
+            return False
+
+        self.storage.write_piece(index, piece)
+        with self.lock:
+            self.have.add(index)
+            self.file_entry['have_log'].append(index)
+        if self.picker.complete(index) == 0:
+            self.done.set()
+        return True
+
+    def add_pex_peers(self, added, dropped):
+        """ Ghi nhận peer mới/đã rời mà một peer đang kết nối quảng bá qua PEX """
+        own = normalize_address(self.peer.peer_host, self.peer.peer_port)
+        with self.lock:
+            for address in added:
+                address = normalize_address(*address)
+                if address != own and address not in self.connections:
+                    self.pex_candidates[address] = None
+            for address in dropped:
+                self.pex_candidates.pop(normalize_address(*address), None)
+
+    def send_pex(self, client_socket, key, pex, now):
+        """ Gửi peer đang kết nối thay đổi từ lần trước, kèm port lắng nghe của mình """
+        first = pex.last is None
+        added, dropped = pex.delta(self.peer.pex_peers(self.info_hash) - {key}, now)
+        if first or added or dropped:
+            send_message(client_socket, PEX, pack_pex(added, dropped, self.peer.peer_port))
+
+    def connection_worker(self, seeder_host, seeder_port):
+        """ Một kết nối lâu dài tới peer, luôn giữ tối đa max_in_flight yêu cầu block """
+        key = (seeder_host, seeder_port)
+        outstanding = set()
+        remote_have = Bitfield(self.num_pieces)
+        pex = PexState()
+        registered = False
+
+        def add_remote_pieces(indices):
+            new = [index for index in indices if 0 <= index < self.num_pieces and index not in remote_have]
+            for index in new:
+                remote_have.add(index)
+            self.picker.add_pieces(new)
+
+        try:
+            with socket.create_connection(key, timeout=PEER_TIMEOUT) as client_socket:
+                with self.lock:
+                    self.open_sockets[key] = client_socket
+                    have_bits = self.have.to_bytes()
+                send_handshake(client_socket, self.info_hash, self.peer.peer_id)
+                remote_hash, remote_id = read_handshake(client_socket)
+                if remote_hash != self.info_hash:
+                    raise ProtocolError("info_hash mismatch in handshake")
+                send_message(client_socket, BITFIELD, have_bits)
+                self.peer.pex_add(self.info_hash, key)
+                registered = True
+
+                while not self.done.is_set():
+                    now = time.monotonic()
+                    if pex.due(now):
+                        self.send_pex(client_socket, key, pex, now)
+                    if self.peer_failures.get(key, 0) >= MAX_PEER_FAILURES:
+                        print(f"Dropping {seeder_host}:{seeder_port} after repeated corrupted pieces")
+                        break
+
+                    # Endgame: hủy các block trùng đã nhận được từ peer khác
+                    if self.picker.endgame:
+                        for request in [request for request in outstanding if self.picker.is_received(*request[:2])]:
+                            outstanding.discard(request)
+                            send_message(client_socket, CANCEL, pack_request(*request))
+
+                    # Giữ đầy pipeline bằng các block của mảnh hiếm nhất mà peer này có
+                    free_slots = self.peer.max_in_flight - len(outstanding)
+                    if free_slots > 0:
+                        for request in self.picker.pick_blocks(key, remote_have, free_slots):
+                            outstanding.add(request)
+                            send_message(client_socket, REQUEST, pack_request(*request))
+                    if not outstanding and not select.select([client_socket], [], [], IDLE_POLL_INTERVAL)[0]:
+                        continue
+
+                    msg_id, payload = read_message(client_socket)
+                    if msg_id == BITFIELD:
+                        add_remote_pieces(Bitfield(self.num_pieces, payload))
+                    elif msg_id == HAVE:
+                        add_remote_pieces([unpack_have(payload)])
+                    elif msg_id == PEX:
+                        added, dropped, _ = unpack_pex(payload)
+                        self.add_pex_peers(added, dropped)
+                    elif msg_id == PIECE:
+                        index, begin, block = unpack_piece(payload)
+                        request = (index, begin, len(block))
+                        if request not in outstanding:
+                            continue
+                        outstanding.discard(request)
+                        piece, sources = self.picker.on_block(key, index, begin, block)
+                        if piece is None:
+                            continue
+                        if self.on_piece(index, piece, sources):
+                            print(f"Received and validated piece {index} from {seeder_host}:{seeder_port}")
+                        else:
+                            # Mảnh đã được trả về picker để tải lại
+                            print(f"Piece {index} is corrupted")
+        except (OSError, ProtocolError) as e:
+            if not self.done.is_set():
+                print(f"Connection to {seeder_host}:{seeder_port} failed: {e}")
+                with self.lock:
+                    self.peer_failures[key] = self.peer_failures.get(key, 0) + 1
+        finally:
+            if registered:
+                self.peer.pex_remove(self.info_hash, key)
+            self.picker.abort_blocks(key, outstanding)
+            self.picker.remove_pieces(list(remote_have))
+            with self.lock:
+                self.connections.pop(key, None)
+                self.open_sockets.pop(key, None)
+
+    def connect_peers(self, peers):
+        """ Mở kết nối tới các peer mới; trả về số kết nối đã mở """
+        started = 0
+        with self.lock:
+            for peer in peers:
+                # Cùng một peer có thể đến từ tracker (tên máy) và từ PEX (IP)
+                key = normalize_address(peer['peer_host'], peer['peer_port'])
+                if peer['peer_id'] is not None:
+                    if str(peer['peer_id']) == str(self.peer.peer_id):
+                        continue
+                elif key == normalize_address(self.peer.peer_host, self.peer.peer_port):
+                    # Danh sách compact và PEX không có peer_id: nhận ra chính mình qua địa chỉ
+                    continue
+                if key in self.connections or self.peer_failures.get(key, 0) >= MAX_PEER_FAILURES:
+                    continue
+                if len(self.connections) >= MAX_CONNECTIONS:
+                    break
+                thread = Thread(target=self.connection_worker, args=key, daemon=True)
+                self.connections[key] = thread
+                thread.start()
+                started += 1
+        return started
+
+    def run(self):
+        """
+        Tải cho tới khi đủ mảnh; trả về True nếu hoàn tất.
+        Peer mới chủ yếu đến từ PEX; tracker chỉ được hỏi theo chu kỳ announce
+        hoặc khi không còn kết nối nào.
+        """
+        last_refresh = 0
+        last_save = time.monotonic()
+        try:
+            while not self.done.is_set():
+                with self.lock:
+                    candidates = [{'peer_id': None, 'peer_host': host, 'peer_port': port}
+                                  for host, port in self.pex_candidates]
+                if candidates:
+                    self.connect_peers(candidates)
+                with self.lock:
+                    active = len(self.connections)
+                    # Giữ lại các peer chưa kết nối được vì đã đủ MAX_CONNECTIONS
+                    for key in [key for key in self.pex_candidates
+                                if key in self.connections or self.peer_failures.get(key, 0) >= MAX_PEER_FAILURES]:
+                        del self.pex_candidates[key]
+                now = time.monotonic()
+                if active == 0 or (active < MAX_CONNECTIONS and now - last_refresh >= self.peer.announce_interval):
+                    # Contact the tracker to get peers
+                    peers = self.peer.fetch_peer_list(self.tracker_url, self.info_hash)
+                    self.tracker_requests += 1
+                    last_refresh = now
+                    if peers is None:
+                        if active == 0:
+                            return False
+                    elif self.connect_peers(peers) == 0 and active == 0:
+                        print("No peers found. Trying again in 5 seconds.")
+                        with self.lock:
+                            self.peer_failures.clear()
+                        self.done.wait(5)
+                        continue
+                if now - last_save >= RESUME_SAVE_INTERVAL:
+                    self.save_resume()
+                    last_save = now
+                self.done.wait(1)
+            return True
+        finally:
+            self.stop()
+
+    def stop(self):
+        """ Dừng các kết nối trước khi đóng file, rồi lưu tiến độ để lần sau tải tiếp """
+        self.done.set()
+        with self.lock:
+            threads = list(self.connections.values())
+            for client_socket in self.open_sockets.values():
+                try:
+                    client_socket.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        for thread in threads:
+            thread.join(PEER_TIMEOUT)
+        self.save_resume()
+        self.storage.close()
+
+
+def fetch_metadata(host, port, info_hash, peer_id):
+    """
+    Tải metadata (dict info bencode) của torrent từ một peer: xin mảnh đầu để biết
+    kích thước rồi xin mọi mảnh còn lại cùng lúc.
+    Trả về metadata có SHA-1 khớp info_hash, hoặc None.
+    """
+    pieces = {}
+    size = count = None
+    try:
+        with socket.create_connection((host, port), timeout=PEER_TIMEOUT) as client_socket:
+            send_handshake(client_socket, info_hash, peer_id)
+            if read_handshake(client_socket)[0] != info_hash:
+                return None
+            send_message(client_socket, METADATA_REQUEST, pack_metadata_request(0))
+            while count is None or len(pieces) < count:
+                msg_id, payload = read_message(client_socket)
+                if msg_id == METADATA_REJECT:
+                    return None
+                if msg_id != METADATA_PIECE:
+                    continue  # BITFIELD, HAVE, PEX... không cần khi chỉ lấy metadata
+                piece, total, data = unpack_metadata_piece(payload)
+                if size is None:
+                    size, count = total, metadata_piece_count(total)
+                    for index in range(1, count):
+                        send_message(client_socket, METADATA_REQUEST, pack_metadata_request(index))
+                elif total != size:
+                    raise ProtocolError("Metadata size changed")
+                if piece < count:
+                    pieces[piece] = data
+    except (OSError, ProtocolError):
+        return None
+    metadata = b''.join(pieces[index] for index in range(count))
+    if len(metadata) != size or hashlib.sha1(metadata).hexdigest() != info_hash:
+        return None
+    return metadata
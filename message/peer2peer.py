@@ -0,0 +1,305 @@
+import hashlib
+import os
+import struct
+
+from bencodepy import encode as bencode, decode as bdecode, DecodingError
+
+from message.tracker2peer import pack_compact_peers, unpack_compact_peers, resolve_address
+
+# Giao thức peer-to-peer: handshake cố định, sau đó là các thông điệp
+# <length:4><id:1><payload> trên cùng một kết nối TCP.
+PROTOCOL = b'STA-network peer'
+HANDSHAKE_LENGTH = 1 + len(PROTOCOL) + 8 + 20 + 20
+MAX_MESSAGE_LENGTH = 32 * 1024 * 1024
+
+HAVE = 4
+BITFIELD = 5
+REQUEST = 6
+PIECE = 7
+CANCEL = 8
+PEX = 20  # Trao đổi peer (theo BEP 11): payload bencode added/dropped dạng compact và port lắng nghe
+# Trao đổi metadata (theo BEP 9): peer chỉ biết info_hash xin dict info bencode theo từng mảnh
+METADATA_REQUEST = 21  # Payload: số thứ tự mảnh metadata
+METADATA_PIECE = 22    # Payload: số thứ tự, tổng kích thước metadata, dữ liệu
+METADATA_REJECT = 23   # Payload: số thứ tự mảnh không phục vụ được
+
+PEX_INTERVAL = 5     # Chu kỳ (giây) gửi danh sách peer thay đổi trên mỗi kết nối
+MAX_PEX_PEERS = 50   # Số peer tối đa trong 'added' của một thông điệp PEX
+METADATA_PIECE_SIZE = 16 * 1024       # Kích thước một mảnh metadata
+MAX_METADATA_SIZE = 8 * 1024 * 1024   # Metadata lớn hơn bị từ chối
+
+_LENGTH = struct.Struct('>I')
+_HAVE = struct.Struct('>I')
+_REQUEST = struct.Struct('>III')
+_PIECE_HEADER = struct.Struct('>II')
+_METADATA_HEADER = struct.Struct('>II')  # số thứ tự mảnh, tổng kích thước
+
+
+class ProtocolError(Exception):
+    """ Lỗi khi peer gửi dữ liệu không đúng giao thức """
+
+
+def encode_peer_id(peer_id):
+    """ Chuyển peer_id (chuỗi) thành 20 byte để đặt vào handshake """
+    return str(peer_id).encode()[:20].ljust(20, b'\0')
+
+
+def decode_peer_id(raw):
+    """ Chuyển 20 byte peer_id trong handshake về chuỗi """
+    return raw.rstrip(b'\0').decode(errors='replace')
+
+
+def recv_exact(sock, length):
+    """
+    Đọc đúng length byte từ socket.
+    sock: Socket TCP đã kết nối.
+    length: Số byte cần đọc.
+    """
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = sock.recv_into(view[received:], length - received)
+        if count == 0:
+            raise ConnectionError("Connection closed by peer")
+        received += count
+    return bytes(buffer)
+
+
+def build_handshake(info_hash, peer_id):
+    """
+    Tạo thông điệp handshake.
+    info_hash: info_hash của torrent (chuỗi hex).
+    peer_id: ID của peer gửi handshake.
+    """
+    return (bytes([len(PROTOCOL)]) + PROTOCOL + b'\0' * 8
+            + bytes.fromhex(info_hash) + encode_peer_id(peer_id))
+
+
+def send_handshake(sock, info_hash, peer_id):
+    """ Gửi handshake qua socket """
+    sock.sendall(build_handshake(info_hash, peer_id))
+
+
+def read_handshake(sock):
+    """
+    Đọc handshake từ peer.
+    Trả về (info_hash dạng hex, peer_id).
+    """
+    return parse_handshake(recv_exact(sock, HANDSHAKE_LENGTH))
+
+
+def parse_handshake(data):
+    """ Kiểm tra và tách (info_hash hex, peer_id) từ handshake """
+    if data[0] != len(PROTOCOL) or data[1:1 + len(PROTOCOL)] != PROTOCOL:
+        raise ProtocolError("Unknown protocol in handshake")
+    offset = 1 + len(PROTOCOL) + 8
+    info_hash = data[offset:offset + 20].hex()
+    peer_id = decode_peer_id(data[offset + 20:offset + 40])
+    return info_hash, peer_id
+
+
+async def read_handshake_async(reader):
+    """
+    Đọc handshake từ asyncio.StreamReader.
+    Trả về (info_hash dạng hex, peer_id).
+    """
+    data = await reader.readexactly(HANDSHAKE_LENGTH)
+    return parse_handshake(data)
+
+
+def build_message(msg_id, payload=b''):
+    """ Đóng gói một thông điệp có tiền tố độ dài """
+    return _LENGTH.pack(len(payload) + 1) + bytes([msg_id]) + payload
+
+
+def send_message(sock, msg_id, payload=b''):
+    """ Gửi một thông điệp có tiền tố độ dài """
+    sock.sendall(build_message(msg_id, payload))
+
+
+def read_message(sock):
+    """
+    Đọc một thông điệp từ socket.
+    Trả về (msg_id, payload); keep-alive trả về (None, b'').
+    """
+    length = _LENGTH.unpack(recv_exact(sock, 4))[0]
+    if length == 0:
+        return None, b''
+    if length > MAX_MESSAGE_LENGTH:
+        raise ProtocolError(f"Message too long: {length}")
+    data = recv_exact(sock, length)
+    return data[0], data[1:]
+
+
+async def read_message_async(reader):
+    """
+    Đọc một thông điệp từ asyncio.StreamReader.
+    Trả về (msg_id, payload); keep-alive trả về (None, b'').
+    """
+    length = _LENGTH.unpack(await reader.readexactly(4))[0]
+    if length == 0:
+        return None, b''
+    if length > MAX_MESSAGE_LENGTH:
+        raise ProtocolError(f"Message too long: {length}")
+    data = await reader.readexactly(length)
+    return data[0], data[1:]
+
+
+def pack_have(index):
+    """ Payload của HAVE: index của mảnh vừa có """
+    return _HAVE.pack(index)
+
+
+def unpack_have(payload):
+    """ Giải mã payload HAVE thành index """
+    if len(payload) != _HAVE.size:
+        raise ProtocolError("Malformed have")
+    return _HAVE.unpack(payload)[0]
+
+
+def pack_request(index, begin, length):
+    """ Payload của REQUEST/CANCEL: (index, begin, length) """
+    return _REQUEST.pack(index, begin, length)
+
+
+def unpack_request(payload):
+    """ Giải mã payload REQUEST/CANCEL thành (index, begin, length) """
+    if len(payload) != _REQUEST.size:
+        raise ProtocolError("Malformed request")
+    return _REQUEST.unpack(payload)
+
+
+def build_piece_header(index, begin, length):
+    """ Phần đầu của thông điệp PIECE (độ dài, id, index, begin); dữ liệu gửi ngay sau đó """
+    return _LENGTH.pack(1 + _PIECE_HEADER.size + length) + bytes([PIECE]) + _PIECE_HEADER.pack(index, begin)
+
+
+def unpack_piece(payload):
+    """ Giải mã payload PIECE thành (index, begin, data) """
+    if len(payload) < _PIECE_HEADER.size:
+        raise ProtocolError("Malformed piece")
+    index, begin = _PIECE_HEADER.unpack_from(payload)
+    return index, begin, payload[_PIECE_HEADER.size:]
+
+
+def normalize_address(host, port):
+    """ (IP dạng chuỗi, port) để cùng một peer có một key dù biết qua tên hay qua IP """
+    address = resolve_address(host)
+    return (str(address) if address is not None else host, int(port))
+
+
+def _compact(addresses):
+    return pack_compact_peers({'peer_host': host, 'peer_port': port} for host, port in addresses)
+
+
+def _addresses(data, ipv6=False):
+    return [(peer['peer_host'], peer['peer_port']) for peer in unpack_compact_peers(data, ipv6)]
+
+
+def pack_pex(added, dropped, port=None):
+    """
+    Payload của PEX.
+    added, dropped: Các (host, port) mới kết nối / đã ngắt từ lần gửi trước.
+    port: Port lắng nghe của peer gửi, để phía nhận quảng bá lại nó cho peer khác.
+    """
+    added4, added6 = _compact(added)
+    dropped4, dropped6 = _compact(dropped)
+    message = {'added': added4, 'added6': added6, 'dropped': dropped4, 'dropped6': dropped6}
+    if port is not None:
+        message['port'] = int(port)
+    return bencode(message)
+
+
+def unpack_pex(payload):
+    """ Giải mã payload PEX thành (added, dropped, port hoặc None) """
+    try:
+        message = bdecode(payload)
+        added = _addresses(message.get(b'added', b'')) + _addresses(message.get(b'added6', b''), ipv6=True)
+        dropped = _addresses(message.get(b'dropped', b'')) + _addresses(message.get(b'dropped6', b''), ipv6=True)
+        port = message.get(b'port')
+    except (DecodingError, AttributeError, TypeError, ValueError):
+        raise ProtocolError("Malformed pex")
+    if port is not None and not (isinstance(port, int) and 0 < port < 65536):
+        raise ProtocolError("Malformed pex port")
+    return added, dropped, port
+
+
+class PexState:
+    """ Các peer đã quảng bá trên một kết nối, để mỗi lần chỉ gửi phần thay đổi """
+
+    def __init__(self):
+        self.sent = set()
+        self.last = None
+
+    def due(self, now):
+        return self.last is None or now - self.last >= PEX_INTERVAL
+
+    def delta(self, current, now):
+        """ (added, dropped) so với lần gửi trước; current là tập peer đang kết nối """
+        added = list(current - self.sent)[:MAX_PEX_PEERS]
+        dropped = list(self.sent - current)
+        self.sent.difference_update(dropped)
+        self.sent.update(added)
+        self.last = now
+        return added, dropped
+
+
+def metadata_piece_count(size):
+    """ Số mảnh metadata của dict info dài size byte """
+    return max(1, -(-size // METADATA_PIECE_SIZE))
+
+
+def pack_metadata_request(piece):
+    """ Payload của METADATA_REQUEST/METADATA_REJECT: số thứ tự mảnh """
+    return _HAVE.pack(piece)
+
+
+def unpack_metadata_request(payload):
+    if len(payload) != _HAVE.size:
+        raise ProtocolError("Malformed metadata request")
+    return _HAVE.unpack(payload)[0]
+
+
+def pack_metadata_piece(metadata, piece):
+    """ Payload METADATA_PIECE chứa mảnh piece của metadata, hoặc None nếu không có mảnh này """
+    if piece >= metadata_piece_count(len(metadata)):
+        return None
+    start = piece * METADATA_PIECE_SIZE
+    return _METADATA_HEADER.pack(piece, len(metadata)) + metadata[start:start + METADATA_PIECE_SIZE]
+
+
+def unpack_metadata_piece(payload):
+    """ Giải mã payload METADATA_PIECE thành (số thứ tự, tổng kích thước, dữ liệu) """
+    if len(payload) < _METADATA_HEADER.size:
+        raise ProtocolError("Malformed metadata piece")
+    piece, size = _METADATA_HEADER.unpack_from(payload)
+    if size > MAX_METADATA_SIZE:
+        raise ProtocolError(f"Metadata too large: {size}")
+    return piece, size, payload[_METADATA_HEADER.size:]
+
+
+def verify_metadata(info_hash, metadata):
+    """
+    Kiểm tra metadata nhận từ peer hoặc tracker.
+    Trả về dict info đã giải mã nếu SHA-1 khớp info_hash (hex) và đủ các trường của torrent, ngược lại None.
+    """
+    if len(metadata) > MAX_METADATA_SIZE or hashlib.sha1(metadata).hexdigest() != info_hash:
+        return None
+    try:
+        info = bdecode(metadata)
+        if not all(isinstance(info[key], bytes) for key in (b'name', b'pieces')) \
+                or not all(isinstance(info[key], int) for key in (b'length', b'piece length')):
+            return None
+        name = info[b'name'].decode()
+    except (DecodingError, KeyError, TypeError, UnicodeDecodeError):
+        return None
+    # Kích thước phải tạo được TorrentStorage, và mỗi mảnh có đúng một hash SHA-1 (20 byte)
+    length, piece_length = info[b'length'], info[b'piece length']
+    if length < 0 or piece_length <= 0 \
+            or len(info[b'pieces']) != 20 * ((length + piece_length - 1) // piece_length):
+        return None
+    # Tên file được ghép vào thư mục của peer: không cho phép đường dẫn
+    if name in ('', '.', '..') or os.path.basename(name) != name or '\\' in name:
+        return None
+    return info
@@ -1,41 +1,279 @@
-def handle_register(message, addr, peers, sock):
+import ipaddress
+import os
+import socket
+import struct
+import time
+from functools import lru_cache
+
+# Danh sách peer dạng compact (BEP 23): mỗi peer IPv4 là 4 byte địa chỉ + 2 byte port,
+# mỗi peer IPv6 là 16 byte địa chỉ + 2 byte port.
+COMPACT_IPV4_LENGTH = 6
+COMPACT_IPV6_LENGTH = 18
+COMPACT_MIMETYPE = 'application/x-bittorrent'  # Phản hồi /peer_list dạng compact (bencode)
+
+_PORT = struct.Struct('>H')
+
+# Giao thức tracker UDP (BEP 15): connect lấy connection_id, sau đó announce/scrape,
+# mỗi yêu cầu kèm transaction_id để ghép với phản hồi.
+PROTOCOL_ID = 0x41727101980
+ACTION_CONNECT = 0
+ACTION_ANNOUNCE = 1
+ACTION_SCRAPE = 2
+ACTION_ERROR = 3
+
+# Mã event trong announce và tên tương ứng dùng trong SwarmStore
+EVENTS = {0: None, 1: 'completed', 2: 'started', 3: 'stopped'}
+EVENT_CODES = {name: code for code, name in EVENTS.items()}
+
+UDP_TIMEOUT = 2      # Timeout (giây) lần gửi đầu, gấp đôi sau mỗi lần thử lại
+UDP_RETRIES = 3      # Số lần gửi một yêu cầu UDP trước khi bỏ cuộc
+CONNECTION_ID_TTL = 60  # Thời gian (giây) client dùng lại một connection_id
+MAX_DATAGRAM = 2048
+
+_HEADER = struct.Struct('>QII')             # connection_id, action, transaction_id
+_RESPONSE_HEADER = struct.Struct('>II')     # action, transaction_id
+_CONNECT_RESPONSE = struct.Struct('>IIQ')   # action, transaction_id, connection_id
+_ANNOUNCE = struct.Struct('>QII20s20sQQQIIIiH')
+_ANNOUNCE_RESPONSE = struct.Struct('>IIIII')  # action, transaction_id, interval, leechers, seeders
+_SCRAPE_ENTRY = struct.Struct('>III')       # seeders, completed, leechers
+
+
+def lookup_address(host):
+    """ Địa chỉ IP (ipaddress) của host, phân giải tên mỗi lần gọi; None nếu không được """
+    try:
+        return ipaddress.ip_address(host)
+    except ValueError:
+        pass
+    try:
+        infos = socket.getaddrinfo(host, None)
+        # Ưu tiên IPv4 như khi peer kết nối bằng tên
+        info = next((info for info in infos if info[0] == socket.AF_INET), infos[0])
+        return ipaddress.ip_address(info[4][0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@lru_cache(maxsize=4096)
+def resolve_address(host):
+    """ Như lookup_address nhưng phân giải tên một lần rồi cache """
+    return lookup_address(host)
+
+
+def canonical_host(host):
     """
-    Xử lý thông điệp REGISTER từ peer.
-    message: Thông điệp từ peer (dạng chuỗi).
-    addr: Địa chỉ của peer gửi thông điệp.
-    peers: Dictionary lưu trữ danh sách peer đã đăng ký.
-    sock: Socket UDP để gửi phản hồi.
+    Dạng lưu trong swarm của host peer khai báo: chuỗi IP (IPv4 thay cho địa chỉ
+    IPv4-mapped), để 'localhost' qua HTTP và 127.0.0.1 qua UDP là cùng một peer.
+    Phân giải không cache, nên gọi ở đầu yêu cầu, ngoài mọi lock; giữ nguyên host
+    nếu không phân giải được.
     """
-    peer_id = message.split()[1]
-    peers[peer_id] = addr
-    print(f"Peer {peer_id} registered at {addr}")
-    sock.sendto("Registration successful".encode(), addr)
+    if not isinstance(host, str):
+        return host
+    address = lookup_address(host)
+    if address is None:
+        return host
+    return str(getattr(address, 'ipv4_mapped', None) or address)
 
 
-def handle_peer_list(addr, peers, sock):
+def pack_compact_peers(peers):
     """
-    Xử lý yêu cầu PEER_LIST từ peer.
-    addr: Địa chỉ của peer gửi yêu cầu.
-    peers: Dictionary lưu trữ danh sách peer đã đăng ký.
-    sock: Socket UDP để gửi danh sách.
+    Đóng gói danh sách peer thành (chuỗi IPv4, chuỗi IPv6) dạng compact.
+    peers: Các dict có 'peer_host' và 'peer_port'; peer không phân giải được bị bỏ qua.
     """
-    peer_list = "\n".join([f"{peer_id} {peer_addr}" for peer_id, peer_addr in peers.items()])
-    sock.sendto(peer_list.encode(), addr)
-    print(f"Sent peer list to {addr}")
+    peers4 = bytearray()
+    peers6 = bytearray()
+    for peer in peers:
+        address = resolve_address(peer['peer_host'])
+        if address is None:
+            continue
+        target = peers4 if address.version == 4 else peers6
+        target += address.packed + _PORT.pack(int(peer['peer_port']))
+    return bytes(peers4), bytes(peers6)
+
+
+def unpack_compact_peers(data, ipv6=False):
+    """ Giải mã chuỗi compact thành các dict peer (không có peer_id) """
+    size = COMPACT_IPV6_LENGTH if ipv6 else COMPACT_IPV4_LENGTH
+    peers = []
+    for offset in range(0, len(data) - size + 1, size):
+        host = str(ipaddress.ip_address(data[offset:offset + size - 2]))
+        port = _PORT.unpack_from(data, offset + size - 2)[0]
+        peers.append({'peer_id': None, 'peer_host': host, 'peer_port': port})
+    return peers
+
+
+class TrackerError(Exception):
+    """ Tracker UDP trả về lỗi hoặc không phản hồi """
+
+
+def unpack_request_header(data):
+    """ (connection_id, action, transaction_id) của một yêu cầu UDP """
+    if len(data) < _HEADER.size:
+        raise TrackerError("Packet too short")
+    return _HEADER.unpack_from(data)
+
+
+def pack_connect_request(transaction_id):
+    return _HEADER.pack(PROTOCOL_ID, ACTION_CONNECT, transaction_id)
+
+
+def pack_connect_response(transaction_id, connection_id):
+    return _CONNECT_RESPONSE.pack(ACTION_CONNECT, transaction_id, connection_id)
+
+
+def unpack_connect_response(data):
+    """ connection_id trong phản hồi connect """
+    if len(data) < _CONNECT_RESPONSE.size:
+        raise TrackerError("Malformed connect response")
+    return _CONNECT_RESPONSE.unpack_from(data)[2]
+
 
+def pack_announce_request(connection_id, transaction_id, info_hash, peer_id, port,
+                          left, downloaded=0, uploaded=0, event=None, numwant=-1, key=0):
+    """ Yêu cầu announce; info_hash dạng hex, event theo tên trong EVENTS """
+    return _ANNOUNCE.pack(connection_id, ACTION_ANNOUNCE, transaction_id,
+                          bytes.fromhex(info_hash), str(peer_id).encode()[:20].ljust(20, b'\0'),
+                          downloaded, left, uploaded, EVENT_CODES[event], 0, key, numwant, port)
 
-def process_message(message, addr, peers, sock):
+
+def unpack_announce_request(data):
+    """ Giải mã announce thành dict (info_hash hex, peer_id chuỗi, event theo tên, ...) """
+    if len(data) < _ANNOUNCE.size:
+        raise TrackerError("Malformed announce")
+    (_, _, _, info_hash, peer_id, downloaded, left, uploaded,
+     event, ip, key, numwant, port) = _ANNOUNCE.unpack_from(data)
+    if event not in EVENTS:
+        raise TrackerError("Unknown event")
+    return {
+        'info_hash': info_hash.hex(),
+        'peer_id': peer_id.rstrip(b'\0').decode(errors='replace'),
+        'downloaded': downloaded,
+        'left': left,
+        'uploaded': uploaded,
+        'event': EVENTS[event],
+        'ip': ip,
+        'key': key,
+        'numwant': numwant,
+        'port': port,
+    }
+
+
+def pack_announce_response(transaction_id, interval, leechers, seeders, compact_peers):
+    return _ANNOUNCE_RESPONSE.pack(ACTION_ANNOUNCE, transaction_id, interval, leechers, seeders) + compact_peers
+
+
+def unpack_announce_response(data, ipv6=False):
+    """ Giải mã phản hồi announce thành (interval, leechers, seeders, peers) """
+    if len(data) < _ANNOUNCE_RESPONSE.size:
+        raise TrackerError("Malformed announce response")
+    _, _, interval, leechers, seeders = _ANNOUNCE_RESPONSE.unpack_from(data)
+    return interval, leechers, seeders, unpack_compact_peers(data[_ANNOUNCE_RESPONSE.size:], ipv6)
+
+
+def pack_scrape_request(connection_id, transaction_id, info_hashes):
+    return _HEADER.pack(connection_id, ACTION_SCRAPE, transaction_id) + b''.join(
+        bytes.fromhex(info_hash) for info_hash in info_hashes)
+
+
+def unpack_scrape_request(data):
+    """ Danh sách info_hash (hex) trong yêu cầu scrape """
+    body = data[_HEADER.size:]
+    return [body[offset:offset + 20].hex() for offset in range(0, len(body) - 19, 20)]
+
+
+def pack_scrape_response(transaction_id, counts):
+    """ counts: các (seeders, completed, leechers) theo thứ tự info_hash đã hỏi """
+    return _RESPONSE_HEADER.pack(ACTION_SCRAPE, transaction_id) + b''.join(
+        _SCRAPE_ENTRY.pack(*entry) for entry in counts)
+
+
+def unpack_scrape_response(data):
+    body = data[_RESPONSE_HEADER.size:]
+    return [_SCRAPE_ENTRY.unpack_from(body, offset)
+            for offset in range(0, len(body) - _SCRAPE_ENTRY.size + 1, _SCRAPE_ENTRY.size)]
+
+
+def pack_error(transaction_id, message):
+    return _RESPONSE_HEADER.pack(ACTION_ERROR, transaction_id) + message.encode()
+
+
+class UDPTrackerClient:
     """
-    Xử lý các loại thông điệp từ peer.
-    message: Thông điệp từ peer.
-    addr: Địa chỉ của peer gửi thông điệp.
-    peers: Dictionary lưu trữ danh sách peer đã đăng ký.
-    sock: Socket UDP để gửi phản hồi.
+    Client tracker UDP (BEP 15): một datagram cho mỗi announce/scrape, connection_id
+    được dùng lại trong CONNECTION_ID_TTL giây. Không an toàn khi dùng từ nhiều luồng.
     """
-    if message.startswith("REGISTER"):
-        handle_register(message, addr, peers, sock)
-    elif message == "PEER_LIST":
-        handle_peer_list(addr, peers, sock)
-    else:
-        print(f"Unknown message from {addr}: {message}")
-        sock.sendto("Unknown command".encode(), addr)
+
+    def __init__(self, host, port, timeout=UDP_TIMEOUT, retries=UDP_RETRIES):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.retries = retries
+        self.connection_id = None
+        self.connection_time = 0
+        self.sock = None
+        self.ipv6 = False
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _socket(self):
+        if self.sock is None:
+            family, _, _, _, address = socket.getaddrinfo(*self.address, type=socket.SOCK_DGRAM)[0]
+            self.sock = socket.socket(family, socket.SOCK_DGRAM)
+            self.sock.connect(address)
+            self.ipv6 = family == socket.AF_INET6
+        return self.sock
+
+    def _request(self, build, expected_action):
+        """ Gửi yêu cầu (build nhận transaction_id), thử lại với timeout tăng dần """
+        sock = self._socket()
+        for attempt in range(self.retries):
+            transaction_id = int.from_bytes(os.urandom(4), 'big')
+            sock.send(build(transaction_id))
+            deadline = time.monotonic() + self.timeout * 2 ** attempt
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                sock.settimeout(remaining)
+                try:
+                    data = sock.recv(MAX_DATAGRAM)
+                except socket.timeout:
+                    break
+                if len(data) < _RESPONSE_HEADER.size:
+                    continue
+                action, response_id = _RESPONSE_HEADER.unpack_from(data)
+                if response_id != transaction_id:
+                    continue  # Phản hồi muộn của lần gửi trước
+                if action == ACTION_ERROR:
+                    raise TrackerError(data[_RESPONSE_HEADER.size:].decode(errors='replace'))
+                if action != expected_action:
+                    raise TrackerError(f"Unexpected action {action}")
+                return data
+        raise TrackerError(f"No response from UDP tracker {self.address[0]}:{self.address[1]}")
+
+    def connect(self):
+        """ connection_id hợp lệ, xin mới nếu đã hết hạn """
+        if self.connection_id is None or time.monotonic() - self.connection_time > CONNECTION_ID_TTL:
+            data = self._request(pack_connect_request, ACTION_CONNECT)
+            self.connection_id = unpack_connect_response(data)
+            self.connection_time = time.monotonic()
+        return self.connection_id
+
+    def announce(self, info_hash, peer_id, port, left, event=None, numwant=-1, downloaded=0, uploaded=0):
+        """ Announce một torrent; trả về (interval, leechers, seeders, peers) """
+        connection_id = self.connect()
+        data = self._request(
+            lambda transaction_id: pack_announce_request(
+                connection_id, transaction_id, info_hash, peer_id, port, left,
+                downloaded, uploaded, event, numwant),
+            ACTION_ANNOUNCE)
+        return unpack_announce_response(data, self.ipv6)
+
+    def scrape(self, info_hashes):
+        """ Các (seeders, completed, leechers) theo thứ tự info_hashes """
+        connection_id = self.connect()
+        data = self._request(
+            lambda transaction_id: pack_scrape_request(connection_id, transaction_id, info_hashes),
+            ACTION_SCRAPE)
+        return unpack_scrape_response(data)
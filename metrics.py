@@ -0,0 +1,171 @@
+import bisect
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from time import perf_counter
+
+# Giới hạn trên (giây) của các bucket histogram
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+LOCK_BUCKETS = (0.000001, 0.000005, 0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+LOG_QUEUE_SIZE = 10000  # Số dòng log tối đa chờ ghi; vượt quá thì bỏ bớt thay vì chặn request
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class Histogram:
+    """ Histogram kiểu Prometheus: đếm theo bucket, cộng dồn khi xuất """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Phần tử cuối là bucket +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """ (các số đếm cộng dồn theo bucket, tổng, số lần đo) """
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total, running
+
+
+class TimedLock:
+    """ threading.Lock ghi lại thời gian chờ lấy lock và thời gian giữ lock vào hai histogram """
+
+    __slots__ = ('lock', 'wait', 'hold', 'acquired_at')
+
+    def __init__(self, wait, hold):
+        self.lock = threading.Lock()
+        self.wait = wait
+        self.hold = hold
+        self.acquired_at = 0.0
+
+    def __enter__(self):
+        start = perf_counter()
+        self.lock.acquire()
+        # Chỉ luồng đang giữ lock ghi acquired_at
+        self.acquired_at = now = perf_counter()
+        self.wait.observe(now - start)
+        return self
+
+    def __exit__(self, *exc):
+        held = perf_counter() - self.acquired_at
+        self.lock.release()
+        self.hold.observe(held)
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels)
+
+
+class Metrics:
+    """
+    Số liệu của tracker xuất theo định dạng text của Prometheus: số request và
+    histogram độ trễ theo route, thời gian chờ/giữ lock trạng thái, và các gauge
+    (số swarm, peer, seeder, leecher) tính lúc scrape từ store.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}      # (route, method, status) -> số request
+        self.latency = {}       # route -> Histogram
+        self.lock_wait = {}     # tên lock -> Histogram
+        self.lock_hold = {}
+        self.store = None
+
+    def observe_request(self, route, method, status, seconds):
+        key = (route, method, status)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get(route)
+            if histogram is None:
+                histogram = self.latency[route] = Histogram()
+        histogram.observe(seconds)
+
+    def lock_factory(self, name):
+        """ Tạo TimedLock ghi vào histogram của nhóm lock name (ví dụ 'shard') """
+        with self.lock:
+            if name not in self.lock_wait:
+                self.lock_wait[name] = Histogram(LOCK_BUCKETS)
+                self.lock_hold[name] = Histogram(LOCK_BUCKETS)
+            return TimedLock(self.lock_wait[name], self.lock_hold[name])
+
+    def render(self):
+        """ Toàn bộ số liệu dạng text exposition format 0.0.4 """
+        lines = []
+        with self.lock:
+            requests = sorted(self.requests.items())
+            latency = sorted(self.latency.items())
+            locks = sorted(self.lock_wait)
+
+        lines.append('# HELP tracker_requests_total HTTP requests handled, by route, method and status.')
+        lines.append('# TYPE tracker_requests_total counter')
+        for (route, method, status), count in requests:
+            labels = format_labels((('route', route), ('method', method), ('status', status)))
+            lines.append(f'tracker_requests_total{{{labels}}} {count}')
+
+        lines.append('# HELP tracker_request_duration_seconds Time spent handling HTTP requests, by route.')
+        lines.append('# TYPE tracker_request_duration_seconds histogram')
+        for route, histogram in latency:
+            self.render_histogram(lines, 'tracker_request_duration_seconds', (('route', route),), histogram)
+
+        for name, metric, help_text in (
+                ('wait', self.lock_wait, 'Time spent waiting to acquire tracker state locks.'),
+                ('hold', self.lock_hold, 'Time tracker state locks were held.')):
+            lines.append(f'# HELP tracker_lock_{name}_seconds {help_text}')
+            lines.append(f'# TYPE tracker_lock_{name}_seconds histogram')
+            for lock in locks:
+                self.render_histogram(lines, f'tracker_lock_{name}_seconds', (('lock', lock),), metric[lock])
+
+        if self.store is not None:
+            for name, value in self.store.stats().items():
+                lines.append(f'# TYPE tracker_{name} gauge')
+                lines.append(f'tracker_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def render_histogram(lines, name, labels, histogram):
+        cumulative, total, count = histogram.snapshot()
+        for bound, value in zip(histogram.buckets + ('+Inf',), cumulative):
+            lines.append(f'{name}_bucket{{{format_labels(labels + (("le", bound),))}}} {value}')
+        lines.append(f'{name}_sum{{{format_labels(labels)}}} {total}')
+        lines.append(f'{name}_count{{{format_labels(labels)}}} {count}')
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """ Đưa log vào hàng đợi; khi hàng đợi đầy thì bỏ dòng log thay vì chặn luồng xử lý request """
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def setup_logging(level='INFO', stream=None):
+    """
+    Log có mức, ghi ở luồng nền: các handler chỉ đưa bản ghi vào hàng đợi, một
+    QueueListener ghi ra stream. Trả về listener (gọi stop() để ghi nốt khi thoát).
+    """
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, output)
+    root = logging.getLogger()
+    root.handlers[:] = [DroppingQueueHandler(log_queue)]
+    root.setLevel(level)
+    # Log truy cập của werkzeug ghi mỗi request một dòng; chỉ giữ khi đang debug
+    logging.getLogger('werkzeug').setLevel(logging.DEBUG if root.level <= logging.DEBUG else logging.WARNING)
+    listener.start()
+    return listener
@@ -3,27 +3,134 @@ import random
 import argparse
 import hashlib
 import os
-import time
+import base64
 from tqdm import tqdm
 from threading import Thread
 import threading
-import socket
+import time
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from bencodepy import encode as bencode, decode as bdecode
+from downloader import TorrentDownload, fetch_metadata
+from tracker_client import TrackerClient
+from cluster import HashRing
+from dht import DHTNode
+from storage import (
+    Bitfield, FileHandlePool, PieceCache, PIECE_CACHE_SIZE, SENDFILE_SUPPORTED,
+    choose_piece_length, hash_file_pieces, read_file_range, read_resume, send_direct, write_resume,
+)
+from message.tracker2peer import COMPACT_MIMETYPE, TrackerError, UDPTrackerClient, unpack_compact_peers
+from message.peer2peer import (
+    HAVE, BITFIELD, REQUEST, CANCEL, PEX, METADATA_REQUEST, METADATA_PIECE, METADATA_REJECT,
+    ProtocolError, PexState, build_handshake, build_message, read_handshake_async, read_message_async,
+    pack_have, unpack_request, build_piece_header, pack_pex, unpack_pex, normalize_address,
+    pack_metadata_request, unpack_metadata_request, pack_metadata_piece, verify_metadata,
+)
 
-files = []
+MAX_IN_FLIGHT = 32      # Số yêu cầu block tối đa đang chờ trên mỗi kết nối
+MAX_REQUEST_LENGTH = 128 * 1024  # Độ dài tối đa của một yêu cầu block
+HAVE_POLL_INTERVAL = 0.5  # Chu kỳ (giây) kiểm tra mảnh mới để gửi HAVE
+SEED_MAX_CONNECTIONS = 4096  # Số kết nối tối đa server seeding phục vụ cùng lúc
+SEED_BACKLOG = 1024   # Hàng đợi accept của server seeding
+DISK_WORKERS = 4      # Số luồng đọc đĩa cho server seeding
+MAX_PENDING_REQUESTS = 256  # Số yêu cầu tối đa một leecher được xếp hàng
+READ_AHEAD_PIECES = 2 # Số mảnh đọc trước vào cache sau mỗi lần miss
+ANNOUNCE_INTERVAL = 30  # Chu kỳ (giây) announce lại cho tới khi tracker trả về interval
+NUMWANT = 50          # Số peer tối đa xin tracker mỗi lần lấy danh sách
+METADATA_PEERS = 5    # Số peer thử xin metadata trước khi hỏi tracker
+CLUSTER_VERSION_HEADER = 'X-Cluster-Version'  # Tracker trong cluster gửi kèm version danh sách thành viên
 
 class Peer:
-    def __init__(self, peer_id, tracker_host, peer_host, tracker_port=8000):
+    def __init__(self, peer_id, tracker_host, peer_host, tracker_port=8000, max_in_flight=MAX_IN_FLIGHT,
+                 max_seed_connections=SEED_MAX_CONNECTIONS, seed_backlog=SEED_BACKLOG,
+                 piece_cache_size=PIECE_CACHE_SIZE, numwant=NUMWANT, compact_peer_list=True,
+                 tracker_udp_port=None, dht_port=None, dht_bootstrap=()):
         self.peer_id = peer_id
         self.tracker_host = tracker_host
         self.tracker_port = tracker_port
         self.peer_host = peer_host
         self.peer_port = random.randint(10000, 20000)
         self.files = []  # Danh sách file mà peer đang quản lý
-        self.shared_pieces = {}
+        self.max_in_flight = max_in_flight
+        self.seeder_thread = None
+        self.file_pool = FileHandlePool()
+        self.max_seed_connections = max_seed_connections
+        self.seed_backlog = seed_backlog
+        self.seed_connections = 0
+        self.disk_executor = None
+        self.piece_cache = PieceCache(piece_cache_size)
+        self.piece_loads = {}
+        self.seeder_lock = threading.Lock()
+        self.uploaded_bytes = 0  # Tổng số byte đã phục vụ cho peer khác (chỉ event loop seeding ghi)
+        # PEX: các peer đang kết nối theo info_hash ((host, port) lắng nghe -> số kết nối)
+        self.pex_lock = threading.Lock()
+        self.pex_connected = {}
+        self.downloads = {}  # info_hash -> TorrentDownload đang chạy, nhận peer mới qua PEX
+        self.connected = False
+        self.announce_interval = ANNOUNCE_INTERVAL
+        self.announcer_thread = None
+        self.numwant = numwant
+        self.compact_peer_list = compact_peer_list
+        # Announce qua tracker UDP (BEP 15) nếu có, HTTP chỉ dùng khi UDP lỗi
+        self.udp_tracker = UDPTrackerClient(tracker_host, tracker_udp_port) if tracker_udp_port else None
+        self.udp_lock = threading.Lock()
+        # Khi tracker chạy dạng cluster: gửi thẳng yêu cầu tới tracker sở hữu info_hash
+        self.tracker_ring = None
+        self.cluster_version = None
+        # Session keep-alive, hàng đợi thông báo và cache danh sách peer dùng chung
+        self.tracker_client = TrackerClient()
+        # DHT (tùy chọn): tìm peer không cần tracker khi tracker lỗi hoặc không biết peer nào
+        self.dht = None
+        if dht_port is not None:
+            self.dht = DHTNode(peer_host, dht_port).start()
+            print(f"DHT node listening on port {self.dht.address[1]}")
+            Thread(target=self.dht.bootstrap, args=(dht_bootstrap,), daemon=True).start()
+
+    def pex_add(self, info_hash, address):
+        """ Ghi nhận một kết nối tới peer (địa chỉ lắng nghe) của torrent để quảng bá qua PEX """
+        address = normalize_address(*address)
+        with self.pex_lock:
+            peers = self.pex_connected.setdefault(info_hash, {})
+            peers[address] = peers.get(address, 0) + 1
+
+    def pex_remove(self, info_hash, address):
+        address = normalize_address(*address)
+        with self.pex_lock:
+            peers = self.pex_connected.get(info_hash)
+            if peers is None or address not in peers:
+                return
+            peers[address] -= 1
+            if peers[address] == 0:
+                del peers[address]
+                if not peers:
+                    del self.pex_connected[info_hash]
+
+    def pex_peers(self, info_hash):
+        """ Tập địa chỉ các peer đang kết nối của torrent """
+        with self.pex_lock:
+            return set(self.pex_connected.get(info_hash, ()))
+
+    def dht_announce(self, info_hash):
+        """ Announce torrent vào DHT ở luồng nền (không làm gì nếu không bật DHT) """
+        if self.dht is not None:
+            Thread(target=self.dht.announce_peer, args=(bytes.fromhex(info_hash), self.peer_port),
+                   daemon=True).start()
+
+    def dht_peer_list(self, info_hash):
+        """ Danh sách peer của torrent tìm trong DHT, cùng dạng với danh sách từ tracker """
+        addresses = self.dht.get_peers(bytes.fromhex(info_hash))
+        print(f"Peers found in the DHT: {len(addresses)}")
+        return [{'peer_id': None, 'peer_host': host, 'peer_port': port} for host, port in addresses]
+
+    def upload_metadata(self, entry):
+        """ Gửi metadata của torrent lên tracker (xếp hàng, không chờ) để peer khác tải được chỉ với info_hash """
+        base_url = self.cluster_owner(entry['info_hash']) or self.tracker_base_url()
+        data = {'info_hash': entry['info_hash'], 'metadata': base64.b64encode(entry['metadata']).decode()}
+        self.tracker_client.notify(('metadata', entry['info_hash']), f'{base_url}/metadata', data)
 
     def notify_tracker_seeding(self, file_name, flag):
-        """ Thông báo tracker rằng peer đang seeding """
+        """ Thông báo tracker rằng peer đang seeding (xếp hàng, không chờ) """
         url = f'http://{self.tracker_host}:{self.tracker_port}/seeding'
         data = {
             'peer_host': self.peer_host,
@@ -32,10 +139,11 @@ class Peer:
             'filename': file_name,
             'flag':flag
         }
-        requests.post(url, json=data)
+        # Không chặn: gửi ở luồng nền, gộp với các thông báo cùng file
+        self.tracker_client.notify(('seeding', file_name), url, data)
 
     def notify_tracker_downloading(self, file_name, flag):
-        """ Thông báo tracker rằng peer đang leeching """
+        """ Thông báo tracker rằng peer đang leeching (xếp hàng, không chờ) """
         url = f'http://{self.tracker_host}:{self.tracker_port}/leeching'
         data = {
             'peer_host': self.peer_host,
@@ -44,7 +152,8 @@ class Peer:
             'filename': file_name,
             'flag':flag
         }
-        requests.post(url, json=data)
+        # Không chặn: gửi ở luồng nền, gộp với các thông báo cùng file
+        self.tracker_client.notify(('leeching', file_name), url, data)
         
     def connect_to_tracker(self):
         """ Đăng ký peer với tracker """
@@ -54,8 +163,13 @@ class Peer:
             'peer_host': self.peer_host,
             'peer_port': self.peer_port
         }
-        response = requests.post(url, json=data)
+        response = self.tracker_client.post(url, json=data)
         self.print_response(response)
+        self.update_interval(response)
+        self.connected = response.ok
+        # Tracker có thể vừa khởi động lại: gửi lại mọi trạng thái ở lần thông báo sau
+        self.tracker_client.reset()
+        self.start_announcer()
 
     def disconnect_from_tracker(self):
         """ Ngắt kết nối peer với tracker """
@@ -65,8 +179,147 @@ class Peer:
             'peer_host': self.peer_host,
             'peer_port': self.peer_port
         }
-        response = requests.post(url, json=data)
+        self.tracker_client.flush()
+        response = self.tracker_client.post(url, json=data)
         self.print_response(response)
+        if response.ok:
+            self.connected = False
+            self.tracker_client.reset()
+
+    def update_interval(self, response):
+        """ Ghi nhận chu kỳ announce tracker trả về """
+        try:
+            interval = response.json().get('interval')
+        except ValueError:
+            return
+        if interval:
+            self.announce_interval = max(1, int(interval))
+
+    def reannounce(self):
+        """ Announce lại peer và các file đang chia sẻ để tracker không xóa khi hết TTL """
+        base_url = f'http://{self.tracker_host}:{self.tracker_port}'
+        address = {
+            'peer_id': self.peer_id,
+            'peer_host': self.peer_host,
+            'peer_port': self.peer_port
+        }
+        try:
+            if self.connected:
+                self.update_interval(self.tracker_client.post(f'{base_url}/connect', json=address))
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to re-announce to tracker: {e}")
+        entries = list(self.files)
+        if self.udp_tracker is not None:
+            entries = [entry for entry in entries if self.udp_announce(entry) is None]
+        if entries:
+            # Gửi kèm filename nên tracker vừa khởi động lại cũng đăng ký lại được torrent
+            self.announce_files(entries)
+
+    def tracker_base_url(self):
+        return f'http://{self.tracker_host}:{self.tracker_port}'
+
+    def refresh_cluster(self):
+        """ Lấy danh sách tracker trong cluster; tracker đơn lẻ trả về 404 và mọi yêu cầu đi tới nó """
+        try:
+            response = self.tracker_client.get(f'{self.tracker_base_url()}/cluster')
+            data = response.json() if response.ok else None
+        except (requests.exceptions.RequestException, ValueError):
+            data = None
+        if data and data.get('members'):
+            self.tracker_ring = HashRing(data['members'])
+            self.cluster_version = str(data.get('version'))
+        else:
+            self.tracker_ring = None
+            self.cluster_version = ''
+
+    def check_cluster_version(self, response):
+        """ Cập nhật danh sách tracker khi cluster đã đổi thành viên """
+        version = response.headers.get(CLUSTER_VERSION_HEADER)
+        if version is not None and version != self.cluster_version:
+            self.refresh_cluster()
+
+    def cluster_owner(self, info_hash):
+        """ URL gốc của tracker sở hữu info_hash trong cluster, hoặc None nếu chỉ có một tracker """
+        if self.cluster_version is None:
+            self.refresh_cluster()
+        ring = self.tracker_ring
+        return ring.owner(info_hash) if ring is not None else None
+
+    def announce_files(self, entries, event=None):
+        """
+        Announce nhiều file đang chia sẻ, mỗi tracker sở hữu một yêu cầu /announce.
+        Trả về phản hồi của tracker (yêu cầu cuối cùng), hoặc None nếu không kết nối được.
+        """
+        by_tracker = {}
+        for entry in entries:
+            base_url = self.cluster_owner(entry['info_hash']) or self.tracker_base_url()
+            by_tracker.setdefault(base_url, []).append(entry)
+        result = None
+        for base_url, tracker_entries in by_tracker.items():
+            response = self.announce_to(base_url, tracker_entries, event)
+            if response is None and base_url != self.tracker_base_url():
+                # Tracker sở hữu không trả lời: gửi qua tracker đã cấu hình, nó sẽ chuyển tiếp
+                self.refresh_cluster()
+                response = self.announce_to(self.tracker_base_url(), tracker_entries, event)
+            result = response or result
+        return result
+
+    def announce_to(self, base_url, entries, event=None):
+        """ Gửi một yêu cầu /announce tới tracker base_url """
+        url = f'{base_url}/announce'
+        data = {
+            'peer_id': self.peer_id,
+            'peer_host': self.peer_host,
+            'peer_port': self.peer_port,
+            'entries': [
+                {
+                    'info_hash': entry['info_hash'],
+                    'filename': entry['filename'],
+                    'left': bytes_left(entry),
+                    'event': event,
+                }
+                for entry in entries
+            ],
+        }
+        try:
+            response = self.tracker_client.post(url, json=data)
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to announce to tracker: {e}")
+            return None
+        self.update_interval(response)
+        self.check_cluster_version(response)
+        return response
+
+    def announce_change(self, entry, event):
+        """ Báo tracker một thay đổi của file: qua UDP nếu có, ngược lại qua /announce """
+        if self.udp_tracker is not None and self.udp_announce(entry, event) is not None:
+            return
+        self.announce_files([entry], event)
+
+    def udp_announce(self, entry, event=None):
+        """ Announce một file qua tracker UDP; trả về danh sách peer hoặc None nếu lỗi """
+        try:
+            with self.udp_lock:
+                interval, _, _, peers = self.udp_tracker.announce(
+                    entry['info_hash'], self.peer_id, self.peer_port, bytes_left(entry), event, self.numwant)
+        except (TrackerError, OSError) as e:
+            print(f"UDP announce failed: {e}")
+            return None
+        self.announce_interval = max(1, interval)
+        return peers
+
+    def announce_loop(self):
+        """ Announce lại theo chu kỳ tracker yêu cầu """
+        while True:
+            time.sleep(self.announce_interval)
+            self.reannounce()
+
+    def start_announcer(self):
+        """ Chạy luồng announce định kỳ nếu chưa chạy """
+        with self.seeder_lock:
+            if self.announcer_thread is None:
+                self.announcer_thread = Thread(target=self.announce_loop, daemon=True)
+                self.announcer_thread.start()
 
     def print_response(self, response):
         """ In thông tin phản hồi từ tracker """
@@ -86,20 +339,14 @@ class Peer:
             print("File not found in the directory to create a torrent file!")
             return
 
-        piece_length = 256 * 1024  # 256 KB per piece
         file_size = os.path.getsize(full_output_path)
+        piece_length = choose_piece_length(file_size)
         num_pieces = (file_size + piece_length - 1) // piece_length  # Tính số lượng phần
 
-        # SHA1 hash mỗi phần của file
-        pieces = b''
-        
+        # SHA1 hash mỗi phần của file, song song trên nhiều luồng
         progress_bar = tqdm(total=num_pieces, unit='piece', desc='Creating torrent', leave=True)
         try:
-            with open(full_output_path, 'rb') as file:
-                for _ in range(num_pieces):
-                    piece = file.read(piece_length)
-                    pieces += hashlib.sha1(piece).digest()
-                    progress_bar.update(1)
+            pieces = hash_file_pieces(full_output_path, piece_length, progress_bar.update)
         finally:
             progress_bar.close()
 
@@ -150,92 +397,440 @@ class Peer:
             print(f"Error reading torrent file: {e}")
             return
         
-        files.append({'filename': filename, 'pieces': metadata[b'info'][b'pieces']})
-        headers = {'Content-Type': 'application/json'}
-        data = {
-            'command': 'upload info',
-            'peer_host': self.peer_host,
-            'peer_port': self.peer_port,
-            'peer_id': self.peer_id,
-            'filename': filename,
-            'info_hash': hashlib.sha1(bencoded_info).hexdigest()
-        }
+        info_hash = hashlib.sha1(bencoded_info).hexdigest()
+        info = metadata[b'info']
+        entry = shared_file_entry(filename, info_hash, info, Bitfield.full(len(info[b'pieces']) // 20))
+        self.register_shared_file(entry)
+        # File vừa được hash khi tạo torrent; lưu resume để lần khởi động sau chia sẻ lại ngay
+        write_resume(full_output_path, info_hash, entry['have'])
+        self.dht_announce(info_hash)
+        self.upload_metadata(entry)
+        print(f"Info hash of {filename}: {info_hash}")
 
-        tracker_url = f'http://{self.tracker_host}:{self.tracker_port}/info_hash'
-        try:
-            response = requests.post(tracker_url, json=data, headers=headers)
-            self.print_response(response)
-        except Exception as e:
-            print(f"Failed to connect to tracker: {e}")
+        response = self.announce_files([entry], 'started')
+        if response is None:
+            return
+        self.print_response(response)
+        self.start_announcer()
+
+    def load_shared_files(self):
+        """
+        Khi khởi động: chia sẻ lại các file đã đủ mảnh trong thư mục của peer, xác
+        nhận bằng file resume (không hash lại), rồi announce tất cả trong một yêu cầu.
+        """
+        dir = f"peer_{self.peer_id}"
+        if not os.path.isdir(dir):
+            return 0
+        entries = []
+        for name in sorted(os.listdir(dir)):
+            if not name.endswith('.torrent'):
+                continue
+            try:
+                with open(os.path.join(dir, name), 'rb') as file:
+                    info = bdecode(file.read())[b'info']
+                info_hash = hashlib.sha1(bencode(info)).hexdigest()
+                filename = info[b'name'].decode()
+            except Exception as e:
+                print(f"Skipping torrent file {name}: {e}")
+                continue
+            have = read_resume(os.path.join(dir, filename), info_hash, len(info[b'pieces']) // 20)
+            if have is None or not have.complete():
+                continue
+            entry = shared_file_entry(filename, info_hash, info, have)
+            self.register_shared_file(entry)
+            entries.append(entry)
+        if entries:
+            print(f"Sharing {len(entries)} files found in {dir}")
+            self.start_seeder_in_background()
+            for entry in entries:
+                self.dht_announce(entry['info_hash'])
+                self.upload_metadata(entry)
+            self.announce_files(entries, 'started')
+            self.start_announcer()
+        return len(entries)
 
-    def send_file_piece(self, client_socket, file_name, piece_index, piece_size, file_pieces):
+    def find_shared_file(self, info_hash):
+        """Tìm file đang chia sẻ theo info_hash"""
+        for file in self.files:
+            if file.get('info_hash') == info_hash:
+                return file
+        return None
+
+    async def send_file_piece(self, writer, file_entry, piece_index, begin, length):
         """Gửi một mảnh dữ liệu cho client"""
-        offset = piece_index * piece_size
-        if piece_index < len(file_pieces):
-            dir = f"peer_{self.peer_id}"
-            full_output_path = os.path.join(dir, file_name)
-            with open(full_output_path, 'rb') as file:
-                file.seek(offset)
-                piece_data = file.read(piece_size)
-                if piece_data:
-                    client_socket.sendall(piece_data)
+        if piece_index not in file_entry['have']:
+            print(f"Piece index {piece_index} is not available.")
+            return False
+
+        piece_length = file_entry['piece_length']
+        piece_size = min(piece_length, file_entry['length'] - piece_index * piece_length)
+        if length > MAX_REQUEST_LENGTH or begin + length > piece_size:
+            print(f"Invalid request for piece {piece_index}: begin={begin}, length={length}")
+            return False
+
+        loop = asyncio.get_running_loop()
+        dir = f"peer_{self.peer_id}"
+        full_output_path = os.path.join(dir, file_entry['filename'])
+        offset = piece_index * piece_length + begin
+        header = build_piece_header(piece_index, begin, length)
+
+        if self.piece_cache.max_bytes:
+            # Mảnh nóng được phục vụ từ bộ nhớ. Miss của mảnh đã được tải nhiều lần thì đọc cả mảnh
+            # vào cache và đọc trước vài mảnh kế tiếp; mảnh mới tải lần đầu vẫn gửi bằng sendfile bên dưới
+            key = (file_entry['info_hash'], piece_index)
+            piece = self.piece_cache.get(key)
+            if piece is None and (not SENDFILE_SUPPORTED or self.piece_cache.admit(key, begin == 0)):
+                piece = await self.load_piece(file_entry, full_output_path, piece_index)
+                self.read_ahead(file_entry, full_output_path, piece_index)
+            if piece is not None:
+                writer.write(header)
+                writer.write(memoryview(piece)[begin:begin + length])
+                await writer.drain()
+                return True
+
+        entry = self.file_pool.try_acquire(full_output_path)
+        if entry is None:
+            # Mở file (có thể chặn) trên executor đọc đĩa, không chặn event loop
+            entry = await loop.run_in_executor(self.disk_executor, self.file_pool.acquire, full_output_path)
+        try:
+            sent = 0
+            if SENDFILE_SUPPORTED and writer.transport.get_write_buffer_size() == 0:
+                sent = send_direct(writer, header, entry[0], offset, length)
+            if sent < len(header) + length:
+                # Phần còn lại: đọc trên executor rồi đưa vào buffer của transport
+                if sent < len(header):
+                    writer.write(header[sent:])
+                    sent = len(header)
+                done = sent - len(header)
+                data = await loop.run_in_executor(
+                    self.disk_executor, read_file_range, entry[0], offset + done, length - done)
+                writer.write(data)
+                await writer.drain()
+        finally:
+            self.file_pool.release(full_output_path, entry)
+        return True
+
+    def read_piece_into_cache(self, key, path, offset, size):
+        """Đọc cả mảnh từ đĩa (chạy trên executor) và lưu vào cache"""
+        with self.file_pool.open(path) as file:
+            data = read_file_range(file, offset, size)
+        self.piece_cache.put(key, data)
+        return data
+
+    def start_piece_load(self, file_entry, path, piece_index):
+        """Bắt đầu đọc mảnh vào cache; các yêu cầu đồng thời cho cùng mảnh dùng chung một lần đọc"""
+        key = (file_entry['info_hash'], piece_index)
+        future = self.piece_loads.get(key)
+        if future is None:
+            piece_length = file_entry['piece_length']
+            offset = piece_index * piece_length
+            size = min(piece_length, file_entry['length'] - offset)
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.disk_executor, self.read_piece_into_cache, key, path, offset, size)
+            self.piece_loads[key] = future
+
+            def finished(future):
+                self.piece_loads.pop(key, None)
+                if not future.cancelled() and future.exception() is not None:
+                    print(f"Failed to read piece {piece_index} of {file_entry['filename']}: {future.exception()}")
+            future.add_done_callback(finished)
+        return future
+
+    async def load_piece(self, file_entry, path, piece_index):
+        """Đọc cả mảnh qua cache"""
+        return await asyncio.shield(self.start_piece_load(file_entry, path, piece_index))
+
+    def read_ahead(self, file_entry, path, piece_index):
+        """Đọc trước vài mảnh kế tiếp vì leecher thường xin các mảnh liền nhau"""
+        for index in range(piece_index + 1, piece_index + 1 + READ_AHEAD_PIECES):
+            key = (file_entry['info_hash'], index)
+            if index in file_entry['have'] and key not in self.piece_cache:
+                self.start_piece_load(file_entry, path, index)
+
+    def print_cache_stats(self):
+        """In số liệu hit/miss của cache mảnh"""
+        stats = self.piece_cache.stats()
+        print(f"Piece cache: {stats['entries']} pieces, {stats['bytes'] / 1024 / 1024:.1f}/"
+              f"{stats['max_bytes'] / 1024 / 1024:.1f} MiB")
+        print(f"  hits={stats['hits']} misses={stats['misses']} "
+              f"hit_ratio={stats['hit_ratio']:.2%} evictions={stats['evictions']}")
+
+    def print_dht_stats(self):
+        """In số liệu của DHT nếu đang bật"""
+        if self.dht is not None:
+            stats = dict(self.dht.stats)
+            lookups = stats['lookups'] or 1
+            print(f"DHT: {len(self.dht.table)} nodes, {len(self.dht.storage)} stored peers, "
+                  f"sent={stats['sent']} received={stats['received']} timeouts={stats['timeouts']}")
+            print(f"  lookups={stats['lookups']} messages/lookup={stats['lookup_messages'] / lookups:.1f} "
+                  f"latency={stats['lookup_seconds'] / lookups * 1000:.1f} ms")
+
+    async def read_seeder_requests(self, reader, pending_requests, wakeup, on_pex, on_metadata):
+        """Đọc REQUEST/CANCEL từ leecher vào hàng chờ của kết nối; PEX và METADATA_REQUEST chuyển cho on_pex/on_metadata"""
+        while True:
+            msg_id, payload = await read_message_async(reader)
+            if msg_id == REQUEST:
+                if len(pending_requests) >= MAX_PENDING_REQUESTS:
+                    raise ProtocolError("Too many pending requests")
+                pending_requests.append(unpack_request(payload))
+                wakeup.set()
+            elif msg_id == CANCEL:
+                try:
+                    pending_requests.remove(unpack_request(payload))
+                except ValueError:
+                    pass
+            elif msg_id == PEX:
+                on_pex(*unpack_pex(payload))
+            elif msg_id == METADATA_REQUEST:
+                on_metadata(unpack_metadata_request(payload))
+
+    async def handle_seeder_connection(self, reader, writer):
+        """Phục vụ một leecher trên event loop của server seeding"""
+        if self.seed_connections >= self.max_seed_connections:
+            writer.close()
+            return
+        self.seed_connections += 1
+        reader_task = None
+        remote = {}  # 'address': địa chỉ lắng nghe của leecher, biết khi nó gửi PEX
+        try:
+            info_hash, peer_id = await read_handshake_async(reader)
+            file_entry = self.find_shared_file(info_hash)
+            if file_entry is None:
+                print(f"Peer {peer_id} asked for unknown info_hash {info_hash}")
+                return
+            writer.write(build_handshake(info_hash, self.peer_id))
+            if file_entry['have'].complete():
+                # Chỉ xếp hàng; thông báo trùng với lần trước bị bỏ qua
+                self.notify_tracker_seeding(file_entry['filename'], "start")
+
+            # Gửi bitfield lúc kết nối, sau đó gửi HAVE cho từng mảnh mới tải xong
+            have_log = file_entry['have_log']
+            sent_haves = len(have_log)
+            writer.write(build_message(BITFIELD, file_entry['have'].to_bytes()))
+
+            # Các yêu cầu chưa phục vụ; CANCEL có thể xóa bớt trước khi gửi
+            pending_requests = deque()
+            wakeup = asyncio.Event()
+            pex = PexState()
+
+            def on_pex(added, dropped, port):
+                if port is not None and 'address' not in remote:
+                    remote['address'] = normalize_address(writer.get_extra_info('peername')[0], port)
+                    self.pex_add(info_hash, remote['address'])
+                download = self.downloads.get(info_hash)
+                if download is not None:
+                    download.add_pex_peers(added, dropped)
+
+            def on_metadata(piece):
+                # Peer chỉ biết info_hash xin dict info; mảnh metadata nhỏ nên gửi ngay
+                payload = pack_metadata_piece(file_entry['metadata'], piece)
+                if payload is None:
+                    writer.write(build_message(METADATA_REJECT, pack_metadata_request(piece)))
                 else:
-                    print("No data read from file; possible end of file.")
-        else:
-            print(f"Piece index {piece_index} is out of range.")
+                    writer.write(build_message(METADATA_PIECE, payload))
+                wakeup.set()
+
+            reader_task = asyncio.create_task(
+                self.read_seeder_requests(reader, pending_requests, wakeup, on_pex, on_metadata))
+            while not reader_task.done():
+                wakeup.clear()
+                now = time.monotonic()
+                if 'address' in remote and pex.due(now):
+                    # Quảng bá cho leecher các peer khác của torrent này
+                    added, dropped = pex.delta(self.pex_peers(info_hash) - {remote['address']}, now)
+                    if added or dropped:
+                        writer.write(build_message(PEX, pack_pex(added, dropped)))
+                while sent_haves < len(have_log):
+                    writer.write(build_message(HAVE, pack_have(have_log[sent_haves])))
+                    sent_haves += 1
+
+                if pending_requests:
+                    piece_index, begin, length = pending_requests.popleft()
+                    if await self.send_file_piece(writer, file_entry, piece_index, begin, length):
+                        self.uploaded_bytes += length
+                        if begin == 0:
+                            print(f"Sent piece index {piece_index} to peer {peer_id}")
+                    continue
+
+                await writer.drain()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), HAVE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            reader_task.result()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"Error handling client: {e}")
+        finally:
+            if reader_task is not None:
+                reader_task.cancel()
+            if 'address' in remote:
+                self.pex_remove(info_hash, remote['address'])
+            self.seed_connections -= 1
+            writer.close()
+
+    async def serve_seeder(self):
+        """Một event loop phục vụ mọi kết nối tới server seeding"""
+        self.disk_executor = ThreadPoolExecutor(max_workers=DISK_WORKERS, thread_name_prefix='disk')
+        server = await asyncio.start_server(
+            self.handle_seeder_connection, self.peer_host, self.peer_port,
+            backlog=self.seed_backlog, reuse_address=True)
+        print(f"Seeder listening on {self.peer_host}:{self.peer_port}")
+        async with server:
+            await server.serve_forever()
 
     def start_seeder_server(self):
         """Khởi động server seeding"""
-        
-        def client_handler(client_socket, addr):
-            
+        asyncio.run(self.serve_seeder())
+
+    def start_seeder_in_background(self):
+        """Chạy server seeding trên luồng riêng nếu chưa chạy"""
+        with self.seeder_lock:
+            if self.seeder_thread is None:
+                self.seeder_thread = Thread(target=self.start_seeder_server, daemon=True)
+                self.seeder_thread.start()
+
+    def fetch_peer_list(self, tracker_url, info_hash):
+        """Lấy danh sách peer đang giữ torrent, dùng lại danh sách vừa lấy nếu còn mới"""
+        peers = self.tracker_client.cached_peer_list(info_hash)
+        if peers is None:
+            peers = self.request_peer_list(tracker_url, info_hash)
+            if not peers and self.dht is not None:
+                peers = self.dht_peer_list(info_hash) or peers
+            if peers is not None:
+                self.tracker_client.cache_peer_list(info_hash, peers)
+        return peers
+
+    def request_peer_list(self, tracker_url, info_hash):
+        """Hỏi tracker danh sách peer đang giữ torrent"""
+        entry = self.find_shared_file(info_hash)
+        if self.udp_tracker is not None and entry is not None:
+            peers = self.udp_announce(entry)
+            if peers is not None:
+                print(f"Peers holding the file: {len(peers)}")
+                return peers
+        message = {
+            'command': 'peer_list',
+            'info_hash': info_hash,
+            'peer_id': self.peer_id,
+            'peer_host': self.peer_host,
+            'peer_port': self.peer_port,
+            'numwant': self.numwant,
+            'compact': 1 if self.compact_peer_list else 0,
+        }
+        try:
+            owner = self.cluster_owner(info_hash)
             try:
-                data = client_socket.recv(1024).decode()
-                if data:
-                    
-                    piece_index, filename, peer_id, peer_host, peer_port = data.split(',')
-                    piece_index = int(piece_index)
-                    peer_info = {
-                        'peer_id': peer_id,
-                        'peer_host': peer_host,
-                        'peer_port': int(peer_port),
-                    }
-                    if peer_port not in self.shared_pieces:
-                        self.shared_pieces[peer_port] = {}
-
-                    if filename not in self.shared_pieces[peer_port]:
-                        self.shared_pieces[peer_port][filename] = []
-                        
-                    self.notify_tracker_seeding(file_name=filename, flag="start")
-                    
-                    # Tìm và gửi mảnh dữ liệu
-                    for file in files:
-                        if file['filename'] == filename:
-                            file_pieces = file['pieces']
-                                
-                            if piece_index not in self.shared_pieces[peer_port][filename]:
-                                # Gửi mảnh dữ liệu cho peer
-                                self.send_file_piece(client_socket, filename, piece_index, 256 * 1024, file_pieces, peer_info)
-                                self.shared_pieces[peer_port][filename].append(piece_index)
-                                print(f"Sent piece index {piece_index} to peer {peer_info['peer_id']}") 
-                            else:
-                                print(f"Piece {piece_index} already shared with peer {peer_info['peer_id']}. Skipping.")
-            except Exception as e:
-                print(f"Error handling client: {e}")
-            finally:
-                # if filename:
-                #     self.notify_tracker_seeding(file_name=filename, flag="end")
-                    
-                client_socket.close()
+                response = self.tracker_client.get(f'{owner}/peer_list' if owner else tracker_url, json=message)
+            except requests.exceptions.RequestException:
+                if owner is None:
+                    raise
+                # Tracker sở hữu không trả lời: hỏi tracker trong file torrent, nó sẽ chuyển hướng
+                self.refresh_cluster()
+                response = self.tracker_client.get(tracker_url, json=message)
+            self.check_cluster_version(response)
+            if response.ok and response.headers.get('Content-Type', '').startswith(COMPACT_MIMETYPE):
+                data = bdecode(response.content)
+                if b'interval' in data:
+                    self.announce_interval = max(1, data[b'interval'])
+                peers = (unpack_compact_peers(data.get(b'peers', b''))
+                         + unpack_compact_peers(data.get(b'peers6', b''), ipv6=True))
+                print(f"Peers holding the file: {len(peers)}")
+                return peers
+            if response.ok:
+                data = response.json()
+                if data['status'] == 'success':
+                    self.update_interval(response)
+                    print("Peers holding the file:", data['peers'])
+                    return data['peers']
+                print("No peers found or error:", data['message'])
+            else:
+                print("Failed to contact tracker:", response.status_code)
+        except Exception as e:
+            print(f"Failed to connect to tracker: {e}")
+        return None
 
-        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.bind((self.peer_host, self.peer_port))
-        server_socket.listen(5)
-        print(f"Seeder listening on {self.peer_host}:{self.peer_port}")
+    def register_shared_file(self, file_entry):
+        """Thêm (hoặc thay thế) file đang chia sẻ theo info_hash"""
+        self.files = [file for file in self.files if file.get('info_hash') != file_entry['info_hash']]
+        self.files.append(file_entry)
+        # File có thể vừa được tạo lại; bỏ file handle cũ trong pool
+        self.file_pool.close(os.path.join(f"peer_{self.peer_id}", file_entry['filename']))
 
-        while True:
-            client_socket, addr = server_socket.accept()
-            Thread(target=client_handler, args=(client_socket, addr), daemon=True).start()
+    def fetch_torrent_metadata(self, info_hash, tracker_url):
+        """
+        Lấy metadata (dict info bencode) của info_hash: thử vài peer đang giữ torrent,
+        nếu không được thì hỏi tracker. Trả về dict info đã kiểm tra, hoặc None.
+        """
+        own = normalize_address(self.peer_host, self.peer_port)
+        peers = list(self.fetch_peer_list(tracker_url, info_hash) or [])
+        random.shuffle(peers)
+        tried = 0
+        for peer in peers:
+            if tried >= METADATA_PEERS:
+                break
+            if normalize_address(peer['peer_host'], peer['peer_port']) == own:
+                continue
+            tried += 1
+            metadata = fetch_metadata(peer['peer_host'], peer['peer_port'], info_hash, self.peer_id)
+            info = verify_metadata(info_hash, metadata) if metadata is not None else None
+            if info is not None:
+                print(f"Fetched metadata from {peer['peer_host']}:{peer['peer_port']}")
+                return info
+
+        base_url = self.cluster_owner(info_hash) or self.tracker_base_url()
+        try:
+            response = self.tracker_client.get(f'{base_url}/torrent_info',
+                                               params={'info_hash': info_hash, 'metadata': 1})
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to fetch metadata from tracker: {e}")
+            return None
+        info = verify_metadata(info_hash, response.content) if response.ok else None
+        if info is not None:
+            print("Fetched metadata from tracker")
+        return info
+
+    def find_torrent_file(self, info_hash):
+        """ Tên file .torrent của info_hash trong thư mục của peer, hoặc None """
+        dir = f"peer_{self.peer_id}"
+        if not os.path.isdir(dir):
+            return None
+        for name in os.listdir(dir):
+            if not name.endswith('.torrent'):
+                continue
+            try:
+                with open(os.path.join(dir, name), 'rb') as file:
+                    if hashlib.sha1(bencode(bdecode(file.read())[b'info'])).hexdigest() == info_hash:
+                        return name
+            except Exception:
+                continue
+        return None
+
+    def download_info_hash(self, info_hash):
+        """
+        Tải torrent chỉ từ info_hash (kiểu magnet): lấy metadata từ peer hoặc tracker,
+        lưu thành file .torrent trong thư mục của peer rồi tải như download_torrent.
+        """
+        info_hash = info_hash.strip().lower()
+        if len(info_hash) != 40 or any(c not in '0123456789abcdef' for c in info_hash):
+            print("Invalid info_hash!")
+            return
+        torrent_filename = self.find_torrent_file(info_hash)
+        if torrent_filename is None:
+            tracker_url = f'{self.tracker_base_url()}/peer_list'
+            info = self.fetch_torrent_metadata(info_hash, tracker_url)
+            if info is None:
+                print("Could not fetch metadata for this info_hash.")
+                return
+            dir = f"peer_{self.peer_id}"
+            os.makedirs(dir, exist_ok=True)
+            torrent_filename = f"{info[b'name'].decode()}.torrent"
+            with open(os.path.join(dir, torrent_filename), 'wb') as torrent_file:
+                torrent_file.write(bencode({'peer_list': tracker_url, 'info': info}))
+            print(f"Saved metadata as {torrent_filename}")
+        self.download_torrent(torrent_filename)
 
     def download_torrent(self, torrent_filename):
         """Tải file từ torrent"""
@@ -250,116 +845,43 @@ class Peer:
             torrent_data = bdecode(file.read())
             tracker_url = torrent_data[b'peer_list'].decode()
             info_hash = hashlib.sha1(bencode(torrent_data[b'info'])).hexdigest()
-            filename = torrent_data[b'info'][b'name'].decode()
-
-        all_hashes = torrent_data[b'info'][b'pieces']
-        hash_length = 20  # SHA-1 hashes are 20 bytes long
-        num_pieces = len(all_hashes) // hash_length
-        piece_length = torrent_data[b'info'][b'piece length']
-
-        validated_pieces = [None] * num_pieces
-        peer_idx = 0
-        i = 0
-
-        self.notify_tracker_downloading(file_name = torrent_filename.rsplit('.torrent', 1)[0], flag = "start")
 
-        while i < num_pieces:
-            # Contact the tracker to get peers
-            message = {
-                'command': 'peer_list',
-                'info_hash': info_hash
-            }
-            try:
-                response = requests.get(tracker_url, json=message)
-                if response.ok:
-                    data = response.json()
-                    if data['status'] == 'success':
-                        print("Peers holding the file:", data['peers'])
-                    else:
-                        print("No peers found or error:", data['message'])
-                        break
-                else:
-                    print("Failed to contact tracker:", response.status_code)
-                    return
-            except Exception as e:
-                print(f"Failed to connect to tracker: {e}")
-                return
-
-            number_of_peers = len(data['peers'])
-            while number_of_peers == 0:
-                print("No peers found. Trying again in 5 seconds.")
-                time.sleep(5)
-                try:
-                    response = requests.post(tracker_url, json=message)
-                    if response.ok:
-                        data = response.json()
-                        if data['status'] == 'success':
-                            print("Peers holding the file:", data['peers'])
-                            number_of_peers = len(data['peers'])
-                        else:
-                            print("No peers found or error:", data['message'])
-                    else:
-                        print("Failed to contact tracker:", response.status_code)
-                except Exception as e:
-                    print(f"Failed to connect to tracker: {e}")
-                    return
-
-            if peer_idx >= number_of_peers:
-                peer_idx = 0
-            seeder_host = data['peers'][peer_idx]['peer_host']
-            seeder_port = int(data['peers'][peer_idx]['peer_port'])
-
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            try:
-                client_socket.connect((seeder_host, seeder_port))
-            except ConnectionRefusedError:
-                print(f"Failed to connect to {seeder_host}:{seeder_port}, trying next peer.")
-                peer_idx += 1
-                if peer_idx == number_of_peers:
-                    peer_idx = 0
-                time.sleep(5)
-                continue
-
-            peer_idx += 1
-            if peer_idx == number_of_peers:
-                peer_idx = 0
-
-            client_socket.send(f"{i},{filename},{self.peer_id},{self.peer_host},{self.peer_port}".encode())
-            piece = client_socket.recv(piece_length)
-
-            piece_hash = all_hashes[i * hash_length:(i + 1) * hash_length]
-            if hashlib.sha1(piece).digest() == piece_hash:
-                print(f"Received and validated piece {i} from {seeder_host}:{seeder_port}")
-                validated_pieces[i] = piece
-                i += 1
-            else:
-                print(f"Piece {i} is corrupted")
-                continue
+        download = TorrentDownload(self, info_hash, torrent_data[b'info'], tracker_url)
+        filename = download.filename
+        if download.is_complete():
+            print(f"{filename} is already complete.")
+            download.stop()
+            return
+        if download.have.count():
+            print(f"Resuming {filename}: {download.have.count()}/{download.num_pieces} pieces already verified")
 
-            client_socket.shutdown(socket.SHUT_RDWR)
-            client_socket.close()
-            time.sleep(1)
+        # Phục vụ các mảnh đã có cho peer khác ngay trong lúc tải
+        self.register_shared_file(download.file_entry)
+        self.start_seeder_in_background()
+        self.announce_change(download.file_entry, 'started')
+        self.dht_announce(info_hash)
+        self.start_announcer()
 
-        # Create directory if not exists
-        directory = f"peer_{self.peer_id}"
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+        self.downloads[info_hash] = download
+        try:
+            completed = download.run()
+        finally:
+            self.downloads.pop(info_hash, None)
+        if not completed:
+            print("Download aborted: could not fetch all pieces.")
+            return
 
-        full_output_path = os.path.join(directory, filename)
-        with open(full_output_path, 'wb') as file:
-            for piece in validated_pieces:
-                if piece is not None:
-                    file.write(piece)
         print(f"File has been successfully created: {filename}")
         print("Download completed and connection closed.")
-        self.notify_tracker_downloading(file_name = torrent_filename.rsplit('.torrent', 1)[0], flag = "end")
+        # left = 0 chuyển peer từ leecher sang seeder trên tracker
+        self.announce_change(download.file_entry, 'completed')
     
     def scrape_peers(self, filename):
         """Gửi yêu cầu scrape tới tracker và nhận thông tin seeders và leechers."""
         
         url = f'http://{self.tracker_host}:{self.tracker_port}/scrape'
         # Gửi yêu cầu GET tới tracker
-        response = requests.get(url, params={'filename': filename})
+        response = self.tracker_client.get(url, params={'filename': filename})
         
         # Kiểm tra trạng thái của phản hồi
         if response.status_code == 200:
@@ -391,12 +913,43 @@ class Peer:
             
         
                 
+def bytes_left(file_entry):
+    """ Số byte còn thiếu của file (ước lượng theo số mảnh), 0 khi đã đủ """
+    have = file_entry['have']
+    if have.complete():
+        return 0
+    return max(1, file_entry['length'] - have.count() * file_entry['piece_length'])
+
+
+def shared_file_entry(filename, info_hash, info, have):
+    """ Thông tin một file đang chia sẻ, dùng cho server seeding và announce """
+    return {
+        'filename': filename,
+        'info_hash': info_hash,
+        'pieces': info[b'pieces'],
+        'piece_length': info[b'piece length'],
+        'length': info[b'length'],
+        'have': have,
+        'have_log': [],
+        'metadata': bencode(info),
+    }
+
+
 def parse_arguments():
     """ Parse command-line arguments """
     parser = argparse.ArgumentParser(description="Start a torrent-like peer node.")
     parser.add_argument('--tracker-host', type=str, default='localhost', help="IP address of the tracker (default is localhost)")
     parser.add_argument('--peer-host', type=str, default='localhost', help="IP address of the peer (default is localhost)")
     parser.add_argument('--id', type=str, help="Unique ID for this peer")
+    parser.add_argument('--max-in-flight', type=int, default=MAX_IN_FLIGHT, help="Number of block requests kept in flight per peer connection")
+    parser.add_argument('--max-seed-connections', type=int, default=SEED_MAX_CONNECTIONS, help="Maximum number of concurrent connections served while seeding")
+    parser.add_argument('--seed-backlog', type=int, default=SEED_BACKLOG, help="Listen backlog of the seeding server")
+    parser.add_argument('--tracker-udp-port', type=int, default=None, help="Announce over the UDP tracker on this port instead of HTTP")
+    parser.add_argument('--numwant', type=int, default=NUMWANT, help="Maximum number of peers requested from the tracker per peer list")
+    parser.add_argument('--json-peer-list', action='store_true', help="Request the verbose JSON peer list instead of the compact format")
+    parser.add_argument('--dht-port', type=int, default=None, help="Run a DHT node on this UDP port (0 picks a free port) for trackerless peer discovery")
+    parser.add_argument('--dht-bootstrap', type=str, default='', help="Comma-separated host:port list of DHT nodes to join through")
+    parser.add_argument('--piece-cache-mb', type=int, default=PIECE_CACHE_SIZE // (1024 * 1024), help="Size of the in-memory piece cache used while seeding, 0 disables it; only pieces downloaded more than once are cached, first downloads are sent with sendfile")
     return parser.parse_args()
 
 def print_menu():
@@ -408,15 +961,30 @@ def print_menu():
     print("4. SEED")
     print("5. DOWNLOAD [torrent_filename]")
     print("6. SCRAPE [filename]")
-    print("7. EXIT")
+    print("7. STATS")
+    print("8. MAGNET [info_hash]")
+    print("9. EXIT")
 
     
-def main(id, trackerhost, peerhost):
+def main(id, trackerhost, peerhost, max_in_flight=MAX_IN_FLIGHT,
+         max_seed_connections=SEED_MAX_CONNECTIONS, seed_backlog=SEED_BACKLOG,
+         piece_cache_size=PIECE_CACHE_SIZE, numwant=NUMWANT, compact_peer_list=True,
+         tracker_udp_port=None, dht_port=None, dht_bootstrap=()):
     peer = Peer(
         peer_id=id,
         tracker_host=trackerhost,
-        peer_host=peerhost
+        peer_host=peerhost,
+        max_in_flight=max_in_flight,
+        max_seed_connections=max_seed_connections,
+        seed_backlog=seed_backlog,
+        piece_cache_size=piece_cache_size,
+        numwant=numwant,
+        compact_peer_list=compact_peer_list,
+        tracker_udp_port=tracker_udp_port,
+        dht_port=dht_port,
+        dht_bootstrap=dht_bootstrap
     )
+    peer.load_shared_files()
     print_menu()
     while True:
         
@@ -431,7 +999,7 @@ def main(id, trackerhost, peerhost):
             peer.create_torrent_file(FILENAME)
             peer.upload_info_hash_to_tracker(FILENAME)
         elif command == "SEED":
-            Thread(target=peer.start_seeder_server, daemon=True).start()
+            peer.start_seeder_in_background()
         elif command =="DOWNLOAD":
             torrent_filename = input("Enter your file name: ").strip()
             peer.download_torrent(torrent_filename)
@@ -447,9 +1015,18 @@ def main(id, trackerhost, peerhost):
         # elif command == "seeder":
         #     # Start seeder server in a separate thread
         #     Thread(target=start_seeder_server, args=(CLIENT_IP, CLIENT_PORT), daemon=True).start()
+        elif command == "STATS":
+            peer.print_cache_stats()
+            peer.print_dht_stats()
+        elif command == "MAGNET":
+            info_hash = input("Enter the info hash: ").strip()
+            peer.download_info_hash(info_hash)
         elif(command == "MENU"):
             print_menu()
         elif(command == "EXIT"):
+            peer.tracker_client.flush()
+            if peer.dht is not None:
+                peer.dht.close()
             break
         
         
@@ -459,5 +1036,14 @@ if __name__ == "__main__":
     main(
         id = args.id,
         trackerhost = args.tracker_host,
-        peerhost = args.peer_host   
+        peerhost = args.peer_host,
+        max_in_flight = args.max_in_flight,
+        max_seed_connections = args.max_seed_connections,
+        seed_backlog = args.seed_backlog,
+        piece_cache_size = args.piece_cache_mb * 1024 * 1024,
+        numwant = args.numwant,
+        compact_peer_list = not args.json_peer_list,
+        tracker_udp_port = args.tracker_udp_port,
+        dht_port = args.dht_port,
+        dht_bootstrap = [address.rsplit(':', 1) for address in args.dht_bootstrap.split(',') if address]
     )
@@ -0,0 +1,162 @@
+import gc
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+FLUSH_INTERVAL = 0.05      # Chu kỳ (giây) ghi lô bản ghi đang chờ xuống nhật ký
+SNAPSHOT_INTERVAL = 60     # Thời gian (giây) tối đa giữa hai snapshot khi có thay đổi
+SNAPSHOT_RECORDS = 20000   # Chụp snapshot sớm khi nhật ký có chừng này bản ghi (giới hạn thời gian phát lại)
+SNAPSHOT_NAME = 'snapshot.json'
+SEGMENT_PATTERN = re.compile(r'wal\.(\d+)\.log$')
+
+
+class StateJournal:
+    """
+    Lưu trạng thái tracker xuống đĩa: nhật ký ghi trước (WAL) dạng JSON lines chia
+    thành các đoạn, cộng snapshot gọn chụp định kỳ. append() chỉ đưa bản ghi vào hàng
+    đợi; một luồng nền ghi theo lô nên announce không phải chờ đĩa.
+    Khi khởi động, load() nạp snapshot rồi phát lại các đoạn nhật ký sau nó.
+    Mặc định không fsync: dữ liệu đã ghi nằm trong page cache nên vẫn còn khi tracker
+    bị kill, chỉ mất khi cả hệ điều hành dừng; fsync=True (tracker.py --fsync) ghi
+    xuống đĩa sau mỗi lô. Bản ghi còn trong hàng đợi (tối đa flush_interval) luôn có thể mất.
+    """
+
+    def __init__(self, directory, flush_interval=FLUSH_INTERVAL, snapshot_interval=SNAPSHOT_INTERVAL,
+                 snapshot_records=SNAPSHOT_RECORDS, fsync=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_records = snapshot_records
+        self.fsync = fsync
+        self.queue = deque()
+        self.segment = 0
+        self.file = None
+        self.records_since_snapshot = 0
+        self.write_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def append(self, record):
+        """ Ghi nhận một thay đổi; gọi được từ mọi luồng, không chặn """
+        self.queue.append(record)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'wal.{segment:08d}.log')
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_NAME)
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append(int(match.group(1)))
+        return sorted(segments)
+
+    def load(self, store):
+        """ Nạp trạng thái đã lưu vào store rỗng; trả về số bản ghi nhật ký đã phát lại """
+        # Nạp hàng trăm nghìn object: tắt GC trong lúc nạp để không quét đi quét lại
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._load(store)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def _load(self, store):
+        first_segment = 0
+        if os.path.exists(self._snapshot_path()):
+            with open(self._snapshot_path(), 'r') as f:
+                state = json.load(f)
+            store.restore(state)
+            first_segment = state['wal']
+
+        replayed = 0
+        segments = [segment for segment in self._segments() if segment >= first_segment]
+        for segment in segments:
+            with open(self._segment_path(segment), 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Dòng cuối ghi dở khi tracker dừng đột ngột
+                    store.apply(record)
+                    replayed += 1
+        # Ghi tiếp vào đoạn mới để không nối sau một dòng ghi dở
+        self.segment = max(segments + [first_segment - 1]) + 1
+        self.records_since_snapshot = replayed
+        return replayed
+
+    def _write_pending(self):
+        # Gọi khi đang giữ write_lock: ghi mọi bản ghi đang chờ bằng một lần write
+        lines = []
+        while self.queue:
+            lines.append(json.dumps(self.queue.popleft(), separators=(',', ':')))
+        if not lines:
+            return
+        if self.file is None:
+            self.file = open(self._segment_path(self.segment), 'a')
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.records_since_snapshot += len(lines)
+
+    def flush(self):
+        with self.write_lock:
+            self._write_pending()
+
+    def snapshot(self, store):
+        """ Chụp trạng thái sang snapshot mới rồi xóa các đoạn nhật ký nó đã bao gồm """
+        with self.write_lock:
+            # Thay đổi từ đây trở đi vào đoạn mới; đoạn cũ chỉ chứa bản ghi đã có trong store
+            self._write_pending()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.segment += 1
+            state = store.export()
+            state['wal'] = self.segment
+            tmp_path = self._snapshot_path() + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, separators=(',', ':'))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self._snapshot_path())
+            for segment in self._segments():
+                if segment < self.segment:
+                    os.remove(self._segment_path(segment))
+            self.records_since_snapshot = 0
+
+    def run(self, store):
+        last_snapshot = time.monotonic()
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+            now = time.monotonic()
+            if self.records_since_snapshot and (self.records_since_snapshot >= self.snapshot_records
+                                                or now - last_snapshot >= self.snapshot_interval):
+                self.snapshot(store)
+                last_snapshot = now
+
+    def start(self, store):
+        """ Chạy luồng ghi nền """
+        self.thread = threading.Thread(target=self.run, args=(store,), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """ Dừng luồng nền và ghi nốt các bản ghi còn chờ """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        with self.write_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,214 @@
+import random
+import threading
+from collections import defaultdict
+
+BLOCK_SIZE = 16 * 1024  # Kích thước một block trong yêu cầu REQUEST
+PICK_CANDIDATES = 16  # Chọn ngẫu nhiên trong số này để các peer không tranh cùng một mảnh
+
+
+class PartialPiece:
+    """ Một mảnh đang tải dở: các block đã nhận và ai đang giữ yêu cầu cho từng block """
+
+    def __init__(self, size):
+        self.size = size
+        self.num_blocks = (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+        self.data = bytearray(size)
+        self.received = set()
+        self.requested = {}   # block -> tập peer đang được yêu cầu block này
+        self.next_block = 0   # block tiếp theo chưa từng được yêu cầu
+        self.returned = []    # block bị trả lại khi peer ngắt kết nối
+        self.sources = set()  # các peer đã gửi block cho mảnh này
+
+    def block_length(self, block):
+        return min(BLOCK_SIZE, self.size - block * BLOCK_SIZE)
+
+    def free_block(self):
+        """ Lấy một block chưa ai yêu cầu, hoặc None """
+        while self.returned:
+            block = self.returned.pop()
+            if block not in self.received and not self.requested.get(block):
+                return block
+        if self.next_block < self.num_blocks:
+            self.next_block += 1
+            return self.next_block - 1
+        return None
+
+
+class PiecePicker:
+    """
+    Chọn block cần tải: ưu tiên hoàn thành các mảnh đang dở, sau đó mở mảnh
+    mới theo thứ tự hiếm nhất trước (rarest-first). Khi mọi block còn thiếu
+    đều đã được yêu cầu thì chuyển sang endgame và yêu cầu trùng lặp.
+    """
+
+    def __init__(self, num_pieces, have, piece_size):
+        self.num_pieces = num_pieces
+        self.piece_size = piece_size
+        self.lock = threading.Lock()
+        self.availability = [0] * num_pieces
+        # availability -> các mảnh còn thiếu và chưa bắt đầu tải
+        self.buckets = defaultdict(set)
+        self.unstarted = 0
+        self.partial = {}
+        self.remaining = 0
+        for index in range(num_pieces):
+            if index not in have:
+                self.buckets[0].add(index)
+                self.unstarted += 1
+                self.remaining += 1
+
+    def _move(self, index, old, new):
+        bucket = self.buckets.get(old)
+        if bucket is not None and index in bucket:
+            bucket.discard(index)
+            if not bucket:
+                del self.buckets[old]
+            self.buckets[new].add(index)
+
+    def add_pieces(self, indices):
+        """ Cộng độ phổ biến của các mảnh một peer vừa báo là có (BITFIELD/HAVE) """
+        with self.lock:
+            for index in indices:
+                old = self.availability[index]
+                self.availability[index] = old + 1
+                self._move(index, old, old + 1)
+
+    def remove_pieces(self, indices):
+        """ Trừ độ phổ biến khi một peer ngắt kết nối """
+        with self.lock:
+            for index in indices:
+                old = self.availability[index]
+                self.availability[index] = old - 1
+                self._move(index, old, old - 1)
+
+    @property
+    def endgame(self):
+        """ Mọi mảnh còn thiếu đều đã bắt đầu tải """
+        return self.unstarted == 0
+
+    def _start_piece(self, peer_have):
+        """ Mở mảnh hiếm nhất mà peer có; trả về index hoặc None """
+        for level in sorted(self.buckets):
+            if level == 0:
+                continue
+            candidates = []
+            for index in self.buckets[level]:
+                if index in peer_have:
+                    candidates.append(index)
+                    if len(candidates) == PICK_CANDIDATES:
+                        break
+            if candidates:
+                index = random.choice(candidates)
+                self.buckets[level].discard(index)
+                if not self.buckets[level]:
+                    del self.buckets[level]
+                self.unstarted -= 1
+                self.partial[index] = PartialPiece(self.piece_size(index))
+                return index
+        return None
+
+    def pick_blocks(self, peer_key, peer_have, count):
+        """
+        Chọn tối đa count block để yêu cầu từ peer.
+        Trả về danh sách (index, begin, length).
+        """
+        blocks = []
+
+        def take(index, partial, block):
+            partial.requested.setdefault(block, set()).add(peer_key)
+            blocks.append((index, block * BLOCK_SIZE, partial.block_length(block)))
+
+        with self.lock:
+            # Hoàn thành các mảnh đang dở trước để sớm có mảnh chia sẻ tiếp
+            for index, partial in self.partial.items():
+                if index not in peer_have:
+                    continue
+                while len(blocks) < count:
+                    block = partial.free_block()
+                    if block is None:
+                        break
+                    take(index, partial, block)
+                if len(blocks) == count:
+                    return blocks
+
+            while len(blocks) < count:
+                index = self._start_piece(peer_have)
+                if index is None:
+                    break
+                partial = self.partial[index]
+                while len(blocks) < count:
+                    block = partial.free_block()
+                    if block is None:
+                        break
+                    take(index, partial, block)
+
+            # Endgame: yêu cầu trùng các block đang chờ ở peer khác
+            if not blocks and self.endgame:
+                for index, partial in self.partial.items():
+                    if index not in peer_have:
+                        continue
+                    for block, requesters in list(partial.requested.items()):
+                        if peer_key not in requesters and block not in partial.received:
+                            take(index, partial, block)
+                            if len(blocks) == count:
+                                return blocks
+        return blocks
+
+    def on_block(self, peer_key, index, begin, data):
+        """
+        Lưu một block nhận được.
+        Trả về (dữ liệu cả mảnh, các peer đã gửi) khi đủ block, ngược lại (None, None).
+        """
+        with self.lock:
+            partial = self.partial.get(index)
+            if partial is None or begin % BLOCK_SIZE:
+                return None, None
+            block = begin // BLOCK_SIZE
+            if block >= partial.num_blocks or len(data) != partial.block_length(block):
+                return None, None
+            partial.requested.pop(block, None)
+            if block in partial.received:
+                return None, None
+            partial.data[begin:begin + len(data)] = data
+            partial.received.add(block)
+            partial.sources.add(peer_key)
+            if len(partial.received) < partial.num_blocks:
+                return None, None
+            del self.partial[index]
+            return partial.data, partial.sources
+
+    def is_received(self, index, begin):
+        """ Block đã nhận (từ bất kỳ peer nào) hoặc cả mảnh đã xong """
+        with self.lock:
+            partial = self.partial.get(index)
+            return partial is None or begin // BLOCK_SIZE in partial.received
+
+    def abort_blocks(self, peer_key, blocks):
+        """ Trả lại các block peer chưa gửi để peer khác yêu cầu """
+        with self.lock:
+            for index, begin, length in blocks:
+                partial = self.partial.get(index)
+                if partial is None:
+                    continue
+                block = begin // BLOCK_SIZE
+                requesters = partial.requested.get(block)
+                if requesters is None:
+                    continue
+                requesters.discard(peer_key)
+                if not requesters:
+                    del partial.requested[block]
+                    if block not in partial.received:
+                        partial.returned.append(block)
+
+    def complete(self, index):
+        """ Mảnh index đã xác thực xong; trả về số mảnh còn thiếu """
+        with self.lock:
+            self.remaining -= 1
+            return self.remaining
+
+    def piece_failed(self, index):
+        """ Mảnh không khớp SHA-1: tải lại từ đầu """
+        with self.lock:
+            self.partial.pop(index, None)
+            self.buckets[self.availability[index]].add(index)
+            self.unstarted += 1
@@ -1,7 +1,9 @@
+import argparse
 import os
 import shutil
 import time
 
+# Không bắt buộc: peer có thể tải chỉ với info_hash (lệnh MAGNET), metadata lấy từ peer khác hoặc tracker
 def share_torrent_files(parent_folder):
     # Lấy danh sách tất cả các thư mục con trong parent_folder
     folders = [f for f in os.listdir(parent_folder) if os.path.isdir(os.path.join(parent_folder, f))]
@@ -17,16 +19,26 @@ def share_torrent_files(parent_folder):
             if file_name.endswith('.torrent'):
                 torrent_file_path = os.path.join(folder_path, file_name)
                 
-                # Sao chép file .torrent tới tất cả các folder peer_ còn lại
+                # Sao chép file .torrent tới các folder peer_ còn lại chưa có bản mới nhất
                 for target_folder in peer_folders:
                     if target_folder != folder:  # Tránh sao chép file vào chính folder đó
-                        target_folder_path = os.path.join(parent_folder, target_folder)
-                        shutil.copy(torrent_file_path, target_folder_path)
+                        target_path = os.path.join(parent_folder, target_folder, file_name)
+                        if os.path.exists(target_path) and \
+                                os.path.getmtime(target_path) >= os.path.getmtime(torrent_file_path):
+                            continue
+                        shutil.copy2(torrent_file_path, target_path)
                         print(f"Đã chia sẻ {file_name} từ {folder} đến {target_folder}")
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Copy .torrent files between peer_* folders periodically.")
+    parser.add_argument('--parent-folder', type=str, default=os.getcwd(), help="Folder containing the peer_* folders (default is the current directory)")
+    parser.add_argument('--interval', type=float, default=2, help="Seconds between two passes (default is 2)")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    parent_folder = "C:/Users/ProTech247.vn/OneDrive/Máy tính/flask"  # Đặt đường dẫn đến thư mục cha của bạn ở đây
+    args = parse_arguments()
+    parent_folder = args.parent_folder  # Thư mục cha chứa các thư mục peer_*
 
     while True:
         share_torrent_files(parent_folder)  # Gọi hàm chia sẻ file
-        time.sleep(2)  # Đợi 2 giây trước khi kiểm tra lại
+        time.sleep(args.interval)  # Đợi trước khi kiểm tra lại
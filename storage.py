@@ -0,0 +1,444 @@
+import os
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bencodepy import encode as bencode, decode as bdecode, DecodingError
+
+HASH_LENGTH = 20  # SHA-1 hashes are 20 bytes long
+MIN_PIECE_LENGTH = 256 * 1024
+MAX_PIECE_LENGTH = 4 * 1024 * 1024
+TARGET_PIECES = 1500  # Số mảnh mong muốn khi tự chọn piece length
+HASH_BATCH_BYTES = 16 * 1024 * 1024  # Lượng dữ liệu mỗi tác vụ hash xử lý
+FILE_POOL_SIZE = 64  # Số file giữ mở sẵn tối đa khi seeding
+PIECE_CACHE_SIZE = 64 * 1024 * 1024  # Dung lượng mặc định của cache mảnh khi seeding
+CACHE_ADMIT_REQUESTS = 2  # Mảnh chỉ được đọc vào cache từ lượt tải thứ chừng này; lượt đầu gửi bằng sendfile
+CACHE_HISTORY = 8192      # Số mảnh tối đa được đếm lượt tải để quyết định đưa vào cache
+
+
+def choose_piece_length(file_size):
+    """ Chọn piece length (lũy thừa của 2) để file có khoảng TARGET_PIECES mảnh """
+    piece_length = MIN_PIECE_LENGTH
+    while piece_length < MAX_PIECE_LENGTH and file_size > piece_length * TARGET_PIECES:
+        piece_length *= 2
+    return piece_length
+
+
+def hash_file_pieces(path, piece_length, on_progress=None):
+    """
+    Hash SHA-1 từng mảnh của file trên nhiều luồng.
+    Đọc qua mmap (không copy) và ghi digest vào một buffer cấp phát sẵn.
+    on_progress: Hàm nhận số mảnh vừa hash xong (ví dụ tqdm.update).
+    """
+    file_size = os.path.getsize(path)
+    num_pieces = (file_size + piece_length - 1) // piece_length
+    digests = bytearray(num_pieces * HASH_LENGTH)
+    if num_pieces == 0:
+        return bytes(digests)
+
+    pieces_per_batch = max(1, HASH_BATCH_BYTES // piece_length)
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+
+        def hash_batch(first, last):
+            # hashlib nhả GIL với dữ liệu lớn nên các luồng chạy song song thật sự
+            for index in range(first, last):
+                piece = view[index * piece_length:(index + 1) * piece_length]
+                digests[index * HASH_LENGTH:(index + 1) * HASH_LENGTH] = hashlib.sha1(piece).digest()
+            return last - first
+
+        try:
+            with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+                futures = [
+                    executor.submit(hash_batch, first, min(first + pieces_per_batch, num_pieces))
+                    for first in range(0, num_pieces, pieces_per_batch)
+                ]
+                for future in as_completed(futures):
+                    count = future.result()
+                    if on_progress:
+                        on_progress(count)
+        finally:
+            view.release()
+    return bytes(digests)
+
+
+def read_file_range(file, offset, count):
+    """ Đọc count byte tại offset mà không dùng con trỏ file chung (an toàn giữa các luồng) """
+    if hasattr(os, 'pread'):
+        data = os.pread(file.fileno(), count, offset)
+    else:
+        with _read_lock:
+            file.seek(offset)
+            data = file.read(count)
+    if len(data) != count:
+        raise ConnectionError("File ended before the requested range")
+    return data
+
+
+_read_lock = threading.Lock()
+
+SENDFILE_SUPPORTED = hasattr(os, 'sendfile')
+
+
+def send_direct(writer, header, file, offset, count):
+    """
+    Gửi header rồi count byte của file thẳng ra socket non-blocking của transport
+    (os.sendfile: dữ liệu đi từ page cache ra socket, không copy qua Python).
+    Chỉ gọi khi buffer của transport đang rỗng để không đảo thứ tự dữ liệu.
+    Trả về số byte (tính cả header) đã gửi được trước khi socket đầy.
+    """
+    fd = writer.get_extra_info('socket').fileno()
+    sent = 0
+    try:
+        while sent < len(header):
+            # os.write trên fd của socket tương đương send (chỉ dùng trên Unix, nơi có sendfile)
+            sent += os.write(fd, header[sent:])
+        while sent < len(header) + count:
+            done = sent - len(header)
+            written = os.sendfile(fd, file.fileno(), offset + done, count - done)
+            if written == 0:
+                raise ConnectionError("File ended before the requested range")
+            sent += written
+    except BlockingIOError:
+        pass
+    return sent
+
+
+class FileHandlePool:
+    """ Giữ tối đa max_open file mở sẵn theo LRU để không phải open/close cho mỗi mảnh """
+
+    def __init__(self, max_open=FILE_POOL_SIZE):
+        self.max_open = max_open
+        self.lock = threading.Lock()
+        self.handles = OrderedDict()  # path -> [file, số luồng đang dùng]
+
+    def acquire(self, path):
+        """ Mượn file đang mở cho path (mở mới nếu chưa có); trả về entry [file, số người dùng] """
+        with self.lock:
+            entry = self.handles.get(path)
+            if entry is None:
+                entry = [open(path, 'rb'), 0]
+                self.handles[path] = entry
+                self._evict()
+            else:
+                self.handles.move_to_end(path)
+            entry[1] += 1
+            return entry
+
+    def try_acquire(self, path):
+        """ Như acquire nhưng chỉ lấy file đã mở sẵn (không chặn); trả về None nếu chưa có """
+        with self.lock:
+            entry = self.handles.get(path)
+            if entry is not None:
+                self.handles.move_to_end(path)
+                entry[1] += 1
+            return entry
+
+    def release(self, path, entry):
+        """ Trả lại entry đã mượn bằng acquire """
+        with self.lock:
+            entry[1] -= 1
+            # File đã bị đẩy khỏi pool trong lúc đang dùng: đóng khi không còn ai dùng
+            if entry[1] == 0 and self.handles.get(path) is not entry:
+                entry[0].close()
+
+    @contextmanager
+    def open(self, path):
+        """ Dùng file của pool trong một khối with """
+        entry = self.acquire(path)
+        try:
+            yield entry[0]
+        finally:
+            self.release(path, entry)
+
+    def _evict(self):
+        while len(self.handles) > self.max_open:
+            path, entry = self.handles.popitem(last=False)
+            if entry[1] == 0:
+                entry[0].close()
+
+    def close(self, path=None):
+        """ Đóng file của path, hoặc tất cả nếu path là None """
+        with self.lock:
+            paths = list(self.handles) if path is None else [path]
+            for item in paths:
+                entry = self.handles.pop(item, None)
+                if entry is not None and entry[1] == 0:
+                    entry[0].close()
+
+
+class PieceCache:
+    """
+    Cache LRU các mảnh đã xác thực trong bộ nhớ, giới hạn theo tổng số byte.
+    Chỉ mảnh được tải nhiều lần mới đáng giữ (xem admit): mảnh chỉ tải một lần
+    gửi bằng sendfile rẻ hơn là đọc vào Python.
+    """
+
+    def __init__(self, max_bytes=PIECE_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pieces = OrderedDict()  # (info_hash, piece_index) -> bytes
+        self.requests = OrderedDict()  # (info_hash, piece_index) -> số lượt tải đã thấy
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ Lấy mảnh trong cache (đếm hit/miss); trả về None nếu không có """
+        with self.lock:
+            data = self.pieces.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self.pieces.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.pieces
+
+    def admit(self, key, new_request):
+        """
+        True nếu mảnh đã được tải từ CACHE_ADMIT_REQUESTS lượt trở lên nên đáng đọc vào cache.
+        new_request: Yêu cầu này mở đầu một lượt tải mảnh (block đầu tiên), được đếm thêm.
+        """
+        with self.lock:
+            count = self.requests.get(key, 0)
+            if new_request:
+                count += 1
+                self.requests[key] = count
+                self.requests.move_to_end(key)
+                if len(self.requests) > CACHE_HISTORY:
+                    self.requests.popitem(last=False)
+            return count >= CACHE_ADMIT_REQUESTS
+
+    def put(self, key, data):
+        """ Thêm mảnh vào cache, đẩy các mảnh ít dùng nhất ra khi vượt dung lượng """
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.pieces.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.pieces[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self.pieces.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """ Số liệu để chọn kích thước cache """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.pieces),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+class Bitfield:
+    """ Tập các mảnh đã có, lưu dạng bit (bit cao nhất của byte đầu là mảnh 0) """
+
+    def __init__(self, num_pieces, data=None):
+        self.num_pieces = num_pieces
+        self.bits = bytearray((num_pieces + 7) // 8)
+        if data:
+            self.bits[:len(data)] = data[:len(self.bits)]
+            # Bỏ các bit thừa ở cuối
+            spare = len(self.bits) * 8 - num_pieces
+            if spare and self.bits:
+                self.bits[-1] &= (0xFF << spare) & 0xFF
+        self._count = sum(bin(byte).count('1') for byte in self.bits)
+
+    @classmethod
+    def full(cls, num_pieces):
+        """ Bitfield của peer có đủ tất cả các mảnh """
+        return cls(num_pieces, b'\xff' * ((num_pieces + 7) // 8))
+
+    def __contains__(self, index):
+        return 0 <= index < self.num_pieces and bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def add(self, index):
+        """ Đánh dấu đã có mảnh index """
+        if index not in self:
+            self.bits[index >> 3] |= 0x80 >> (index & 7)
+            self._count += 1
+
+    def __iter__(self):
+        """ Duyệt các index đang có, bỏ qua nhanh các byte rỗng """
+        for byte_index, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        yield byte_index * 8 + bit
+
+    def count(self):
+        """ Số mảnh đã có """
+        return self._count
+
+    def complete(self):
+        return self._count == self.num_pieces
+
+    def missing(self):
+        """ Danh sách các mảnh còn thiếu """
+        return [index for index in range(self.num_pieces) if index not in self]
+
+    def to_bytes(self):
+        return bytes(self.bits)
+
+    def copy(self):
+        return Bitfield(self.num_pieces, self.bits)
+
+
+def read_resume(path, info_hash, num_pieces):
+    """
+    Bitfield lưu trong file resume của path nếu size và mtime của file dữ liệu
+    vẫn khớp, ngược lại None.
+    """
+    resume_path = path + '.resume'
+    try:
+        with open(resume_path, 'rb') as file:
+            resume = bdecode(file.read())
+        stat = os.stat(path)
+        if (resume[b'info_hash'].decode() == info_hash
+                and (resume[b'size'], resume[b'mtime']) == (stat.st_size, stat.st_mtime_ns)):
+            return Bitfield(num_pieces, resume[b'bitfield'])
+    except (OSError, KeyError, ValueError, TypeError, AttributeError, DecodingError) as e:
+        if os.path.exists(resume_path):
+            print(f"Ignoring invalid resume file {resume_path}: {e}")
+    return None
+
+
+def write_resume(path, info_hash, bitfield):
+    """ Ghi file resume cho path: bitfield cùng size/mtime hiện tại của file dữ liệu """
+    stat = os.stat(path)
+    resume = {
+        'info_hash': info_hash,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'bitfield': bitfield.to_bytes(),
+    }
+    temp_path = path + '.resume.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(bencode(resume))
+    os.replace(temp_path, path + '.resume')
+
+
+class TorrentStorage:
+    """ Ghi/đọc các mảnh của torrent trực tiếp trên file đích đã cấp phát trước """
+
+    def __init__(self, path, length, piece_length):
+        self.path = path
+        self.length = length
+        self.piece_length = piece_length
+        self.num_pieces = (length + piece_length - 1) // piece_length
+        self.resume_path = path + '.resume'
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # Ghi nhận file cũ (nếu có) trước khi cấp phát để biết có cần recheck không
+        self.existing_size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        self.preallocate()
+
+    def preallocate(self):
+        """ Cấp phát trước kích thước file để các mảnh ghi vào đúng offset """
+        if os.fstat(self.fd).st_size == self.length:
+            return
+        os.ftruncate(self.fd, self.length)
+        if hasattr(os, 'posix_fallocate') and self.length:
+            try:
+                os.posix_fallocate(self.fd, 0, self.length)
+            except OSError:
+                pass  # Hệ thống file không hỗ trợ; file thưa vẫn dùng được
+
+    def piece_size(self, index):
+        """ Kích thước thật của mảnh index (mảnh cuối có thể ngắn hơn) """
+        return min(self.piece_length, self.length - index * self.piece_length)
+
+    def write(self, offset, data):
+        """ Ghi data tại offset mà không đổi vị trí con trỏ dùng chung """
+        if hasattr(os, 'pwrite'):
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(self.fd, view, offset)
+                view = view[written:]
+                offset += written
+            return
+        with self.lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            os.write(self.fd, data)
+
+    def read(self, offset, length):
+        """ Đọc length byte tại offset """
+        if hasattr(os, 'pread'):
+            return os.pread(self.fd, length, offset)
+        with self.lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, length)
+
+    def write_piece(self, index, data):
+        """ Ghi một mảnh đã kiểm tra SHA-1 vào vị trí của nó """
+        self.write(index * self.piece_length, data)
+
+    def read_piece(self, index):
+        """ Đọc lại toàn bộ mảnh index """
+        return self.read(index * self.piece_length, self.piece_size(index))
+
+    def file_state(self):
+        """ (size, mtime_ns) hiện tại của file dữ liệu """
+        stat = os.fstat(self.fd)
+        return stat.st_size, stat.st_mtime_ns
+
+    def load_resume(self, info_hash, piece_hashes):
+        """
+        Trả về Bitfield các mảnh đã xác thực.
+        Dùng file resume nếu size và mtime khớp, ngược lại hash lại file đang có.
+        """
+        have = read_resume(self.path, info_hash, self.num_pieces)
+        if have is not None:
+            return have
+        if self.existing_size == 0:
+            return Bitfield(self.num_pieces)
+        return self.recheck(piece_hashes)
+
+    def recheck(self, piece_hashes):
+        """ Hash lại các mảnh của file đang có song song trên nhiều luồng """
+        def verify(index):
+            expected = piece_hashes[index * HASH_LENGTH:(index + 1) * HASH_LENGTH]
+            return hashlib.sha1(self.read_piece(index)).digest() == expected
+
+        have = Bitfield(self.num_pieces)
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as executor:
+            for index, valid in enumerate(executor.map(verify, range(self.num_pieces))):
+                if valid:
+                    have.add(index)
+        print(f"Recheck {self.path}: {have.count()}/{self.num_pieces} pieces valid")
+        return have
+
+    def save_resume(self, info_hash, bitfield):
+        """ Lưu bitfield cùng size/mtime của file dữ liệu vào file resume """
+        os.fsync(self.fd)
+        write_resume(self.path, info_hash, bitfield)
+
+    def close(self):
+        """ Đẩy dữ liệu xuống đĩa và đóng file """
+        if self.fd is None:
+            return
+        try:
+            os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+            self.fd = None
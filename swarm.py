@@ -0,0 +1,721 @@
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+NUM_SHARDS = 16  # Số shard mặc định của ShardedSwarmStore
+ANNOUNCE_INTERVAL = 30  # Chu kỳ (giây) peer cần announce lại
+PEER_TTL = 3 * ANNOUNCE_INTERVAL  # Peer không announce trong thời gian này bị xóa
+WHEEL_GRANULARITY = 1  # Độ rộng (giây) một khe của TimeWheel
+NUMWANT = 50  # Số peer trả về mặc định cho một announce
+MAX_METADATA_BYTES = 64 * 1024 * 1024  # Tổng dung lượng metadata tracker giữ; vượt quá thì bỏ torrent ít dùng nhất
+
+
+def shard_index(info_hash, count):
+    """ Shard (trong count shard) sở hữu info_hash; ổn định giữa các tiến trình """
+    return zlib.crc32(info_hash.encode()) % count
+
+
+def peer_key(peer_id, peer_host, peer_port):
+    """ Khóa định danh một peer trong swarm """
+    return (peer_id, peer_host, peer_port)
+
+
+def peer_dict(key):
+    """ Dạng dict của peer trả về cho client """
+    return {'peer_id': key[0], 'peer_host': key[1], 'peer_port': key[2]}
+
+
+class TimeWheel:
+    """
+    Lịch hết hạn chia theo khe thời gian: thêm O(1), mỗi lần thu hồi chỉ duyệt
+    các khe đã quá hạn thay vì quét toàn bộ trạng thái.
+    Khóa được gia hạn vẫn nằm ở khe cũ; người gọi kiểm tra lại thời điểm thật.
+    """
+
+    def __init__(self, granularity=WHEEL_GRANULARITY, now=None):
+        self.granularity = granularity
+        self.slots = {}  # khe -> tập khóa hết hạn trong khe đó
+        self.cursor = self._slot(time.monotonic() if now is None else now)
+
+    def _slot(self, timestamp):
+        return int(timestamp // self.granularity)
+
+    def schedule(self, key, deadline):
+        self.slot_keys(deadline).add(key)
+
+    def slot_keys(self, deadline):
+        """ Tập khóa của khe chứa deadline, để thêm nhiều khóa cùng hạn một lúc """
+        # Làm tròn lên để không bao giờ thu hồi sớm
+        slot = max(self._slot(deadline) + 1, self.cursor)
+        return self.slots.setdefault(slot, set())
+
+    def pop_expired(self, now):
+        """ Các khóa trong mọi khe đã qua (có thể đã được gia hạn) """
+        current = self._slot(now)
+        expired = []
+        while self.cursor <= current:
+            expired.extend(self.slots.pop(self.cursor, ()))
+            self.cursor += 1
+        return expired
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.slots.values())
+
+
+class Swarm:
+    """ Các peer của một torrent, lưu theo tập để thêm/xóa/kiểm tra trong O(1) """
+
+    def __init__(self, info_hash, filename):
+        self.info_hash = info_hash
+        self.filename = filename
+        # dict dùng như tập có thứ tự: peer key -> dict trả về cho client
+        self.peers = {}
+        self.seeders = {}
+        self.leechers = {}
+        self.last_seen = {}  # peer key -> thời điểm announce gần nhất
+        self.completed = 0   # Số lần peer báo đã tải xong
+
+    def groups(self):
+        return (self.peers, self.seeders, self.leechers)
+
+    def all_peers(self):
+        """ Seeder, leecher và peer đã upload info_hash, không trùng lặp """
+        result = dict(self.peers)
+        for group in (self.seeders, self.leechers):
+            for key, peer in group.items():
+                result.setdefault(key, peer)
+        return list(result.values())
+
+    def sample(self, numwant, exclude=None):
+        """ Tối đa numwant peer chọn ngẫu nhiên, bỏ qua peer exclude """
+        if numwant <= 0:
+            return []
+        # last_seen chứa đúng các peer thuộc ít nhất một nhóm
+        keys = list(self.last_seen)
+        if numwant + 1 < len(keys):
+            keys = random.sample(keys, numwant + 1)
+        return [peer_dict(key) for key in keys if key != exclude][:numwant]
+
+    def to_dict(self):
+        return {
+            'filename': self.filename,
+            'peers': list(self.peers.values()),
+            'seeders': list(self.seeders.values()),
+            'leechers': list(self.leechers.values()),
+        }
+
+
+class SwarmStore:
+    """
+    Trạng thái của tracker với các chỉ mục:
+    info_hash -> Swarm, filename -> các info_hash, peer -> các torrent nó tham gia.
+    Mọi thao tác là O(1) hoặc O(kích thước swarm); không tự khóa, người gọi giữ lock.
+    Peer không announce lại trong ttl giây bị expire() xóa khỏi swarm.
+    """
+
+    def __init__(self, ttl=PEER_TTL):
+        self.peers = {}            # peer_id -> (peer_host, peer_port)
+        self.swarms = {}           # info_hash -> Swarm
+        self.by_filename = {}      # filename -> {info_hash: None} (giữ thứ tự đăng ký)
+        self.peer_torrents = {}    # peer key -> set(info_hash)
+        self.ttl = ttl
+        self.wheel = TimeWheel()   # hạn của (info_hash, peer key)
+        self.journal = None        # Nếu có: nhận bản ghi của mọi thay đổi (xem persistence.py)
+
+    def _log(self, *record):
+        if self.journal is not None:
+            self.journal.append(record)
+
+    # Kết nối peer
+
+    def connect(self, peer_id, peer_host, peer_port):
+        """ Đăng ký peer; trả về False nếu peer_id đã tồn tại """
+        if peer_id in self.peers:
+            return False
+        self.peers[peer_id] = (peer_host, peer_port)
+        return True
+
+    def disconnect(self, peer_id, peer_host, peer_port):
+        """ Xóa peer và mọi swarm nó tham gia; trả về 'success', 'mismatch' hoặc 'not_found' """
+        if peer_id not in self.peers:
+            return 'not_found'
+        if self.peers[peer_id] != (peer_host, peer_port):
+            return 'mismatch'
+        del self.peers[peer_id]
+        self.remove_peer(peer_key(peer_id, peer_host, peer_port))
+        return 'success'
+
+    def remove_peer(self, key):
+        """ Gỡ peer khỏi mọi swarm qua chỉ mục ngược """
+        for info_hash in self.peer_torrents.pop(key, ()):
+            swarm = self.swarms.get(info_hash)
+            if swarm is not None:
+                for group in swarm.groups():
+                    group.pop(key, None)
+                swarm.last_seen.pop(key, None)
+
+    # Torrent
+
+    def find_by_filename(self, filename):
+        """ Swarm đầu tiên đã đăng ký với filename, hoặc None """
+        info_hashes = self.by_filename.get(filename)
+        if not info_hashes:
+            return None
+        return self.swarms[next(iter(info_hashes))]
+
+    def _index_peer(self, key, swarm):
+        self.peer_torrents.setdefault(key, set()).add(swarm.info_hash)
+        now = time.monotonic()
+        swarm.last_seen[key] = now
+        self.wheel.schedule((swarm.info_hash, key), now + self.ttl)
+
+    def _unindex_peer(self, key, swarm):
+        if not any(key in group for group in swarm.groups()):
+            swarm.last_seen.pop(key, None)
+            torrents = self.peer_torrents.get(key)
+            if torrents is not None:
+                torrents.discard(swarm.info_hash)
+                if not torrents:
+                    del self.peer_torrents[key]
+
+    def add_torrent_peer(self, info_hash, filename, peer_id, peer_host, peer_port):
+        """ Lưu info_hash (tạo swarm nếu chưa có) và thêm peer chia sẻ nó """
+        swarm = self.swarms.get(info_hash)
+        if swarm is None:
+            swarm = Swarm(info_hash, filename)
+            self.swarms[info_hash] = swarm
+            self.by_filename.setdefault(filename, {})[info_hash] = None
+        key = peer_key(peer_id, peer_host, peer_port)
+        if key not in swarm.peers:
+            swarm.peers[key] = peer_dict(key)
+            self._log('A', info_hash, swarm.filename, peer_id, peer_host, peer_port)
+        self._index_peer(key, swarm)
+        return swarm
+
+    def peer_list(self, info_hash, numwant=None, exclude=None):
+        """
+        Danh sách peer của torrent, hoặc None nếu không có.
+        numwant: Nếu có, trả về tối đa numwant peer ngẫu nhiên thay vì cả swarm.
+        exclude: Peer key không đưa vào danh sách (thường là peer đang hỏi).
+        """
+        swarm = self.swarms.get(info_hash)
+        if swarm is None:
+            return None
+        if numwant is not None:
+            return swarm.sample(numwant, exclude)
+        return [peer for peer in swarm.all_peers() if exclude is None or peer_key(**peer) != exclude]
+
+    def torrent_info(self, info_hash):
+        swarm = self.swarms.get(info_hash)
+        return None if swarm is None else swarm.to_dict()
+
+    def set_state(self, info_hash, role, peer_id, peer_host, peer_port, flag):
+        """ Bắt đầu/kết thúc vai trò ('seeders'/'leechers') của peer trong swarm info_hash """
+        swarm = self.swarms.get(info_hash)
+        if swarm is None:
+            return None
+        group = swarm.seeders if role == 'seeders' else swarm.leechers
+        key = peer_key(peer_id, peer_host, peer_port)
+        if flag == 'start':
+            # Announce lại cũng gia hạn peer trong swarm
+            if key not in group:
+                group[key] = peer_dict(key)
+                self._log('S', info_hash, role, peer_id, peer_host, peer_port, flag)
+            self._index_peer(key, swarm)
+        elif flag == 'end':
+            if group.pop(key, None) is not None:
+                self._log('S', info_hash, role, peer_id, peer_host, peer_port, flag)
+                self._unindex_peer(key, swarm)
+        return swarm
+
+    def set_seeding(self, filename, peer_id, peer_host, peer_port, flag):
+        """ Bắt đầu/kết thúc seeding; trả về swarm hoặc None nếu không có filename """
+        swarm = self.find_by_filename(filename)
+        if swarm is None:
+            return None
+        return self.set_state(swarm.info_hash, 'seeders', peer_id, peer_host, peer_port, flag)
+
+    def set_leeching(self, filename, peer_id, peer_host, peer_port, flag):
+        """ Bắt đầu/kết thúc leeching; trả về swarm hoặc None nếu không có filename """
+        swarm = self.find_by_filename(filename)
+        if swarm is None:
+            return None
+        return self.set_state(swarm.info_hash, 'leechers', peer_id, peer_host, peer_port, flag)
+
+    def scrape(self, filename):
+        """ Seeder và leecher của filename, hoặc None """
+        swarm = self.find_by_filename(filename)
+        if swarm is None:
+            return None
+        return self.scrape_swarm(swarm.info_hash)
+
+    def scrape_swarm(self, info_hash):
+        """ Seeder và leecher của torrent info_hash, hoặc None """
+        swarm = self.swarms.get(info_hash)
+        if swarm is None:
+            return None
+        return {
+            'seeders': list(swarm.seeders.values()),
+            'leechers': list(swarm.leechers.values()),
+        }
+
+    def expire(self, now=None):
+        """ Xóa các peer quá ttl giây chưa announce; trả về số mục đã xóa """
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        for info_hash, key in self.wheel.pop_expired(now):
+            swarm = self.swarms.get(info_hash)
+            if swarm is None:
+                continue
+            seen = swarm.last_seen.get(key)
+            if seen is None or seen + self.ttl > now:
+                # Đã rời swarm hoặc đã được gia hạn ở khe sau
+                continue
+            self._remove_from_swarm(key, swarm)
+            evicted += 1
+        return evicted
+
+    def _remove_from_swarm(self, key, swarm):
+        if key not in swarm.last_seen:
+            return
+        for group in swarm.groups():
+            group.pop(key, None)
+        self._unindex_peer(key, swarm)
+        self._log('X', swarm.info_hash, *key)
+
+    def announce(self, info_hash, peer_id, peer_host, peer_port, left, event=None, numwant=NUMWANT):
+        """
+        Announce kiểu BitTorrent: left == 0 là seeder, ngược lại là leecher.
+        event: None, 'started', 'completed' hoặc 'stopped' (rời swarm).
+        Trả về (peers, số seeder, số leecher), hoặc None nếu torrent chưa được đăng ký.
+        """
+        swarm = self.swarms.get(info_hash)
+        if swarm is None:
+            return None
+        key = peer_key(peer_id, peer_host, peer_port)
+        if event == 'stopped':
+            self._remove_from_swarm(key, swarm)
+            peers = []
+        else:
+            role, other = ('seeders', 'leechers') if left == 0 else ('leechers', 'seeders')
+            self.set_state(info_hash, other, peer_id, peer_host, peer_port, 'end')
+            self.set_state(info_hash, role, peer_id, peer_host, peer_port, 'start')
+            if event == 'completed':
+                swarm.completed += 1
+                self._log('N', info_hash, swarm.completed)
+            peers = swarm.sample(numwant, exclude=key)
+        return peers, len(swarm.seeders), len(swarm.leechers)
+
+    def scrape_counts(self, info_hash):
+        """ (seeder, số lần hoàn tất, leecher) của torrent, hoặc None """
+        swarm = self.swarms.get(info_hash)
+        if swarm is None:
+            return None
+        return len(swarm.seeders), swarm.completed, len(swarm.leechers)
+
+    def stats(self):
+        """ (số swarm, số mục peer trong các swarm, seeder, leecher) """
+        peers = seeders = leechers = 0
+        for swarm in self.swarms.values():
+            peers += len(swarm.last_seen)
+            seeders += len(swarm.seeders)
+            leechers += len(swarm.leechers)
+        return len(self.swarms), peers, seeders, leechers
+
+    # Snapshot và phát lại nhật ký (persistence.py)
+
+    def export(self):
+        """ Trạng thái các swarm dạng list để ghi snapshot """
+        return [
+            [swarm.info_hash, swarm.filename, swarm.completed,
+             [list(key) for key in swarm.peers], [list(key) for key in swarm.seeders],
+             [list(key) for key in swarm.leechers]]
+            for swarm in self.swarms.values()
+        ]
+
+    def restore(self, info_hash, filename, completed, peers, seeders, leechers):
+        """
+        Dựng lại một swarm từ snapshot (hoặc gộp vào swarm đang có khi nhận từ
+        tracker khác trong cluster); mọi peer được tính như vừa announce.
+        """
+        swarm = self.swarms.get(info_hash)
+        if swarm is None:
+            swarm = Swarm(info_hash, filename)
+            self.swarms[info_hash] = swarm
+            self.by_filename.setdefault(filename, {})[info_hash] = None
+        swarm.completed = max(swarm.completed, completed)
+        # Như _index_peer nhưng dùng chung một thời điểm và một khe cho cả swarm
+        now = time.monotonic()
+        expiring = self.wheel.slot_keys(now + self.ttl)
+        last_seen = swarm.last_seen
+        for group, keys in zip(swarm.groups(), (peers, seeders, leechers)):
+            for peer_id, peer_host, peer_port in keys:
+                key = (peer_id, peer_host, peer_port)
+                group[key] = {'peer_id': peer_id, 'peer_host': peer_host, 'peer_port': peer_port}
+                if key not in last_seen:
+                    last_seen[key] = now
+                    self.peer_torrents.setdefault(key, set()).add(info_hash)
+                    expiring.add((info_hash, key))
+        return swarm
+
+    def drop(self, info_hash):
+        """ Xóa hẳn swarm (đã chuyển cho tracker khác); trả về swarm hoặc None """
+        swarm = self.swarms.pop(info_hash, None)
+        if swarm is None:
+            return None
+        info_hashes = self.by_filename.get(swarm.filename)
+        if info_hashes is not None:
+            info_hashes.pop(info_hash, None)
+            if not info_hashes:
+                del self.by_filename[swarm.filename]
+        for key in swarm.last_seen:
+            torrents = self.peer_torrents.get(key)
+            if torrents is not None:
+                torrents.discard(info_hash)
+                if not torrents:
+                    del self.peer_torrents[key]
+        self._log('Z', info_hash)
+        return swarm
+
+    def apply(self, record):
+        """ Phát lại một bản ghi của nhật ký ghi trước """
+        kind = record[0]
+        if kind == 'A':
+            self.add_torrent_peer(*record[1:])
+        elif kind == 'S':
+            self.set_state(*record[1:])
+        elif kind == 'X':
+            swarm = self.swarms.get(record[1])
+            if swarm is not None:
+                self._remove_from_swarm(tuple(record[2:]), swarm)
+        elif kind == 'N':
+            swarm = self.swarms.get(record[1])
+            if swarm is not None:
+                swarm.completed = record[2]
+        elif kind == 'I':
+            self.restore(*record[1:])
+        elif kind == 'Z':
+            self.drop(record[1])
+
+
+class ShardedSwarmStore:
+    """
+    Trạng thái tracker chia theo info_hash thành nhiều SwarmStore, mỗi shard một lock,
+    để các yêu cầu cho torrent khác nhau không phải chờ nhau.
+    Danh sách peer đã kết nối và chỉ mục filename -> info_hash có lock riêng.
+    Không bao giờ giữ hai lock cùng lúc nên không thể deadlock. Tự khóa bên trong.
+    """
+
+    def __init__(self, num_shards=NUM_SHARDS, ttl=PEER_TTL, lock_factory=None):
+        # lock_factory(tên nhóm lock) cho phép đo thời gian chờ/giữ lock (xem metrics.TimedLock)
+        lock_factory = lock_factory or (lambda name: threading.Lock())
+        self.shards = [SwarmStore(ttl) for _ in range(num_shards)]
+        self.shard_locks = [lock_factory('shard') for _ in range(num_shards)]
+        self.ttl = ttl
+        self.peers = {}            # peer_id -> (peer_host, peer_port)
+        self.peer_seen = {}        # peer_id -> thời điểm connect gần nhất
+        self.peer_wheel = TimeWheel()
+        self.peers_lock = lock_factory('peers')
+        self.filenames = {}        # filename -> {info_hash: None} (giữ thứ tự đăng ký)
+        self.filenames_lock = lock_factory('filenames')
+        self.journal = None
+
+    def set_journal(self, journal):
+        """ Ghi mọi thay đổi tiếp theo vào journal (thường gọi sau khi đã nạp lại trạng thái) """
+        self.journal = journal
+        for shard in self.shards:
+            shard.journal = journal
+
+    def shard_of(self, info_hash):
+        return shard_index(info_hash, len(self.shards))
+
+    def _locate(self, info_hash):
+        index = self.shard_of(info_hash)
+        return self.shards[index], self.shard_locks[index]
+
+    def _info_hash_of(self, filename):
+        with self.filenames_lock:
+            info_hashes = self.filenames.get(filename)
+            return next(iter(info_hashes)) if info_hashes else None
+
+    def connect(self, peer_id, peer_host, peer_port):
+        """
+        Đăng ký hoặc gia hạn peer; trả về False nếu peer_id đang được dùng
+        bởi một địa chỉ khác.
+        """
+        address = (peer_host, peer_port)
+        with self.peers_lock:
+            if self.peers.get(peer_id, address) != address:
+                return False
+            if peer_id not in self.peers and self.journal is not None:
+                self.journal.append(('C', peer_id, peer_host, peer_port))
+            self.peers[peer_id] = address
+            now = time.monotonic()
+            self.peer_seen[peer_id] = now
+            self.peer_wheel.schedule(peer_id, now + self.ttl)
+            return True
+
+    def disconnect(self, peer_id, peer_host, peer_port):
+        """ Xóa peer và mọi swarm nó tham gia; trả về 'success', 'mismatch' hoặc 'not_found' """
+        with self.peers_lock:
+            if peer_id not in self.peers:
+                return 'not_found'
+            if self.peers[peer_id] != (peer_host, peer_port):
+                return 'mismatch'
+            del self.peers[peer_id]
+            del self.peer_seen[peer_id]
+            if self.journal is not None:
+                self.journal.append(('D', peer_id, peer_host, peer_port))
+        self._remove_peer(peer_key(peer_id, peer_host, peer_port))
+        return 'success'
+
+    def remove_peer(self, peer_id, peer_host, peer_port):
+        """ Gỡ peer khỏi mọi swarm mà không đụng tới danh sách peer đã kết nối (peer disconnect ở tracker khác) """
+        if self.journal is not None:
+            self.journal.append(('R', peer_id, peer_host, peer_port))
+        self._remove_peer(peer_key(peer_id, peer_host, peer_port))
+
+    def _remove_peer(self, key):
+        for shard, lock in zip(self.shards, self.shard_locks):
+            with lock:
+                shard.remove_peer(key)
+
+    def add_torrent_peer(self, info_hash, filename, peer_id, peer_host, peer_port):
+        """ Lưu info_hash (tạo swarm nếu chưa có) và thêm peer chia sẻ nó """
+        shard, lock = self._locate(info_hash)
+        with lock:
+            swarm = shard.add_torrent_peer(info_hash, filename, peer_id, peer_host, peer_port)
+            filename = swarm.filename
+        with self.filenames_lock:
+            self.filenames.setdefault(filename, {}).setdefault(info_hash, None)
+        return swarm
+
+    def peer_list(self, info_hash, numwant=None, exclude=None):
+        shard, lock = self._locate(info_hash)
+        with lock:
+            return shard.peer_list(info_hash, numwant, exclude)
+
+    def torrent_info(self, info_hash):
+        shard, lock = self._locate(info_hash)
+        with lock:
+            return shard.torrent_info(info_hash)
+
+    def set_state(self, info_hash, role, peer_id, peer_host, peer_port, flag):
+        shard, lock = self._locate(info_hash)
+        with lock:
+            return shard.set_state(info_hash, role, peer_id, peer_host, peer_port, flag)
+
+    def set_seeding(self, filename, peer_id, peer_host, peer_port, flag):
+        info_hash = self._info_hash_of(filename)
+        if info_hash is None:
+            return None
+        return self.set_state(info_hash, 'seeders', peer_id, peer_host, peer_port, flag)
+
+    def set_leeching(self, filename, peer_id, peer_host, peer_port, flag):
+        info_hash = self._info_hash_of(filename)
+        if info_hash is None:
+            return None
+        return self.set_state(info_hash, 'leechers', peer_id, peer_host, peer_port, flag)
+
+    def scrape(self, filename):
+        info_hash = self._info_hash_of(filename)
+        if info_hash is None:
+            return None
+        shard, lock = self._locate(info_hash)
+        with lock:
+            return shard.scrape_swarm(info_hash)
+
+    def announce(self, info_hash, peer_id, peer_host, peer_port, left, event=None, numwant=NUMWANT):
+        shard, lock = self._locate(info_hash)
+        with lock:
+            return shard.announce(info_hash, peer_id, peer_host, peer_port, left, event, numwant)
+
+    def announce_many(self, peer_id, peer_host, peer_port, entries):
+        """
+        Announce nhiều torrent của một peer, khóa mỗi shard liên quan đúng một lần.
+        entries: Các (info_hash, filename, left, event); torrent chưa có được đăng ký
+        theo filename như /info_hash.
+        Trả về danh sách info_hash không tìm thấy (chưa đăng ký và không có filename).
+        """
+        by_shard = {}
+        for entry in entries:
+            by_shard.setdefault(self.shard_of(entry[0]), []).append(entry)
+        missing = []
+        created = []
+        for index, shard_entries in by_shard.items():
+            shard = self.shards[index]
+            with self.shard_locks[index]:
+                for info_hash, filename, left, event in shard_entries:
+                    if filename and event != 'stopped' and info_hash not in shard.swarms:
+                        shard.add_torrent_peer(info_hash, filename, peer_id, peer_host, peer_port)
+                        created.append((filename, info_hash))
+                    if shard.announce(info_hash, peer_id, peer_host, peer_port, left, event, 0) is None:
+                        missing.append(info_hash)
+        if created:
+            with self.filenames_lock:
+                for filename, info_hash in created:
+                    self.filenames.setdefault(filename, {}).setdefault(info_hash, None)
+        return missing
+
+    def scrape_counts(self, info_hash):
+        shard, lock = self._locate(info_hash)
+        with lock:
+            return shard.scrape_counts(info_hash)
+
+    def stats(self):
+        """ Tổng số swarm, peer và seeder/leecher, dùng cho /metrics """
+        with self.peers_lock:
+            connected = len(self.peers)
+        totals = [0, 0, 0, 0]
+        for shard, lock in zip(self.shards, self.shard_locks):
+            with lock:
+                for i, value in enumerate(shard.stats()):
+                    totals[i] += value
+        swarms, swarm_peers, seeders, leechers = totals
+        return {'swarms': swarms, 'connected_peers': connected, 'swarm_peers': swarm_peers,
+                'seeders': seeders, 'leechers': leechers}
+
+    def expire(self, now=None):
+        """ Xóa peer và đăng ký swarm đã quá ttl; trả về số mục đã xóa """
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        with self.peers_lock:
+            for peer_id in self.peer_wheel.pop_expired(now):
+                seen = self.peer_seen.get(peer_id)
+                if seen is not None and seen + self.ttl <= now:
+                    del self.peers[peer_id]
+                    del self.peer_seen[peer_id]
+                    if self.journal is not None:
+                        self.journal.append(('U', peer_id))
+                    evicted += 1
+        # Mỗi shard khóa riêng nên announce vào shard khác không bị chặn
+        for shard, lock in zip(self.shards, self.shard_locks):
+            with lock:
+                evicted += shard.expire(now)
+        return evicted
+
+    # Snapshot và phát lại nhật ký (persistence.py)
+
+    def export(self):
+        """
+        Trạng thái đầy đủ dạng dict để ghi snapshot. Mỗi phần được chụp dưới lock
+        của nó; thay đổi xen giữa nằm trong nhật ký và phát lại được nhiều lần.
+        """
+        with self.peers_lock:
+            peers = [[peer_id, host, port] for peer_id, (host, port) in self.peers.items()]
+        swarms = []
+        for shard, lock in zip(self.shards, self.shard_locks):
+            with lock:
+                swarms.extend(shard.export())
+        return {'peers': peers, 'swarms': swarms}
+
+    def restore(self, state):
+        """ Nạp snapshot vào store rỗng """
+        now = time.monotonic()
+        for peer_id, host, port in state['peers']:
+            self.peers[peer_id] = (host, port)
+            self.peer_seen[peer_id] = now
+            self.peer_wheel.schedule(peer_id, now + self.ttl)
+        for info_hash, filename, completed, peers, seeders, leechers in state['swarms']:
+            self.shards[self.shard_of(info_hash)].restore(
+                info_hash, filename, completed, peers, seeders, leechers)
+            self.filenames.setdefault(filename, {})[info_hash] = None
+
+    def apply(self, record):
+        """ Phát lại một bản ghi của nhật ký ghi trước """
+        kind = record[0]
+        if kind == 'C':
+            self.connect(*record[1:])
+        elif kind == 'D':
+            self.peers.pop(record[1], None)
+            self.peer_seen.pop(record[1], None)
+            self._remove_peer(tuple(record[1:]))
+        elif kind == 'U':
+            self.peers.pop(record[1], None)
+            self.peer_seen.pop(record[1], None)
+        elif kind == 'R':
+            self._remove_peer(tuple(record[1:]))
+        elif kind == 'A':
+            self.add_torrent_peer(*record[1:])
+        elif kind == 'I':
+            self.import_swarms([record[1:]])
+        elif kind == 'Z':
+            self.drop_swarms([record[1]])
+        else:
+            shard, lock = self._locate(record[1])
+            with lock:
+                shard.apply(record)
+
+    # Chuyển swarm giữa các tracker trong cluster (cluster.py)
+
+    def export_swarms(self, predicate):
+        """ Các swarm (dạng snapshot) có info_hash thỏa predicate """
+        swarms = []
+        for shard, lock in zip(self.shards, self.shard_locks):
+            with lock:
+                swarms.extend(data for data in shard.export() if predicate(data[0]))
+        return swarms
+
+    def import_swarms(self, swarms):
+        """ Nhận các swarm từ tracker khác, gộp với swarm đang có """
+        for data in swarms:
+            info_hash, filename = data[0], data[1]
+            shard, lock = self._locate(info_hash)
+            with lock:
+                shard.restore(*data)
+                shard._log('I', *data)
+            with self.filenames_lock:
+                self.filenames.setdefault(filename, {}).setdefault(info_hash, None)
+
+    def drop_swarms(self, info_hashes):
+        """ Xóa các swarm đã chuyển đi """
+        for info_hash in info_hashes:
+            shard, lock = self._locate(info_hash)
+            with lock:
+                swarm = shard.drop(info_hash)
+            if swarm is None:
+                continue
+            with self.filenames_lock:
+                info_hashes_of_file = self.filenames.get(swarm.filename)
+                if info_hashes_of_file is not None:
+                    info_hashes_of_file.pop(info_hash, None)
+                    if not info_hashes_of_file:
+                        del self.filenames[swarm.filename]
+
+
+class MetadataStore:
+    """
+    Metadata (dict info bencode) theo info_hash do peer chia sẻ gửi lên, để peer
+    chỉ biết info_hash lấy được torrent. Chỉ là cache trong bộ nhớ, giới hạn tổng
+    dung lượng (bỏ mục ít dùng nhất); không ghi nhật ký vì các peer vẫn giữ bản gốc.
+    """
+
+    def __init__(self, max_bytes=MAX_METADATA_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # info_hash -> metadata, mục dùng gần nhất ở cuối
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def add(self, info_hash, metadata):
+        with self.lock:
+            old = self.entries.pop(info_hash, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[info_hash] = metadata
+            self.size += len(metadata)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get(self, info_hash):
+        with self.lock:
+            metadata = self.entries.get(info_hash)
+            if metadata is not None:
+                self.entries.move_to_end(info_hash)
+            return metadata
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
@@ -0,0 +1,70 @@
+import unittest
+
+from cluster import HashRing, TrackerCluster
+from swarm import ShardedSwarmStore
+
+# Port 1 từ chối kết nối ngay nên không có yêu cầu nào bị treo
+MEMBERS = [f'http://127.0.0.1:1/{name}' for name in ('a', 'b', 'c', 'd')]
+KEYS = ['%040x' % number for number in range(2000)]
+
+
+class HashRingTest(unittest.TestCase):
+
+    def test_empty_ring_has_no_owner(self):
+        self.assertIsNone(HashRing().owner(KEYS[0]))
+
+    def test_ownership_is_deterministic(self):
+        first, second = HashRing(MEMBERS), HashRing(reversed(MEMBERS))
+        self.assertEqual([first.owner(key) for key in KEYS], [second.owner(key) for key in KEYS])
+
+    def test_keys_are_spread_over_members(self):
+        ring = HashRing(MEMBERS)
+        counts = {member: 0 for member in MEMBERS}
+        for key in KEYS:
+            counts[ring.owner(key)] += 1
+        # Với 64 điểm ảo mỗi tracker, không tracker nào giữ quá gấp đôi phần đều
+        self.assertLess(max(counts.values()), 2 * len(KEYS) / len(MEMBERS))
+        self.assertGreater(min(counts.values()), 0)
+
+    def test_adding_a_member_only_moves_keys_to_it(self):
+        before = HashRing(MEMBERS[:3])
+        after = HashRing(MEMBERS)
+        moved = [key for key in KEYS if before.owner(key) != after.owner(key)]
+        self.assertTrue(moved)
+        self.assertTrue(all(after.owner(key) == MEMBERS[3] for key in moved))
+
+
+class MembershipTest(unittest.TestCase):
+
+    def make(self, self_url):
+        return TrackerCluster(self_url, MEMBERS[:3], ShardedSwarmStore(num_shards=1))
+
+    def test_newer_version_replaces_the_member_list(self):
+        cluster = self.make(MEMBERS[0])
+        self.assertTrue(cluster.set_members(MEMBERS, 1))
+        self.assertEqual(cluster.to_dict(), {'members': MEMBERS, 'version': 1})
+        self.assertFalse(cluster.set_members(MEMBERS[:2], 0))
+        self.assertFalse(cluster.set_members(MEMBERS, 1))
+        self.assertEqual(cluster.members, MEMBERS)
+
+    def test_concurrent_changes_with_the_same_version_converge(self):
+        # a thêm d trong khi b loại c: cả hai phát version 1 với danh sách khác nhau
+        joined = (MEMBERS, 1)
+        dropped = (MEMBERS[:2], 1)
+        a, b = self.make(MEMBERS[0]), self.make(MEMBERS[1])
+        a.set_members(*joined)
+        b.set_members(*dropped)
+        a.set_members(*dropped)
+        b.set_members(*joined)
+        self.assertEqual(a.to_dict(), b.to_dict())
+        self.assertEqual(a.ring.owners, b.ring.owners)
+
+    def test_member_order_does_not_matter(self):
+        cluster = self.make(MEMBERS[0])
+        cluster.set_members(list(reversed(MEMBERS)), 1)
+        self.assertFalse(cluster.set_members(MEMBERS, 1))
+        self.assertEqual(cluster.members, MEMBERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import time
+import unittest
+
+from dht import (
+    ID_LENGTH, NODE_FAILURES, DHTNode, PeerStorage, RoutingTable, TokenStore, pack_nodes, unpack_nodes,
+)
+
+SELF_ID = bytes(ID_LENGTH)
+INFO_HASH = b'\x12' * ID_LENGTH
+
+
+def node_id(number, top=0x80):
+    """ ID có byte đầu là top, tức rơi vào bucket 159 nếu top có bit cao nhất """
+    return bytes([top]) + number.to_bytes(ID_LENGTH - 1, 'big')
+
+
+class CompactNodesTest(unittest.TestCase):
+
+    def test_round_trip_skips_non_ipv4(self):
+        nodes = [(node_id(1), ('10.0.0.1', 6881)), (node_id(2), ('::1', 6882)), (node_id(3), ('10.0.0.3', 1))]
+        self.assertEqual(unpack_nodes(pack_nodes(nodes)), [nodes[0], nodes[2]])
+
+    def test_garbage_and_trailing_bytes_are_ignored(self):
+        self.assertEqual(unpack_nodes(None), [])
+        self.assertEqual(unpack_nodes(b'\0' * 29), [(bytes(ID_LENGTH), ('0.0.0.0', 0))])
+
+
+class RoutingTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = RoutingTable(SELF_ID, k=2)
+
+    def test_bucket_index(self):
+        self.assertEqual(self.table.bucket_index(SELF_ID), -1)
+        self.assertEqual(self.table.bucket_index(node_id(1)), 159)
+        self.assertEqual(self.table.bucket_index(node_id(1, top=0)), 0)
+        self.assertFalse(self.table.update(SELF_ID, ('10.0.0.1', 1)))
+
+    def test_full_bucket_keeps_live_nodes(self):
+        self.assertTrue(self.table.update(node_id(1), ('10.0.0.1', 1)))
+        self.assertTrue(self.table.update(node_id(2), ('10.0.0.2', 1)))
+        self.assertFalse(self.table.update(node_id(3), ('10.0.0.3', 1)))
+        self.assertTrue(self.table.update(node_id(1), ('10.0.0.9', 1)))
+        self.assertEqual(len(self.table), 2)
+
+    def test_failed_node_is_replaced(self):
+        self.table.update(node_id(1), ('10.0.0.1', 1))
+        self.table.update(node_id(2), ('10.0.0.2', 1))
+        for _ in range(NODE_FAILURES):
+            self.table.failed(node_id(2))
+        self.assertNotIn(node_id(2), dict(self.table.closest(SELF_ID)))
+        self.assertTrue(self.table.update(node_id(3), ('10.0.0.3', 1)))
+        self.assertEqual(sorted(dict(self.table.closest(SELF_ID))), [node_id(1), node_id(3)])
+
+    def test_closest_orders_by_xor_distance(self):
+        table = RoutingTable(SELF_ID)
+        ids = [node_id(number, top) for top in (0x80, 0x40, 0x01) for number in (1, 2)]
+        for number, each in enumerate(ids):
+            table.update(each, ('10.0.0.%d' % number, 1))
+        self.assertEqual([each for each, _ in table.closest(node_id(2, 0x40), 3)],
+                         [node_id(2, 0x40), node_id(1, 0x40), node_id(2, 0x01)])
+
+    def test_random_id_falls_in_the_bucket(self):
+        for index in (0, 1, 37, 159):
+            self.assertEqual(self.table.bucket_index(self.table.random_id(index)), index)
+
+    def test_stale_buckets(self):
+        self.table.update(node_id(1), ('10.0.0.1', 1))
+        now = time.monotonic()
+        self.assertEqual(self.table.stale_buckets(now), [])
+        self.assertEqual(self.table.stale_buckets(now + 10 ** 6), [159])
+
+
+class TokenStoreTest(unittest.TestCase):
+
+    def test_token_is_bound_to_the_ip(self):
+        tokens = TokenStore()
+        token = tokens.issue('10.0.0.1')
+        self.assertTrue(tokens.valid('10.0.0.1', token))
+        self.assertFalse(tokens.valid('10.0.0.2', token))
+        self.assertFalse(tokens.valid('10.0.0.1', 'text'))
+
+    def test_token_survives_one_rotation_only(self):
+        tokens = TokenStore(interval=60)
+        token = tokens.issue('10.0.0.1')
+        tokens.rotated -= 60
+        self.assertTrue(tokens.valid('10.0.0.1', token))
+        self.assertNotEqual(tokens.issue('10.0.0.1'), token)
+        tokens.rotated -= 60
+        self.assertFalse(tokens.valid('10.0.0.1', token))
+
+
+class PeerStorageTest(unittest.TestCase):
+
+    def test_least_recently_announced_hash_is_dropped(self):
+        storage = PeerStorage(max_hashes=2)
+        storage.add(b'a', ('10.0.0.1', 1), now=0)
+        storage.add(b'b', ('10.0.0.1', 1), now=0)
+        storage.add(b'a', ('10.0.0.2', 1), now=0)
+        storage.add(b'c', ('10.0.0.1', 1), now=0)
+        self.assertEqual(storage.get(b'b', now=0), [])
+        self.assertEqual(len(storage.get(b'a', now=0)), 2)
+        self.assertEqual(len(storage), 3)
+
+    def test_peers_per_hash_are_capped(self):
+        storage = PeerStorage(max_peers=3)
+        for number in range(5):
+            storage.add(INFO_HASH, ('10.0.0.%d' % number, 1), now=0)
+        self.assertEqual(sorted(storage.get(INFO_HASH, now=0)), [('10.0.0.%d' % number, 1) for number in (2, 3, 4)])
+        self.assertEqual(len(storage.get(INFO_HASH, count=2, now=0)), 2)
+
+    def test_peers_expire_unless_announced_again(self):
+        storage = PeerStorage(expiry=10)
+        storage.add(INFO_HASH, ('10.0.0.1', 1), now=0)
+        storage.add(INFO_HASH, ('10.0.0.2', 1), now=0)
+        storage.add(INFO_HASH, ('10.0.0.1', 1), now=5)
+        self.assertEqual(storage.get(INFO_HASH, now=12), [('10.0.0.1', 1)])
+        storage.expire(now=15)
+        self.assertEqual(len(storage), 0)
+        self.assertEqual(storage.table, {})
+
+
+class DHTNodeTest(unittest.TestCase):
+    """ Vài node thật trên loopback """
+
+    def start_node(self):
+        node = DHTNode('127.0.0.1').start()
+        self.addCleanup(node.close)
+        return node
+
+    def test_announce_then_get_peers(self):
+        nodes = [self.start_node() for _ in range(4)]
+        seed = nodes[0].sock.getsockname()
+        for node in nodes[1:]:
+            self.assertGreater(node.bootstrap([seed]), 0)
+        self.assertGreater(nodes[1].announce_peer(INFO_HASH, 6881), 0)
+        self.assertIn(('127.0.0.1', 6881), nodes[3].get_peers(INFO_HASH))
+
+    def test_malformed_datagrams_are_dropped(self):
+        node = self.start_node()
+        address = ('127.0.0.1', 9)
+        for data in (b'', b'garbage', b'le', b'd1:y1:qe', b'd1:t1:a1:y1:q1:q4:pinge',
+                     b'd1:ad2:id3:abce1:t1:a1:y1:q1:q4:pinge'):
+            node.handle_datagram(data, address)
+        self.assertEqual(len(node.table), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import socket
+import struct
+import unittest
+
+from bencodepy import encode as bencode
+
+from message.peer2peer import (
+    HANDSHAKE_LENGTH, MAX_MESSAGE_LENGTH, PIECE, REQUEST, ProtocolError,
+    build_handshake, build_message, build_piece_header, decode_peer_id, encode_peer_id,
+    parse_handshake, read_handshake, read_message, read_message_async, recv_exact, send_message,
+    pack_have, unpack_have, pack_request, unpack_request, unpack_piece,
+    MAX_METADATA_SIZE, METADATA_PIECE_SIZE, PexState, pack_pex, unpack_pex,
+    metadata_piece_count, pack_metadata_request, unpack_metadata_request,
+    pack_metadata_piece, unpack_metadata_piece, verify_metadata,
+)
+
+INFO_HASH = 'ab' * 20
+
+
+def read_async(data):
+    """ Đọc một thông điệp từ StreamReader đã có sẵn data """
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_message_async(reader)
+    return asyncio.run(read())
+
+
+class FramingTest(unittest.TestCase):
+    """ Handshake và thông điệp <length:4><id:1><payload> """
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_handshake_round_trip(self):
+        data = build_handshake(INFO_HASH, 'peer-1')
+        self.assertEqual(len(data), HANDSHAKE_LENGTH)
+        self.left.sendall(data)
+        self.assertEqual(read_handshake(self.right), (INFO_HASH, 'peer-1'))
+
+    def test_handshake_rejects_unknown_protocol(self):
+        data = bytearray(build_handshake(INFO_HASH, 'peer-1'))
+        data[1] ^= 0xff
+        with self.assertRaises(ProtocolError):
+            parse_handshake(bytes(data))
+
+    def test_peer_id_is_padded_and_truncated_to_20_bytes(self):
+        self.assertEqual(encode_peer_id('abc'), b'abc' + b'\0' * 17)
+        self.assertEqual(len(encode_peer_id('x' * 30)), 20)
+        self.assertEqual(decode_peer_id(encode_peer_id('abc')), 'abc')
+
+    def test_messages_are_read_back_in_order(self):
+        send_message(self.left, REQUEST, pack_request(1, 2, 3))
+        send_message(self.left, PIECE, b'data')
+        self.assertEqual(read_message(self.right), (REQUEST, pack_request(1, 2, 3)))
+        self.assertEqual(read_message(self.right), (PIECE, b'data'))
+
+    def test_keep_alive(self):
+        self.left.sendall(b'\0\0\0\0')
+        self.assertEqual(read_message(self.right), (None, b''))
+        self.assertEqual(read_async(b'\0\0\0\0'), (None, b''))
+
+    def test_oversized_length_is_rejected(self):
+        data = struct.pack('>I', MAX_MESSAGE_LENGTH + 1)
+        self.left.sendall(data)
+        with self.assertRaises(ProtocolError):
+            read_message(self.right)
+        with self.assertRaises(ProtocolError):
+            read_async(data)
+
+    def test_async_reader_matches_socket_reader(self):
+        self.assertEqual(read_async(build_message(PIECE, b'payload')), (PIECE, b'payload'))
+
+    def test_recv_exact_raises_when_peer_closes(self):
+        self.left.sendall(b'abc')
+        self.left.close()
+        with self.assertRaises(ConnectionError):
+            recv_exact(self.right, 4)
+
+
+class PayloadTest(unittest.TestCase):
+    """ Payload HAVE, REQUEST/CANCEL và PIECE """
+
+    def test_have_round_trip(self):
+        self.assertEqual(unpack_have(pack_have(42)), 42)
+        with self.assertRaises(ProtocolError):
+            unpack_have(b'\0\0')
+
+    def test_request_round_trip(self):
+        self.assertEqual(unpack_request(pack_request(7, 16384, 16384)), (7, 16384, 16384))
+        with self.assertRaises(ProtocolError):
+            unpack_request(pack_request(7, 0, 1)[:-1])
+
+    def test_piece_header_frames_the_block(self):
+        block = b'x' * 100
+        message = build_piece_header(3, 16384, len(block)) + block
+        length = struct.unpack_from('>I', message)[0]
+        self.assertEqual(length, len(message) - 4)
+        self.assertEqual(message[4], PIECE)
+        self.assertEqual(unpack_piece(message[5:]), (3, 16384, block))
+
+    def test_short_piece_is_rejected(self):
+        with self.assertRaises(ProtocolError):
+            unpack_piece(b'\0' * 7)
+
+
+def make_info(**fields):
+    """ Dict info hợp lệ của một file 40000 byte, mảnh 16384 byte """
+    info = {'name': 'file.bin', 'length': 40000, 'piece length': 16384, 'pieces': b'h' * 60}
+    info.update(fields)
+    metadata = bencode(info)
+    return hashlib.sha1(metadata).hexdigest(), metadata
+
+
+class PexTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        added = [('10.0.0.1', 6881), ('::1', 6882)]
+        self.assertEqual(unpack_pex(pack_pex(added, [('10.0.0.2', 1)], port=7000)),
+                         (added, [('10.0.0.2', 1)], 7000))
+        self.assertEqual(unpack_pex(pack_pex([], []))[2], None)
+
+    def test_malformed_payload(self):
+        for payload in (b'garbage', b'le', bencode({'added': b'', 'port': 70000})):
+            with self.assertRaises(ProtocolError):
+                unpack_pex(payload)
+
+    def test_state_sends_only_changes(self):
+        state = PexState()
+        self.assertTrue(state.due(0))
+        self.assertEqual(state.delta({('a', 1)}, 0), ([('a', 1)], []))
+        self.assertFalse(state.due(1))
+        self.assertEqual(state.delta({('b', 1)}, 10), ([('b', 1)], [('a', 1)]))
+        self.assertEqual(state.delta({('b', 1)}, 20), ([], []))
+
+
+class MetadataTest(unittest.TestCase):
+    """ Trao đổi metadata: chia mảnh và kiểm tra dict info nhận được """
+
+    def test_piece_count(self):
+        self.assertEqual(metadata_piece_count(0), 1)
+        self.assertEqual(metadata_piece_count(METADATA_PIECE_SIZE), 1)
+        self.assertEqual(metadata_piece_count(METADATA_PIECE_SIZE + 1), 2)
+
+    def test_request_round_trip(self):
+        self.assertEqual(unpack_metadata_request(pack_metadata_request(3)), 3)
+        with self.assertRaises(ProtocolError):
+            unpack_metadata_request(b'\0\0\0')
+
+    def test_pieces_reassemble_the_metadata(self):
+        metadata = bytes(range(256)) * 100
+        pieces = [unpack_metadata_piece(pack_metadata_piece(metadata, index))
+                  for index in range(metadata_piece_count(len(metadata)))]
+        self.assertEqual([(index, size) for index, size, _ in pieces], [(0, len(metadata)), (1, len(metadata))])
+        self.assertEqual(b''.join(data for _, _, data in pieces), metadata)
+        self.assertIsNone(pack_metadata_piece(metadata, 2))
+
+    def test_malformed_or_oversized_piece(self):
+        with self.assertRaises(ProtocolError):
+            unpack_metadata_piece(b'\0' * 7)
+        with self.assertRaises(ProtocolError):
+            unpack_metadata_piece(struct.pack('>II', 0, MAX_METADATA_SIZE + 1))
+
+    def test_verify_valid_metadata(self):
+        info_hash, metadata = make_info()
+        self.assertEqual(verify_metadata(info_hash, metadata)[b'length'], 40000)
+        self.assertIsNotNone(verify_metadata(*make_info(length=0, pieces=b'')))
+
+    def test_verify_rejects_a_hash_mismatch(self):
+        _, metadata = make_info()
+        self.assertIsNone(verify_metadata('00' * 20, metadata))
+        self.assertIsNone(verify_metadata(*make_info(length=b'40000')))
+
+    def test_verify_rejects_bad_sizes(self):
+        for fields in ({'piece length': 0}, {'piece length': -1}, {'length': -1, 'pieces': b''},
+                       {'pieces': b'h' * 40}, {'pieces': b'h' * 61}):
+            self.assertIsNone(verify_metadata(*make_info(**fields)), fields)
+
+    def test_verify_rejects_path_like_names(self):
+        for name in ('', '.', '..', '../evil', 'dir/file', 'dir\\file'):
+            self.assertIsNone(verify_metadata(*make_info(name=name)), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+import unittest
+
+from persistence import StateJournal
+from swarm import ShardedSwarmStore
+
+HASH_A = 'aa' * 20
+HASH_B = 'bb' * 20
+
+
+def normalized(store):
+    """ export() không phụ thuộc thứ tự, để so sánh hai store """
+    state = store.export()
+    return (sorted(map(tuple, state['peers'])),
+            sorted((info_hash, filename, completed,
+                    sorted(map(tuple, peers)), sorted(map(tuple, seeders)), sorted(map(tuple, leechers)))
+                   for info_hash, filename, completed, peers, seeders, leechers in state['swarms']))
+
+
+class StateJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store, self.journal = self.open()
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+    def open(self):
+        store = ShardedSwarmStore(num_shards=4)
+        journal = StateJournal(self.directory.name)
+        journal.load(store)
+        store.set_journal(journal)
+        return store, journal
+
+    def reload(self):
+        store = ShardedSwarmStore(num_shards=4)
+        replayed = StateJournal(self.directory.name).load(store)
+        return store, replayed
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory.name) if name.startswith('wal.'))
+
+    def populate(self):
+        store = self.store
+        store.connect('p1', '10.0.0.1', 6881)
+        store.connect('p2', '10.0.0.2', 6881)
+        store.add_torrent_peer(HASH_A, 'a.bin', 'p1', '10.0.0.1', 6881)
+        store.announce(HASH_A, 'p2', '10.0.0.2', 6881, 10, 'started')
+        store.announce(HASH_A, 'p2', '10.0.0.2', 6881, 0, 'completed')
+        store.add_torrent_peer(HASH_B, 'b.bin', 'p2', '10.0.0.2', 6881)
+        store.set_seeding('b.bin', 'p1', '10.0.0.1', 6881, 'start')
+
+    def test_log_replay_restores_the_state(self):
+        self.populate()
+        self.store.disconnect('p1', '10.0.0.1', 6881)
+        self.journal.flush()
+        restored, replayed = self.reload()
+        self.assertGreater(replayed, 0)
+        self.assertEqual(normalized(restored), normalized(self.store))
+        self.assertEqual(restored.scrape_counts(HASH_A), (1, 1, 0))
+
+    def test_torn_last_line_is_skipped(self):
+        self.populate()
+        self.journal.flush()
+        expected = normalized(self.store)
+        self.journal.close()
+        with open(os.path.join(self.directory.name, self.segments()[-1]), 'a') as file:
+            file.write('["A","cc')
+        restored, _ = self.reload()
+        self.assertEqual(normalized(restored), expected)
+
+        # Tracker khởi động lại ghi tiếp vào đoạn mới, không nối sau dòng ghi dở
+        self.store, self.journal = self.open()
+        self.store.add_torrent_peer('cc' * 20, 'c.bin', 'p3', '10.0.0.3', 6881)
+        self.journal.flush()
+        self.assertEqual(len(self.segments()), 2)
+        restored, _ = self.reload()
+        self.assertIsNotNone(restored.torrent_info('cc' * 20))
+
+    def test_snapshot_plus_tail(self):
+        self.populate()
+        self.journal.snapshot(self.store)
+        self.assertEqual(self.segments(), [])
+        self.store.announce(HASH_B, 'p3', '10.0.0.3', 6881, 5, 'started')
+        self.store.announce(HASH_A, 'p2', '10.0.0.2', 6881, 0, 'stopped')
+        self.journal.flush()
+        restored, replayed = self.reload()
+        self.assertEqual(replayed, self.journal.records_since_snapshot)
+        self.assertEqual(normalized(restored), normalized(self.store))
+
+    def test_replaying_records_twice_is_idempotent(self):
+        # Bản ghi xen giữa lúc chụp snapshot có thể vừa nằm trong snapshot vừa nằm trong nhật ký
+        self.populate()
+        self.journal.flush()
+        with open(os.path.join(self.directory.name, self.segments()[-1])) as file:
+            records = [json.loads(line) for line in file]
+        self.journal.snapshot(self.store)
+        restored, _ = self.reload()
+        for record in records:
+            restored.apply(record)
+        self.assertEqual(normalized(restored), normalized(self.store))
+
+    def test_fsync_option(self):
+        journal = StateJournal(os.path.join(self.directory.name, 'synced'), fsync=True)
+        store = ShardedSwarmStore(num_shards=1)
+        store.set_journal(journal)
+        store.add_torrent_peer(HASH_A, 'a.bin', 'p1', '10.0.0.1', 6881)
+        journal.flush()
+        journal.snapshot(store)
+        journal.close()
+        restored = ShardedSwarmStore(num_shards=1)
+        StateJournal(os.path.join(self.directory.name, 'synced')).load(restored)
+        self.assertEqual(normalized(restored), normalized(store))
+
+
+if __name__ == '__main__':
+    unittest.main()
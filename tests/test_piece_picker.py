@@ -0,0 +1,124 @@
+import unittest
+
+from piece_picker import BLOCK_SIZE, PiecePicker
+from storage import Bitfield
+
+
+def make_picker(num_pieces, have=(), piece_size=BLOCK_SIZE):
+    bitfield = Bitfield(num_pieces)
+    for index in have:
+        bitfield.add(index)
+    return PiecePicker(num_pieces, bitfield, lambda index: piece_size)
+
+
+class RarestFirstTest(unittest.TestCase):
+
+    def test_rarest_piece_is_started_first(self):
+        picker = make_picker(3)
+        picker.add_pieces([0, 1, 2])
+        picker.add_pieces([0, 2])
+        picker.add_pieces([2])
+        everything = Bitfield.full(3)
+        order = [picker.pick_blocks('peer', everything, 1)[0][0] for _ in range(3)]
+        self.assertEqual(order, [1, 0, 2])
+
+    def test_only_pieces_the_peer_has_are_picked(self):
+        picker = make_picker(3)
+        picker.add_pieces([0, 1, 2])
+        peer_have = Bitfield(3)
+        peer_have.add(2)
+        self.assertEqual(picker.pick_blocks('peer', peer_have, 5), [(2, 0, BLOCK_SIZE)])
+        self.assertEqual(picker.pick_blocks('peer', peer_have, 5), [])
+
+    def test_pieces_already_downloaded_are_skipped(self):
+        picker = make_picker(3, have=[0, 1])
+        picker.add_pieces([0, 1, 2])
+        self.assertEqual(picker.remaining, 1)
+        self.assertEqual(picker.pick_blocks('peer', Bitfield.full(3), 5), [(2, 0, BLOCK_SIZE)])
+
+    def test_disconnect_lowers_availability(self):
+        picker = make_picker(2)
+        picker.add_pieces([0, 1])
+        picker.add_pieces([0])
+        # Peer có mảnh 0 ngắt kết nối: mảnh 1 giờ phổ biến hơn
+        picker.remove_pieces([0])
+        picker.add_pieces([1])
+        self.assertEqual(picker.pick_blocks('peer', Bitfield.full(2), 1)[0][0], 0)
+
+    def test_piece_nobody_has_is_never_started(self):
+        picker = make_picker(2)
+        picker.add_pieces([1])
+        picker.remove_pieces([1])
+        self.assertEqual(picker.pick_blocks('peer', Bitfield.full(2), 5), [])
+
+
+class BlockTest(unittest.TestCase):
+
+    def setUp(self):
+        # Hai mảnh, mỗi mảnh 2,5 block
+        self.size = 2 * BLOCK_SIZE + BLOCK_SIZE // 2
+        self.picker = make_picker(2, piece_size=self.size)
+        self.picker.add_pieces([0, 1])
+        self.only_first = Bitfield(2)
+        self.only_first.add(0)
+
+    def receive(self, peer, blocks):
+        results = [self.picker.on_block(peer, index, begin, b'x' * length) for index, begin, length in blocks]
+        return results[-1]
+
+    def test_piece_is_split_into_blocks(self):
+        blocks = self.picker.pick_blocks('a', self.only_first, 10)
+        self.assertEqual(blocks, [(0, 0, BLOCK_SIZE), (0, BLOCK_SIZE, BLOCK_SIZE),
+                                  (0, 2 * BLOCK_SIZE, BLOCK_SIZE // 2)])
+
+    def test_piece_is_returned_when_all_blocks_arrive(self):
+        blocks = self.picker.pick_blocks('a', self.only_first, 10)
+        self.assertEqual(self.receive('a', blocks[:2]), (None, None))
+        self.assertFalse(self.picker.is_received(0, 2 * BLOCK_SIZE))
+        data, sources = self.receive('a', blocks[2:])
+        self.assertEqual(len(data), self.size)
+        self.assertEqual(sources, {'a'})
+        self.assertTrue(self.picker.is_received(0, 0))
+
+    def test_malformed_blocks_are_ignored(self):
+        self.picker.pick_blocks('a', self.only_first, 10)
+        self.assertEqual(self.picker.on_block('a', 0, 1, b'x' * BLOCK_SIZE), (None, None))
+        self.assertEqual(self.picker.on_block('a', 0, 0, b'x'), (None, None))
+        self.assertEqual(self.picker.on_block('a', 1, 0, b'x' * BLOCK_SIZE), (None, None))
+        self.assertFalse(self.picker.is_received(0, 0))
+
+    def test_aborted_blocks_go_to_another_peer(self):
+        blocks = self.picker.pick_blocks('a', self.only_first, 2)
+        self.picker.abort_blocks('a', blocks)
+        self.assertEqual(sorted(self.picker.pick_blocks('b', self.only_first, 3)), sorted(
+            blocks + [(0, 2 * BLOCK_SIZE, BLOCK_SIZE // 2)]))
+
+    def test_endgame_requests_outstanding_blocks_again(self):
+        everything = Bitfield.full(2)
+        first = self.picker.pick_blocks('a', everything, 6)
+        self.assertTrue(self.picker.endgame)
+        self.assertEqual(self.picker.pick_blocks('a', everything, 6), [])
+        # Peer khác yêu cầu trùng các block a chưa gửi, trừ block đã nhận
+        self.picker.on_block('a', *first[0][:2], b'x' * first[0][2])
+        duplicates = self.picker.pick_blocks('b', everything, 10)
+        self.assertEqual(sorted(duplicates), sorted(first[1:]))
+        # Block tới từ peer nào trước cũng được nhận một lần
+        self.assertEqual(self.picker.on_block('b', *first[1][:2], b'x' * first[1][2]), (None, None))
+        self.assertEqual(self.picker.on_block('a', *first[1][:2], b'x' * first[1][2]), (None, None))
+        self.assertTrue(self.picker.is_received(*first[1][:2]))
+
+    def test_failed_piece_is_downloaded_again(self):
+        blocks = self.picker.pick_blocks('a', self.only_first, 10)
+        data, _ = self.receive('a', blocks)
+        self.assertIsNotNone(data)
+        self.picker.piece_failed(0)
+        self.assertFalse(self.picker.endgame)
+        self.assertEqual(self.picker.pick_blocks('b', self.only_first, 10), blocks)
+
+    def test_complete_counts_down_remaining_pieces(self):
+        self.assertEqual(self.picker.complete(0), 1)
+        self.assertEqual(self.picker.complete(1), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
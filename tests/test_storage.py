@@ -0,0 +1,139 @@
+import contextlib
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+from storage import Bitfield, TorrentStorage, read_resume, write_resume
+
+INFO_HASH = 'cd' * 20
+
+
+class BitfieldTest(unittest.TestCase):
+
+    def test_bit_order_matches_the_wire_format(self):
+        bitfield = Bitfield(10)
+        bitfield.add(0)
+        bitfield.add(9)
+        self.assertEqual(bitfield.to_bytes(), b'\x80\x40')
+        self.assertEqual(list(bitfield), [0, 9])
+
+    def test_spare_bits_are_dropped(self):
+        bitfield = Bitfield(10, b'\xff\xff')
+        self.assertEqual(bitfield.count(), 10)
+        self.assertTrue(bitfield.complete())
+        self.assertNotIn(10, bitfield)
+        self.assertEqual(bitfield.to_bytes(), b'\xff\xc0')
+
+    def test_add_counts_each_piece_once(self):
+        bitfield = Bitfield(5)
+        bitfield.add(3)
+        bitfield.add(3)
+        self.assertEqual(bitfield.count(), 1)
+        self.assertEqual(bitfield.missing(), [0, 1, 2, 4])
+
+    def test_out_of_range_index_is_not_contained(self):
+        bitfield = Bitfield.full(4)
+        self.assertIn(3, bitfield)
+        self.assertNotIn(-1, bitfield)
+        self.assertNotIn(4, bitfield)
+
+    def test_copy_is_independent(self):
+        bitfield = Bitfield(8)
+        copy = bitfield.copy()
+        copy.add(1)
+        self.assertEqual(bitfield.count(), 0)
+        self.assertEqual(copy.count(), 1)
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'data.bin')
+        with open(self.path, 'wb') as file:
+            file.write(b'a' * 100)
+        self.bitfield = Bitfield(4)
+        self.bitfield.add(1)
+        self.bitfield.add(3)
+        write_resume(self.path, INFO_HASH, self.bitfield)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self, info_hash=INFO_HASH):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return read_resume(self.path, info_hash, 4)
+
+    def test_round_trip(self):
+        self.assertEqual(list(self.read()), [1, 3])
+
+    def test_other_torrent_is_ignored(self):
+        self.assertIsNone(self.read('ef' * 20))
+
+    def test_modified_file_is_ignored(self):
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertIsNone(self.read())
+
+    def test_resized_file_is_ignored(self):
+        with open(self.path, 'ab') as file:
+            file.write(b'b')
+        self.assertIsNone(self.read())
+
+    def test_corrupt_resume_file_is_ignored(self):
+        with open(self.path + '.resume', 'wb') as file:
+            file.write(b'not bencode')
+        self.assertIsNone(self.read())
+
+    def test_missing_resume_file(self):
+        os.remove(self.path + '.resume')
+        self.assertIsNone(self.read())
+
+
+class TorrentStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'out', 'file.bin')
+        self.pieces = [b'a' * 16, b'b' * 16, b'c' * 8]
+        self.hashes = b''.join(hashlib.sha1(piece).digest() for piece in self.pieces)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open(self):
+        return TorrentStorage(self.path, 40, 16)
+
+    def test_pieces_are_written_at_their_offsets(self):
+        storage = self.open()
+        self.assertEqual(os.path.getsize(self.path), 40)
+        storage.write_piece(2, self.pieces[2])
+        storage.write_piece(0, self.pieces[0])
+        self.assertEqual(storage.piece_size(2), 8)
+        self.assertEqual(storage.read_piece(2), self.pieces[2])
+        self.assertEqual(storage.read_piece(0), self.pieces[0])
+        storage.close()
+
+    def test_stale_resume_file_falls_back_to_recheck(self):
+        storage = self.open()
+        storage.write_piece(0, self.pieces[0])
+        storage.write_piece(1, self.pieces[1])
+        have = Bitfield(3)
+        have.add(0)
+        storage.save_resume(INFO_HASH, have)
+        storage.close()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(list(self.open().load_resume(INFO_HASH, self.hashes)), [0])
+            # Ghi thêm sau khi lưu resume: bitfield cũ không còn đúng, phải hash lại
+            storage = self.open()
+            storage.write_piece(2, self.pieces[2])
+            os.utime(self.path, ns=(0, 1))
+            storage.close()
+            self.assertEqual(list(self.open().load_resume(INFO_HASH, self.hashes)), [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
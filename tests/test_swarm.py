@@ -0,0 +1,177 @@
+import time
+import unittest
+
+from swarm import ShardedSwarmStore, SwarmStore, TimeWheel, peer_key
+
+HASH_A = 'aa' * 20
+HASH_B = 'bb' * 20
+
+
+def peers_of(entries):
+    return sorted(peer['peer_id'] for peer in entries)
+
+
+class SwarmStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SwarmStore()
+        self.store.connect('p1', '10.0.0.1', 6881)
+        self.store.connect('p2', '10.0.0.2', 6881)
+        self.store.add_torrent_peer(HASH_A, 'a.bin', 'p1', '10.0.0.1', 6881)
+        self.store.add_torrent_peer(HASH_B, 'b.bin', 'p1', '10.0.0.1', 6881)
+        self.store.add_torrent_peer(HASH_A, 'a.bin', 'p2', '10.0.0.2', 6881)
+
+    def test_connect_rejects_a_second_registration(self):
+        self.assertFalse(self.store.connect('p1', '10.0.0.9', 1))
+
+    def test_swarms_are_indexed_by_filename(self):
+        self.assertEqual(self.store.find_by_filename('a.bin').info_hash, HASH_A)
+        self.assertIsNone(self.store.find_by_filename('missing.bin'))
+        self.assertEqual(self.store.torrent_info(HASH_B)['filename'], 'b.bin')
+
+    def test_reverse_index_lists_the_torrents_of_a_peer(self):
+        self.assertEqual(self.store.peer_torrents[peer_key('p1', '10.0.0.1', 6881)], {HASH_A, HASH_B})
+
+    def test_disconnect_removes_the_peer_from_every_swarm(self):
+        self.assertEqual(self.store.disconnect('p1', '10.0.0.1', 6881), 'success')
+        self.assertEqual(peers_of(self.store.peer_list(HASH_A)), ['p2'])
+        self.assertEqual(self.store.peer_list(HASH_B), [])
+        self.assertNotIn(peer_key('p1', '10.0.0.1', 6881), self.store.peer_torrents)
+
+    def test_disconnect_checks_the_address(self):
+        self.assertEqual(self.store.disconnect('p1', '10.0.0.9', 6881), 'mismatch')
+        self.assertEqual(self.store.disconnect('p9', '10.0.0.9', 6881), 'not_found')
+
+    def test_seeding_and_leeching_by_filename(self):
+        self.store.set_seeding('a.bin', 'p1', '10.0.0.1', 6881, 'start')
+        self.store.set_leeching('a.bin', 'p3', '10.0.0.3', 6881, 'start')
+        scrape = self.store.scrape('a.bin')
+        self.assertEqual(peers_of(scrape['seeders']), ['p1'])
+        self.assertEqual(peers_of(scrape['leechers']), ['p3'])
+        self.assertEqual(peers_of(self.store.peer_list(HASH_A)), ['p1', 'p2', 'p3'])
+        self.store.set_leeching('a.bin', 'p3', '10.0.0.3', 6881, 'end')
+        self.assertEqual(self.store.scrape('a.bin')['leechers'], [])
+        self.assertIsNone(self.store.set_seeding('missing.bin', 'p1', '10.0.0.1', 6881, 'start'))
+
+    def test_peer_list_excludes_the_asking_peer(self):
+        exclude = peer_key('p1', '10.0.0.1', 6881)
+        self.assertEqual(peers_of(self.store.peer_list(HASH_A, exclude=exclude)), ['p2'])
+        self.assertEqual(peers_of(self.store.peer_list(HASH_A, numwant=5, exclude=exclude)), ['p2'])
+        self.assertEqual(len(self.store.peer_list(HASH_A, numwant=1)), 1)
+        self.assertIsNone(self.store.peer_list('cc' * 20))
+
+    def test_announce_moves_a_leecher_to_seeders(self):
+        self.store.announce(HASH_A, 'p3', '10.0.0.3', 6881, 100, 'started')
+        self.assertEqual(self.store.scrape_counts(HASH_A), (0, 0, 1))
+        peers, seeders, leechers = self.store.announce(HASH_A, 'p3', '10.0.0.3', 6881, 0, 'completed')
+        self.assertEqual((seeders, leechers), (1, 0))
+        self.assertEqual(self.store.scrape_counts(HASH_A), (1, 1, 0))
+        self.assertNotIn('p3', peers_of(peers))
+        self.store.announce(HASH_A, 'p3', '10.0.0.3', 6881, 0, 'stopped')
+        self.assertEqual(self.store.scrape_counts(HASH_A), (0, 1, 0))
+        self.assertIsNone(self.store.announce('cc' * 20, 'p3', '10.0.0.3', 6881, 0))
+
+
+class ShardedSwarmStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ShardedSwarmStore(num_shards=4)
+
+    def test_filename_index_spans_shards(self):
+        hashes = ['%040x' % i for i in range(20)]
+        self.assertGreater(len({self.store.shard_of(info_hash) for info_hash in hashes}), 1)
+        for number, info_hash in enumerate(hashes):
+            self.store.add_torrent_peer(info_hash, f'file_{number}', 'p1', '10.0.0.1', 6881)
+        for number, info_hash in enumerate(hashes):
+            self.assertIsNotNone(self.store.set_seeding(f'file_{number}', 'p2', '10.0.0.2', 6881, 'start'))
+            self.assertEqual(peers_of(self.store.scrape(f'file_{number}')['seeders']), ['p2'])
+        self.assertEqual(self.store.stats()['swarms'], 20)
+
+    def test_connect_renews_the_same_address_only(self):
+        self.assertTrue(self.store.connect('p1', '10.0.0.1', 6881))
+        self.assertTrue(self.store.connect('p1', '10.0.0.1', 6881))
+        self.assertFalse(self.store.connect('p1', '10.0.0.2', 6881))
+
+    def test_disconnect_removes_the_peer_from_all_shards(self):
+        hashes = ['%040x' % i for i in range(8)]
+        self.store.connect('p1', '10.0.0.1', 6881)
+        for info_hash in hashes:
+            self.store.add_torrent_peer(info_hash, info_hash, 'p1', '10.0.0.1', 6881)
+        self.assertEqual(self.store.disconnect('p1', '10.0.0.1', 6881), 'success')
+        self.assertTrue(all(self.store.peer_list(info_hash) == [] for info_hash in hashes))
+        self.assertEqual(self.store.stats()['connected_peers'], 0)
+
+    def test_announce_many_registers_and_reports_missing(self):
+        missing = self.store.announce_many('p1', '10.0.0.1', 6881, [
+            (HASH_A, 'a.bin', 0, 'started'),
+            (HASH_B, None, 10, 'started'),
+        ])
+        self.assertEqual(missing, [HASH_B])
+        self.assertEqual(self.store.scrape_counts(HASH_A), (1, 0, 0))
+        self.assertIsNotNone(self.store.scrape('a.bin'))
+
+    def test_dropped_swarms_leave_the_filename_index(self):
+        self.store.add_torrent_peer(HASH_A, 'a.bin', 'p1', '10.0.0.1', 6881)
+        exported = self.store.export_swarms(lambda info_hash: True)
+        self.store.drop_swarms([HASH_A])
+        self.assertIsNone(self.store.scrape('a.bin'))
+        self.store.import_swarms(exported)
+        self.assertEqual(peers_of(self.store.peer_list(HASH_A)), ['p1'])
+
+
+class TimeWheelTest(unittest.TestCase):
+
+    def test_keys_never_expire_early(self):
+        wheel = TimeWheel(granularity=1, now=100)
+        wheel.schedule('a', 105.5)
+        self.assertEqual(wheel.pop_expired(105.9), [])
+        self.assertEqual(wheel.pop_expired(106), ['a'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_past_deadlines_go_to_the_next_slot_swept(self):
+        wheel = TimeWheel(granularity=1, now=100)
+        wheel.pop_expired(110)
+        wheel.schedule('late', 50)
+        self.assertEqual(wheel.pop_expired(110.5), [])
+        self.assertEqual(wheel.pop_expired(111), ['late'])
+
+    def test_each_key_is_returned_once(self):
+        wheel = TimeWheel(granularity=2, now=0)
+        for number in range(10):
+            wheel.schedule(number, number)
+        self.assertEqual(sorted(wheel.pop_expired(5) + wheel.pop_expired(20)), list(range(10)))
+        self.assertEqual(wheel.pop_expired(40), [])
+
+
+class ExpiryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ShardedSwarmStore(num_shards=2, ttl=10)
+        self.store.connect('p1', '10.0.0.1', 6881)
+        self.store.connect('p2', '10.0.0.2', 6881)
+        self.store.add_torrent_peer(HASH_A, 'a.bin', 'p1', '10.0.0.1', 6881)
+        self.store.announce(HASH_A, 'p2', '10.0.0.2', 6881, 0, 'started')
+        self.start = time.monotonic()
+
+    def test_silent_peers_are_evicted_after_the_ttl(self):
+        self.assertEqual(self.store.expire(self.start + 5), 0)
+        # Hai mục swarm và hai đăng ký /connect
+        self.assertEqual(self.store.expire(self.start + 12), 4)
+        self.assertEqual(self.store.peer_list(HASH_A), [])
+        self.assertEqual(self.store.stats()['connected_peers'], 0)
+        self.assertEqual(self.store.shards[self.store.shard_of(HASH_A)].peer_torrents, {})
+
+    def test_announcing_again_renews_the_peer(self):
+        shard = self.store.shards[self.store.shard_of(HASH_A)]
+        key = peer_key('p2', '10.0.0.2', 6881)
+        # Announce lại lúc start + 8: lần hết hạn cũ trên bánh xe bị bỏ qua
+        shard.swarms[HASH_A].last_seen[key] = self.start + 8
+        shard.wheel.schedule((HASH_A, key), self.start + 18)
+        self.store.expire(self.start + 12)
+        self.assertEqual(peers_of(self.store.peer_list(HASH_A)), ['p2'])
+        self.assertEqual(self.store.expire(self.start + 20), 1)
+        self.assertEqual(self.store.peer_list(HASH_A), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
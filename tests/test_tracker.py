@@ -0,0 +1,40 @@
+import unittest
+
+import tracker
+from cluster import TrackerCluster
+
+SELF_URL = 'http://127.0.0.1:1/a'
+
+
+class ClusterRouteTest(unittest.TestCase):
+    """ Các route /cluster/* trả 400 cho yêu cầu sai thay vì 500 """
+
+    def setUp(self):
+        self.cluster = tracker.cluster
+        tracker.cluster = TrackerCluster(SELF_URL, [], tracker.store)
+        self.client = tracker.app.test_client()
+
+    def tearDown(self):
+        tracker.cluster = self.cluster
+
+    def test_set_members_validates_the_body(self):
+        for kwargs in ({}, {'json': ['x']}, {'json': {'members': [1]}},
+                       {'json': {'members': [SELF_URL], 'version': 'new'}},
+                       {'data': '{', 'content_type': 'application/json'}):
+            self.assertEqual(self.client.post('/cluster/members', **kwargs).status_code, 400, kwargs)
+        response = self.client.post('/cluster/members', json={'members': [SELF_URL], 'version': '2'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['version'], 2)
+
+    def test_import_validates_the_swarms(self):
+        for kwargs in ({}, {'json': {'swarms': 'x'}}, {'json': {'swarms': [['aa' * 20]]}}):
+            self.assertEqual(self.client.post('/cluster/import', **kwargs).status_code, 400, kwargs)
+        self.assertEqual(self.client.post('/cluster/import', json={'swarms': []}).status_code, 200)
+
+    def test_join_and_remove_peer_without_a_body(self):
+        self.assertEqual(self.client.post('/cluster/join').status_code, 400)
+        self.assertEqual(self.client.post('/cluster/remove_peer').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
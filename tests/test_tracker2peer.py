@@ -0,0 +1,100 @@
+import socket
+import threading
+import unittest
+
+from message.tracker2peer import (
+    ACTION_CONNECT, PROTOCOL_ID, TrackerError, UDPTrackerClient, canonical_host,
+    pack_announce_request, pack_announce_response, pack_compact_peers, pack_connect_request,
+    pack_connect_response, pack_error, pack_scrape_request, pack_scrape_response,
+    unpack_announce_request, unpack_announce_response, unpack_connect_response,
+    unpack_request_header, unpack_scrape_request, unpack_scrape_response, _RESPONSE_HEADER,
+)
+
+INFO_HASH = '12' * 20
+
+
+class CodecTest(unittest.TestCase):
+    """ Đóng gói/giải mã các gói BEP 15 """
+
+    def test_connect_round_trip(self):
+        self.assertEqual(unpack_request_header(pack_connect_request(7)), (PROTOCOL_ID, ACTION_CONNECT, 7))
+        self.assertEqual(unpack_connect_response(pack_connect_response(7, 99)), 99)
+
+    def test_truncated_packets_raise_tracker_error(self):
+        for unpack, data in ((unpack_request_header, b'\0' * 15),
+                             (unpack_connect_response, pack_connect_response(7, 99)[:12]),
+                             (unpack_announce_request, pack_announce_request(1, 2, INFO_HASH, 'p', 1, 0)[:-1]),
+                             (unpack_announce_response, pack_announce_response(2, 30, 0, 0, b'')[:-1])):
+            with self.assertRaises(TrackerError):
+                unpack(data)
+
+    def test_announce_request_round_trip(self):
+        data = pack_announce_request(1, 2, INFO_HASH, 'peer-1', 6881, left=10, downloaded=3,
+                                     uploaded=4, event='completed', numwant=25)
+        request = unpack_announce_request(data)
+        self.assertEqual(unpack_request_header(data)[0], 1)
+        self.assertEqual((request['info_hash'], request['peer_id'], request['port']), (INFO_HASH, 'peer-1', 6881))
+        self.assertEqual((request['left'], request['downloaded'], request['uploaded']), (10, 3, 4))
+        self.assertEqual((request['event'], request['numwant']), ('completed', 25))
+
+    def test_unknown_event_is_rejected(self):
+        data = bytearray(pack_announce_request(1, 2, INFO_HASH, 'p', 1, 0))
+        data[83] = 9  # byte thấp của trường event
+        with self.assertRaises(TrackerError):
+            unpack_announce_request(bytes(data))
+
+    def test_announce_response_round_trip(self):
+        peers = [{'peer_host': '10.0.0.1', 'peer_port': 6881}, {'peer_host': '::1', 'peer_port': 6882}]
+        peers4, peers6 = pack_compact_peers(peers)
+        interval, leechers, seeders, decoded = unpack_announce_response(pack_announce_response(2, 30, 1, 2, peers4))
+        self.assertEqual((interval, leechers, seeders), (30, 1, 2))
+        self.assertEqual([(peer['peer_host'], peer['peer_port']) for peer in decoded], [('10.0.0.1', 6881)])
+        decoded = unpack_announce_response(pack_announce_response(2, 30, 1, 2, peers6), ipv6=True)[3]
+        self.assertEqual([(peer['peer_host'], peer['peer_port']) for peer in decoded], [('::1', 6882)])
+
+    def test_scrape_round_trip(self):
+        hashes = [INFO_HASH, '34' * 20]
+        self.assertEqual(unpack_scrape_request(pack_scrape_request(1, 2, hashes)), hashes)
+        counts = [(1, 2, 3), (4, 5, 6)]
+        self.assertEqual(unpack_scrape_response(pack_scrape_response(2, counts)), counts)
+
+    def test_canonical_host(self):
+        self.assertEqual(canonical_host('localhost'), '127.0.0.1')
+        self.assertEqual(canonical_host('::ffff:10.0.0.1'), '10.0.0.1')
+        self.assertEqual(canonical_host('no-such-host.invalid'), 'no-such-host.invalid')
+        self.assertEqual(canonical_host(None), None)
+
+
+class UDPTrackerClientTest(unittest.TestCase):
+    """ Client với một server giả trả về đúng một phản hồi cho mỗi yêu cầu """
+
+    def serve(self, reply):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+
+        def answer():
+            data, addr = server.recvfrom(2048)
+            server.sendto(reply(unpack_request_header(data)[2]), addr)
+        threading.Thread(target=answer, daemon=True).start()
+        client = UDPTrackerClient('127.0.0.1', server.getsockname()[1], timeout=1, retries=1)
+        self.addCleanup(client.close)
+        return client
+
+    def test_connect(self):
+        client = self.serve(lambda transaction_id: pack_connect_response(transaction_id, 1234))
+        self.assertEqual(client.connect(), 1234)
+
+    def test_truncated_connect_response(self):
+        client = self.serve(lambda transaction_id: _RESPONSE_HEADER.pack(ACTION_CONNECT, transaction_id) + b'\0')
+        with self.assertRaises(TrackerError):
+            client.connect()
+
+    def test_error_response(self):
+        client = self.serve(lambda transaction_id: pack_error(transaction_id, "Torrent not registered"))
+        with self.assertRaisesRegex(TrackerError, "Torrent not registered"):
+            client.connect()
+
+
+if __name__ == '__main__':
+    unittest.main()
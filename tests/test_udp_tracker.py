@@ -0,0 +1,58 @@
+import unittest
+
+from message.tracker2peer import (
+    ACTION_ERROR, pack_announce_request, pack_connect_request, pack_scrape_request,
+    unpack_announce_response, unpack_connect_response, unpack_scrape_response, _RESPONSE_HEADER,
+)
+from swarm import ShardedSwarmStore
+from udp_tracker import UDPTracker
+
+INFO_HASH = '12' * 20
+CLIENT = ('127.0.0.1', 40000)
+
+
+class UDPTrackerTest(unittest.TestCase):
+    """ UDPTracker.handle với store thật, không chạy luồng phục vụ """
+
+    def setUp(self):
+        self.store = ShardedSwarmStore()
+        self.store.add_torrent_peer(INFO_HASH, 'a.bin', 'seed', '10.0.0.1', 6881)
+        self.tracker = UDPTracker(self.store, '127.0.0.1', 0, 30)
+
+    def tearDown(self):
+        self.tracker.sock.close()
+
+    def connect(self, addr=CLIENT):
+        return unpack_connect_response(self.tracker.handle(pack_connect_request(5), addr))
+
+    def test_announce_joins_the_swarm_by_source_address(self):
+        connection_id = self.connect()
+        response = self.tracker.handle(pack_announce_request(connection_id, 6, INFO_HASH, 'leech', 7000, 10,
+                                                             event='started'), CLIENT)
+        interval, leechers, seeders, peers = unpack_announce_response(response)
+        self.assertEqual((interval, leechers, seeders), (30, 1, 0))
+        self.assertEqual([(peer['peer_host'], peer['peer_port']) for peer in peers], [('10.0.0.1', 6881)])
+        self.assertEqual(self.store.scrape_counts(INFO_HASH), (0, 0, 1))
+        self.assertIn({'peer_id': 'leech', 'peer_host': '127.0.0.1', 'peer_port': 7000},
+                      self.store.peer_list(INFO_HASH))
+
+    def test_connection_id_is_bound_to_the_client_address(self):
+        connection_id = self.connect(('127.0.0.2', 40000))
+        response = self.tracker.handle(pack_scrape_request(connection_id, 6, [INFO_HASH]), CLIENT)
+        self.assertEqual(_RESPONSE_HEADER.unpack_from(response)[0], ACTION_ERROR)
+
+    def test_scrape_and_unknown_torrents(self):
+        connection_id = self.connect()
+        response = self.tracker.handle(pack_scrape_request(connection_id, 6, [INFO_HASH, '99' * 20]), CLIENT)
+        self.assertEqual(unpack_scrape_response(response), [(0, 0, 0), (0, 0, 0)])
+        response = self.tracker.handle(pack_announce_request(connection_id, 7, '99' * 20, 'p', 1, 0), CLIENT)
+        self.assertEqual(_RESPONSE_HEADER.unpack_from(response)[0], ACTION_ERROR)
+
+    def test_garbage_is_ignored(self):
+        self.assertIsNone(self.tracker.handle(b'short', CLIENT))
+        # connect không mang PROTOCOL_ID
+        self.assertIsNone(self.tracker.handle(b'\0' * 8 + pack_connect_request(5)[8:], CLIENT))
+
+
+if __name__ == '__main__':
+    unittest.main()
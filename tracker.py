@@ -1,130 +1,322 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, redirect, g
 import argparse
-from threading import Lock
+import base64
+import binascii
+import logging
 import hashlib
 import os
-from bencodepy import decode as bdecode
+from bencodepy import encode as bencode, decode as bdecode
 import json
+import signal
+import sys
+import time
+from threading import Thread
+from swarm import ShardedSwarmStore, MetadataStore, NUM_SHARDS, ANNOUNCE_INTERVAL, peer_key
+from message.tracker2peer import COMPACT_MIMETYPE, pack_compact_peers, canonical_host
+from message.peer2peer import verify_metadata
+from udp_tracker import UDPTracker
+from persistence import StateJournal
+from cluster import TrackerCluster, FORWARDED_HEADER, peer_ring_key
+from metrics import Metrics, setup_logging
+from urllib.parse import urlencode
+import requests
 
 app = Flask(__name__)
+log = logging.getLogger('tracker')
+metrics = Metrics()  # Xuất tại /metrics (định dạng Prometheus)
 
 # Dữ liệu tracker
-peers = {}
-info_hashes = {}  # Thông tin về các torrent (info_hash -> metadata)
-lock = Lock()
+# Peer đã kết nối và các torrent (info_hash -> swarm), chia shard theo info_hash;
+# store tự khóa từng shard nên các route không dùng lock chung
+store = ShardedSwarmStore(lock_factory=metrics.lock_factory)
+metrics.store = store
+torrent_metadata = MetadataStore()  # info_hash -> dict info bencode, phục vụ qua /torrent_info?metadata=1
+announce_interval = ANNOUNCE_INTERVAL  # Trả về cho peer để announce lại trước khi hết TTL
+cluster = None  # TrackerCluster khi chạy nhiều tracker chia nhau info_hash (--cluster/--join)
 
 MAX_PEERS = 10
+REAP_INTERVAL = 1  # Chu kỳ (giây) xóa các peer quá hạn
+ANNOUNCE_EVENTS = (None, 'started', 'completed', 'stopped')
+CLUSTER_VERSION_HEADER = 'X-Cluster-Version'  # Peer lấy lại danh sách tracker khi giá trị này đổi
+
+
+def remote_owner(key):
+    """ Tracker khác sở hữu key, hoặc None nếu yêu cầu được xử lý tại đây """
+    if cluster is None or request.headers.get(FORWARDED_HEADER) or request.args.get('hop'):
+        return None
+    owner = cluster.owner(key)
+    return None if owner == cluster.self_url else owner
+
+
+def redirect_to(owner):
+    """ Chuyển hướng (307, giữ method và body) tới tracker sở hữu; hop=1 chặn vòng lặp khi hai tracker lệch version """
+    query = urlencode(list(request.args.items(multi=True)) + [('hop', 1)])
+    return redirect(f"{owner}{request.path}?{query}", code=307)
+
+
+def relay(response):
+    """ Trả nguyên phản hồi của tracker khác cho peer """
+    return Response(response.content, status=response.status_code,
+                    content_type=response.headers.get('Content-Type'))
+
+
+def forward_to(owner):
+    """ Chuyển tiếp yêu cầu hiện tại tới tracker sở hữu rồi trả lại phản hồi của nó """
+    try:
+        return relay(cluster.forward(owner, request.method, request.path, params=request.args,
+                                     json=request.get_json(silent=True)))
+    except requests.exceptions.RequestException as e:
+        return jsonify({'status': 'error', 'message': f"Tracker {owner} is unavailable: {e}"}), 503
+
+
+def forward_to_members():
+    """ Hỏi lần lượt các tracker khác khi không tìm thấy filename tại đây; trả về None nếu không ai có """
+    if cluster is None or request.headers.get(FORWARDED_HEADER):
+        return None
+    for member in cluster.members:
+        if member == cluster.self_url:
+            continue
+        try:
+            response = cluster.forward(member, request.method, request.path, params=request.args,
+                                       json=request.get_json(silent=True))
+        except requests.exceptions.RequestException:
+            continue
+        if response.status_code != 404:
+            return relay(response)
+    return None
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    """ Ghi số liệu request theo route (mẫu URL, không phải URL cụ thể) và gắn version cluster """
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - start)
+    if cluster is not None:
+        response.headers[CLUSTER_VERSION_HEADER] = str(cluster.version)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """ Số liệu của tracker theo định dạng text của Prometheus """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 
 @app.route('/connect', methods=['POST'])
 def peer_connect():
     """ Đăng ký peer mới """
-    with lock:
-        data = request.json
-        peer_id = data.get('peer_id')
-        peer_host = data.get('peer_host')
-        peer_port = data.get('peer_port')
-
-        if not peer_id or not peer_host or not peer_port:
-            return jsonify({'status': 'fail', 'message': 'Invalid peer data'}), 400
+    data = request.json
+    peer_id = data.get('peer_id')
+    peer_host = data.get('peer_host')
+    peer_port = data.get('peer_port')
 
-        # Kiểm tra xem peer đã tồn tại chưa
-        if peer_id in peers:
-            return jsonify({'status': 'error', 'message': 'Peer already connected'}), 400
+    if not peer_id or not peer_host or not peer_port:
+        return jsonify({'status': 'fail', 'message': 'Invalid peer data'}), 400
+    owner = remote_owner(peer_ring_key(peer_id))
+    if owner is not None:
+        return forward_to(owner)
 
-        # Đăng ký peer
-        peers[peer_id] = (peer_host, peer_port)
-        print(f"Peer {peer_id} registered: {peer_host}:{peer_port}")
+    # Đăng ký peer mới, hoặc gia hạn nếu peer connect lại từ cùng địa chỉ
+    peer_host = canonical_host(peer_host)
+    registered = store.connect(peer_id, peer_host, peer_port)
+    if not registered:
+        return jsonify({'status': 'error', 'message': 'Peer ID already connected from another address'}), 400
 
-        return jsonify({'status': 'success', 'message': f"Peer {peer_id} registered successfully"}), 200
+    log.debug("Peer %s registered: %s:%s", peer_id, peer_host, peer_port)
+    return jsonify({'status': 'success', 'message': f"Peer {peer_id} registered successfully", 'interval': announce_interval}), 200
 
 @app.route('/peer_list', methods=['GET'])
 def get_peer_list():
-    """ Lấy danh sách các peer đang kết nối """
-    with lock:
-        info_hash = request.json
-        info_hash = info_hash['info_hash']
-        if info_hash in info_hashes:
-            peer_info = [peer for peer in info_hashes[info_hash]['peers']]
-            return jsonify({'status': 'success', 'message': 'Peer data retrieved', 'peers': peer_info}), 200
+    """
+    Lấy danh sách các peer đang kết nối.
+    Tham số tùy chọn: numwant (số peer ngẫu nhiên tối đa), compact=1 (trả về dạng
+    bencode với chuỗi peers/peers6 theo BEP 23), peer_id/peer_host/peer_port của
+    peer đang hỏi để không trả về chính nó.
+    """
+    data = request.get_json(silent=True) or request.args
+    info_hash = data.get('info_hash')
+    if not info_hash:
+        return jsonify({'status': 'fail', 'message': 'info_hash is required'}), 400
+    owner = remote_owner(info_hash)
+    if owner is not None:
+        return redirect_to(owner)
+    try:
+        numwant = data.get('numwant')
+        numwant = None if numwant is None else max(0, int(numwant))
+        compact = int(data.get('compact', 0)) == 1
+    except (TypeError, ValueError):
+        return jsonify({'status': 'fail', 'message': 'Invalid numwant or compact'}), 400
+    exclude = None
+    if data.get('peer_id') and data.get('peer_host') and data.get('peer_port'):
+        exclude = peer_key(data.get('peer_id'), canonical_host(data.get('peer_host')), data.get('peer_port'))
+
+    # Leecher cũng phục vụ các mảnh đã có nên được trả về cùng seeder
+    peer_info = store.peer_list(info_hash, numwant, exclude)
+    if peer_info is None:
         return jsonify({'status': 'error', 'message': 'Torrent not found'}), 404
+    if compact:
+        peers4, peers6 = pack_compact_peers(peer_info)
+        body = bencode({'interval': announce_interval, 'peers': peers4, 'peers6': peers6})
+        return Response(body, status=200, mimetype=COMPACT_MIMETYPE)
+    return jsonify({'status': 'success', 'message': 'Peer data retrieved', 'peers': peer_info, 'interval': announce_interval}), 200
 
 @app.route('/disconnect', methods=['POST'])
 def peer_disconnect():
     """ Ngắt kết nối peer """
-    with lock:
-        data = request.json
-        peer_id = data.get('peer_id')
-        peer_host = data.get('peer_host')
-        peer_port = data.get('peer_port')
-
-        # Xác thực peer
-        if peer_id in peers:
-            host, port = peers[peer_id]
-            if host == peer_host and port == peer_port:
-                del peers[peer_id]  # Xóa peer khỏi danh sách
-                for torrent in info_hashes:
-                    # Remove all matching peers for this torrent
-                    info_hashes[torrent]['peers'] = [
-                        peer_info for peer_info in info_hashes[torrent]['peers']
-                        if not (peer_info['host'] == peer_host and peer_info['port'] == peer_port)
-                    ]
-                            
-                print(f"Peer {peer_id} disconnected: {peer_host}:{peer_port}")
-                
-                return jsonify({'status': 'success', 'message': 'Peer disconnected successfully'}), 200
-            else:
-                return jsonify({'status': 'error', 'message': 'Peer information mismatch'}), 400
+    data = request.json
+    peer_id = data.get('peer_id')
+    peer_host = data.get('peer_host')
+    peer_port = data.get('peer_port')
+    owner = remote_owner(peer_ring_key(peer_id))
+    if owner is not None:
+        return forward_to(owner)
+
+    # Xác thực peer rồi xóa khỏi mọi swarm qua chỉ mục ngược
+    peer_host = canonical_host(peer_host)
+    result = store.disconnect(peer_id, peer_host, peer_port)
 
-        return jsonify({'status': 'error', 'message': 'Peer not found'}), 404
+    if result == 'success':
+        if cluster is not None:
+            # Swarm của peer nằm rải rác trên các tracker khác
+            cluster.broadcast(cluster.members, '/cluster/remove_peer',
+                              {'peer_id': peer_id, 'peer_host': peer_host, 'peer_port': peer_port})
+        log.debug("Peer %s disconnected: %s:%s", peer_id, peer_host, peer_port)
+        return jsonify({'status': 'success', 'message': 'Peer disconnected successfully'}), 200
+    if result == 'mismatch':
+        return jsonify({'status': 'error', 'message': 'Peer information mismatch'}), 400
+    return jsonify({'status': 'error', 'message': 'Peer not found'}), 404
 
 @app.route('/info_hash', methods=['POST'])
 def upload_info_hash():
     """ Nhận và lưu thông tin torrent từ peer """
-    with lock:
-        data = request.json
-
-        peer_id = data.get('peer_id')
-        peer_host = data.get('peer_host')
-        peer_port = data.get('peer_port')
-        filename = data.get('filename')
-        info_hash = data.get('info_hash')
-
-        # Xác thực dữ liệu
-        if not peer_id or not peer_host or not peer_port or not filename or not info_hash:
-            return jsonify({'status': 'fail', 'message': 'Invalid data'}), 400
-
-        # Kiểm tra info_hash có tồn tại hay chưa
-        if info_hash not in info_hashes:
-            # Thêm info_hash mới vào tracker
-            info_hashes[info_hash] = {
-                'filename': filename,
-                'peers': [],
-                'seeders': [],
-                'leechers': []
-            }
-
-        # Thêm peer vào danh sách chia sẻ info_hash
-        info_hashes[info_hash]['peers'].append({
-            'peer_id': peer_id,
-            'peer_host': peer_host,
-            'peer_port': peer_port
-        })
-
-        print(f"Received info_hash {info_hash} for file {filename} from peer {peer_id}")
-        return jsonify({'status': 'success', 'message': 'Torrent info uploaded successfully'}), 200
+    data = request.json
+
+    peer_id = data.get('peer_id')
+    peer_host = data.get('peer_host')
+    peer_port = data.get('peer_port')
+    filename = data.get('filename')
+    info_hash = data.get('info_hash')
+
+    # Xác thực dữ liệu
+    if not peer_id or not peer_host or not peer_port or not filename or not info_hash:
+        return jsonify({'status': 'fail', 'message': 'Invalid data'}), 400
+    owner = remote_owner(info_hash)
+    if owner is not None:
+        return redirect_to(owner)
+
+    # Thêm info_hash mới (nếu chưa có) và thêm peer vào danh sách chia sẻ
+    peer_host = canonical_host(peer_host)
+    store.add_torrent_peer(info_hash, filename, peer_id, peer_host, peer_port)
+
+    log.debug("Received info_hash %s for file %s from peer %s", info_hash, filename, peer_id)
+    return jsonify({'status': 'success', 'message': 'Torrent info uploaded successfully', 'interval': announce_interval}), 200
+
+@app.route('/announce', methods=['POST'])
+def announce_batch():
+    """
+    Announce nhiều torrent của một peer trong một yêu cầu.
+    entries: Danh sách {'info_hash', 'filename', 'left', 'event'}; left = 0 là seeding,
+    event là 'started', 'completed', 'stopped' hoặc bỏ trống.
+    """
+    data = request.json
+    peer_id = data.get('peer_id')
+    peer_host = data.get('peer_host')
+    peer_port = data.get('peer_port')
+    entries = data.get('entries')
+
+    if not peer_id or not peer_host or not peer_port or not isinstance(entries, list):
+        return jsonify({'status': 'fail', 'message': 'Invalid data'}), 400
+    try:
+        entries = [(entry['info_hash'], entry.get('filename'), int(entry.get('left', 0)), entry.get('event'))
+                   for entry in entries]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'status': 'fail', 'message': 'Invalid entries'}), 400
+    if any(event not in ANNOUNCE_EVENTS for _, _, _, event in entries):
+        return jsonify({'status': 'fail', 'message': 'Invalid event'}), 400
+
+    # Trong cluster: chuyển các entry của tracker khác cho chủ của chúng, mỗi tracker một yêu cầu
+    remote = {}
+    if cluster is not None and not request.headers.get(FORWARDED_HEADER):
+        local = []
+        for entry, raw in zip(entries, data['entries']):
+            owner = cluster.owner(entry[0])
+            if owner == cluster.self_url:
+                local.append(entry)
+            else:
+                remote.setdefault(owner, []).append(raw)
+        entries = local
+
+    # Các entry cùng shard được áp dụng trong một lần giữ lock
+    peer_host = canonical_host(peer_host)
+    missing = store.announce_many(peer_id, peer_host, peer_port, entries)
+    for owner, raw_entries in remote.items():
+        try:
+            response = cluster.forward(owner, 'POST', '/announce', json=dict(data, entries=raw_entries))
+            missing.extend(response.json().get('not_found', []))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log.warning("Failed to forward announce to %s: %s", owner, e)
+            missing.extend(entry['info_hash'] for entry in raw_entries)
+
+    total = len(data['entries'])
+    log.debug("Peer %s announced %d torrents", peer_id, total)
+    return jsonify({'status': 'success', 'message': f"Announced {total - len(missing)} torrents",
+                    'not_found': missing, 'interval': announce_interval}), 200
 
 @app.route('/torrent_info', methods=['GET'])
 def get_torrent_info():
-    """ Lấy thông tin torrent từ info_hash """
-    with lock:
-        info_hash = request.args.get('info_hash')
-        if not info_hash:
-            return jsonify({'status': 'fail', 'message': 'info_hash is required'}), 400
+    """
+    Lấy thông tin torrent từ info_hash.
+    metadata=1: trả về dict info bencode (để peer chỉ biết info_hash tạo lại file .torrent).
+    """
+    info_hash = request.args.get('info_hash')
+    if not info_hash:
+        return jsonify({'status': 'fail', 'message': 'info_hash is required'}), 400
+    owner = remote_owner(info_hash)
+    if owner is not None:
+        return redirect_to(owner)
+
+    if request.args.get('metadata'):
+        metadata = torrent_metadata.get(info_hash)
+        if metadata is None:
+            return jsonify({'status': 'fail', 'message': 'Metadata not found'}), 404
+        return Response(metadata, status=200, mimetype=COMPACT_MIMETYPE)
+
+    info = store.torrent_info(info_hash)
+    if info is None:
+        return jsonify({'status': 'fail', 'message': 'info_hash not found'}), 404
+
+    return jsonify(info), 200
+
+@app.route('/metadata', methods=['POST'])
+def upload_metadata():
+    """ Nhận metadata (dict info bencode, mã base64) của torrent từ peer chia sẻ """
+    data = request.json
+    info_hash = data.get('info_hash')
+    encoded = data.get('metadata')
 
-        if info_hash not in info_hashes:
-            return jsonify({'status': 'fail', 'message': 'info_hash not found'}), 404
+    if not info_hash or not encoded:
+        return jsonify({'status': 'fail', 'message': 'Invalid data'}), 400
+    owner = remote_owner(info_hash)
+    if owner is not None:
+        return redirect_to(owner)
+    try:
+        metadata = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError, TypeError):
+        return jsonify({'status': 'fail', 'message': 'Invalid metadata encoding'}), 400
+    if verify_metadata(info_hash, metadata) is None:
+        return jsonify({'status': 'fail', 'message': 'Metadata does not match info_hash'}), 400
 
-        return jsonify(info_hashes[info_hash]), 200
+    torrent_metadata.add(info_hash, metadata)
+    log.debug("Received metadata for %s (%d bytes)", info_hash, len(metadata))
+    return jsonify({'status': 'success', 'message': 'Metadata stored'}), 200
 
 @app.route('/seeding', methods=['POST'])
 def seeding():
@@ -137,38 +329,22 @@ def seeding():
 
     if not filename or not peer_host or not peer_port or not peer_id or not flag:
         return jsonify({"status": "fail", "message": "Missing required parameters"}), 400
-    
-    for info_hash, details in info_hashes.items():
-        if details.get('filename') == filename:
-            if flag == 'start':
-                existing_seeder = next((seeder for seeder in info_hashes[info_hash]['seeders']
-                                        if seeder['peer_id'] == peer_id and seeder['peer_host'] == peer_host and seeder['peer_port'] == peer_port), None)
-                print(existing_seeder)
-                if not existing_seeder:
-                    info_hashes[info_hash]['seeders'].append({
-                        'peer_id': peer_id,
-                        'peer_host': peer_host,
-                        'peer_port': peer_port
-                    })
-                return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} is seeding {filename}"})    
-                
-            elif flag == 'end':
-                info_hashes[info_hash]['seeders'] = [
-                    seeder for seeder in info_hashes[info_hash]['seeders']
-                    if not (
-                        seeder['peer_id'] == peer_id and
-                        seeder['peer_host'] == peer_host and
-                        seeder['peer_port'] == peer_port
-                    )
-                ]
-                print(f"Peer {peer_id} - {peer_host}:{peer_port} stop seeding.")
-                return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} stop seeding {filename}"})
+
+    peer_host = canonical_host(peer_host)
+    swarm = store.set_seeding(filename, peer_id, peer_host, peer_port, flag)
+    if swarm is None:
+        # Torrent có thể thuộc một tracker khác trong cluster
+        return forward_to_members() or (jsonify({"status": "fail", "message": f"{filename} not found"}), 404)
+
+    if flag == 'end':
+        log.debug("Peer %s - %s:%s stop seeding.", peer_id, peer_host, peer_port)
+        return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} stop seeding {filename}", "interval": announce_interval})
+    return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} is seeding {filename}", "interval": announce_interval})
 
 
 @app.route('/leeching', methods=['POST'])
 def leeching():
     data = request.json
-    info_hash = data.get('info_hash')
     filename = data.get('filename')
     peer_host = data.get('peer_host')
     peer_port = data.get('peer_port')
@@ -177,62 +353,154 @@ def leeching():
 
     if not filename or not peer_host or not peer_port or not peer_id or not flag:
         return jsonify({"status": "fail", "message": "Missing required parameters"}), 400
-    
-    for info_hash, details in info_hashes.items():
-        if details.get('filename') == filename:
-            if flag == 'start':
-                existing_leecher = next((leecher for leecher in info_hashes[info_hash]['leechers']
-                                         if leecher['peer_id'] == peer_id and leecher['peer_host'] == peer_host and leecher['peer_port'] == peer_port), None)
-                
-                if not existing_leecher:
-                    info_hashes[info_hash]['leechers'].append({
-                        'peer_id': peer_id,
-                        'peer_host': peer_host,
-                        'peer_port': peer_port
-                    })
-                return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} is downloading {filename}"})
-                
-            elif flag == 'end':
-                info_hashes[info_hash]['leechers'] = [
-                    leecher for leecher in info_hashes[info_hash]['leechers']
-                    if not (
-                        leecher['peer_id'] == peer_id and
-                        leecher['peer_host'] == peer_host and
-                        leecher['peer_port'] == peer_port
-                    )
-                ]
-                print(f"Peer {peer_id} - {peer_host}:{peer_port} stop downloading.")
-                return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} stop downloading {filename}"})
+
+    peer_host = canonical_host(peer_host)
+    swarm = store.set_leeching(filename, peer_id, peer_host, peer_port, flag)
+    if swarm is None:
+        # Torrent có thể thuộc một tracker khác trong cluster
+        return forward_to_members() or (jsonify({"status": "fail", "message": f"{filename} not found"}), 404)
+
+    if flag == 'end':
+        log.debug("Peer %s - %s:%s stop downloading.", peer_id, peer_host, peer_port)
+        return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} stop downloading {filename}", "interval": announce_interval})
+    return jsonify({"status": "success", "message": f"Peer {peer_id} - {peer_host}:{peer_port} is downloading {filename}", "interval": announce_interval})
 
 
 @app.route('/scrape', methods=['GET'])
 def scrape():
     """ Thực hiện scrape để lấy thông tin các peer """
-    with lock:
-        filename = request.args.get('filename')
-        if not filename:
-            return jsonify({'status': 'fail', 'message': 'filename is required'}), 400
-                
-        result = {}
-    
-        for info_hash, details in info_hashes.items():
-            if details.get('filename') == filename:
-                result = {
-                    "seeders": info_hashes[info_hash]['seeders'], 
-                    "leechers": info_hashes[info_hash]['leechers']
-                }
-                break
-            else : result[filename] = {'status': 'fail', 'message': 'filename not found'}
-        
-        return jsonify(result), 200
+    filename = request.args.get('filename')
+    if not filename:
+        return jsonify({'status': 'fail', 'message': 'filename is required'}), 400
+
+    result = store.scrape(filename)
+    if result is None:
+        forwarded = forward_to_members()
+        if forwarded is not None:
+            return forwarded
+        if request.headers.get(FORWARDED_HEADER):
+            return jsonify({'status': 'fail', 'message': 'filename not found'}), 404
+        result = {filename: {'status': 'fail', 'message': 'filename not found'}}
+
+    return jsonify(result), 200
+
+
+def json_object():
+    """ Thân yêu cầu nếu là JSON object, ngược lại dict rỗng (để route trả 400 thay vì 500) """
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else {}
+
+@app.route('/cluster', methods=['GET'])
+def cluster_members():
+    """ Danh sách tracker trong cluster và version của nó, để peer tự định tuyến theo info_hash """
+    if cluster is None:
+        return jsonify({'status': 'fail', 'message': 'Tracker is not part of a cluster'}), 404
+    return jsonify(cluster.to_dict()), 200
+
+@app.route('/cluster/join', methods=['POST'])
+def cluster_join():
+    """ Thêm một tracker mới vào cluster rồi phát danh sách mới cho mọi thành viên """
+    url = json_object().get('url')
+    if cluster is None or not url or not isinstance(url, str):
+        return jsonify({'status': 'fail', 'message': 'Invalid join request'}), 400
+    cluster.change_members(add=[url])
+    return jsonify(cluster.to_dict()), 200
+
+@app.route('/cluster/members', methods=['POST'])
+def cluster_set_members():
+    """ Nhận danh sách thành viên mới từ tracker khác """
+    data = json_object()
+    members = data.get('members')
+    if cluster is None or not isinstance(members, list) or not all(isinstance(member, str) for member in members):
+        return jsonify({'status': 'fail', 'message': 'Invalid member list'}), 400
+    try:
+        version = int(data.get('version', 0))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'fail', 'message': 'Invalid version'}), 400
+    cluster.set_members(members, version)
+    return jsonify(cluster.to_dict()), 200
+
+@app.route('/cluster/import', methods=['POST'])
+def cluster_import():
+    """ Nhận các swarm mà tracker khác chuyển sang khi cân bằng lại """
+    swarms = json_object().get('swarms')
+    # Mỗi swarm là [info_hash, filename, completed, peers, seeders, leechers] như export_swarms
+    if not isinstance(swarms, list) or not all(isinstance(data, list) and len(data) == 6 for data in swarms):
+        return jsonify({'status': 'fail', 'message': 'Invalid swarms'}), 400
+    store.import_swarms(swarms)
+    log.info("Imported %d swarms", len(swarms))
+    return jsonify({'status': 'success', 'imported': len(swarms)}), 200
+
+@app.route('/cluster/remove_peer', methods=['POST'])
+def cluster_remove_peer():
+    """ Gỡ peer đã disconnect ở tracker khác khỏi các swarm tại đây """
+    data = json_object()
+    store.remove_peer(data.get('peer_id'), canonical_host(data.get('peer_host')), data.get('peer_port'))
+    return jsonify({'status': 'success'}), 200
+
+
+def reap_stale_peers():
+    """ Luồng nền xóa các peer không announce lại trong TTL """
+    while True:
+        time.sleep(REAP_INTERVAL)
+        evicted = store.expire()
+        if evicted:
+            log.debug("Evicted %d stale peer entries", evicted)
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Start the tracker.")
     parser.add_argument('--host', type=str, default='localhost', help="IP address of the tracker (default is localhost)")
     parser.add_argument('--port', type=int, default=8000, help="Port number for the tracker (default is 8000)")
+    parser.add_argument('--udp-port', type=int, default=None, help="Port of the UDP (BEP 15) tracker; defaults to --port, 0 disables it")
+    parser.add_argument('--interval', type=int, default=ANNOUNCE_INTERVAL, help="Announce interval in seconds; peers silent for 3 intervals are evicted (default is 30)")
+    parser.add_argument('--state-dir', type=str, default=None, help="Directory for the write-ahead log and snapshots; state is kept in memory only if omitted")
+    parser.add_argument('--fsync', action='store_true', help="fsync the write-ahead log after each batch and snapshot so state survives an OS crash (default off; a tracker crash alone loses nothing already written)")
+    parser.add_argument('--shards', type=int, default=NUM_SHARDS, help="Number of lock-striped state shards (default is 16)")
+    parser.add_argument('--self-url', type=str, default=None, help="URL other trackers and peers use to reach this one (default is http://host:port)")
+    parser.add_argument('--cluster', type=str, default=None, help="Comma-separated URLs of all trackers in a static cluster")
+    parser.add_argument('--join', type=str, default=None, help="URL of any running tracker whose cluster this one joins")
+    parser.add_argument('--log-level', type=str, default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="Log level; DEBUG logs every request (default is INFO)")
     return parser.parse_args()
 
 if __name__ == '__main__':
     args = parse_arguments()
-    app.run(host=args.host, port=8000)
+    log_listener = setup_logging(args.log_level)
+    announce_interval = args.interval
+    store = ShardedSwarmStore(args.shards, ttl=3 * args.interval, lock_factory=metrics.lock_factory)
+    metrics.store = store
+    journal = None
+    if args.state_dir:
+        # Nạp lại trạng thái trước khi nhận yêu cầu, sau đó mới ghi nhật ký
+        journal = StateJournal(args.state_dir, fsync=args.fsync)
+        start = time.perf_counter()
+        replayed = journal.load(store)
+        log.info("Restored tracker state from %s (%d log records) in %.3fs", args.state_dir, replayed, time.perf_counter() - start)
+        store.set_journal(journal)
+        journal.start(store)
+    Thread(target=reap_stale_peers, daemon=True).start()
+    if args.cluster or args.join:
+        self_url = args.self_url or f"http://{args.host}:{args.port}"
+        members = [url.strip() for url in (args.cluster or '').split(',') if url.strip()]
+        cluster = TrackerCluster(self_url, members, store)
+        if args.join:
+            # Các tracker khác sẽ thử lại việc chuyển swarm tới đây cho tới khi server HTTP chạy
+            cluster.join(args.join)
+        cluster.start()
+    udp_port = args.port if args.udp_port is None else args.udp_port
+    if udp_port and cluster is not None:
+        # Tracker UDP không chuyển tiếp theo info_hash nên chỉ dùng khi chạy một tracker
+        log.warning("UDP tracker is disabled in cluster mode")
+    elif udp_port:
+        UDPTracker(store, args.host, udp_port, announce_interval).start()
+    # kill (SIGTERM) thoát như Ctrl+C để khối finally ghi nốt nhật ký và rời cluster
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        log.info("Tracker listening on %s:%d", args.host, args.port)
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        if cluster is not None:
+            cluster.leave()
+        if journal is not None:
+            journal.close()
+        log_listener.stop()
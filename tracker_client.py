@@ -0,0 +1,112 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_SIZE = 16          # Số kết nối keep-alive tối đa tới mỗi tracker
+REQUEST_TIMEOUT = 10    # Timeout (giây) của mỗi yêu cầu HTTP tới tracker
+NOTIFY_DELAY = 0.2      # Thời gian (giây) gom các thông báo trạng thái trước khi gửi
+PEER_LIST_MAX_AGE = 5   # Thời gian (giây) dùng lại danh sách peer đã lấy từ tracker
+
+
+class TrackerClient:
+    """
+    Kết nối HTTP tới tracker dùng chung cho một peer. Một Session giữ các kết nối
+    keep-alive; thông báo trạng thái (seeding/leeching) được xếp hàng, gộp theo key
+    và gửi ở luồng nền nên server seeding không bao giờ chờ tracker; danh sách
+    peer được dùng lại trong PEER_LIST_MAX_AGE giây.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=REQUEST_TIMEOUT, notify_delay=NOTIFY_DELAY,
+                 peer_list_max_age=PEER_LIST_MAX_AGE):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.timeout = timeout
+        self.notify_delay = notify_delay
+        self.peer_list_max_age = peer_list_max_age
+        self.lock = threading.Lock()
+        self.pending = {}       # key -> (url, data) chờ gửi; thông báo mới thay thông báo cũ cùng key
+        self.sent = {}          # key -> data đã gửi thành công gần nhất
+        self.sending = False    # Luồng nền đang gửi một lô
+        self.wakeup = threading.Event()
+        self.notifier_thread = None
+        self.peer_lists = {}    # info_hash -> (thời điểm lấy, danh sách peer)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(url, **kwargs)
+
+    # Thông báo trạng thái
+
+    def notify(self, key, url, data):
+        """ Xếp hàng một thông báo, trả về ngay; bỏ qua nếu giống lần đã gửi trước cho key này """
+        with self.lock:
+            if key not in self.pending and self.sent.get(key) == data:
+                return
+            self.pending[key] = (url, data)
+            if self.notifier_thread is None:
+                self.notifier_thread = threading.Thread(target=self.notify_loop, daemon=True)
+                self.notifier_thread.start()
+        self.wakeup.set()
+
+    def notify_loop(self):
+        """ Gửi các thông báo đang chờ theo lô, mỗi key chỉ gửi trạng thái mới nhất """
+        while True:
+            self.wakeup.wait()
+            time.sleep(self.notify_delay)
+            with self.lock:
+                self.wakeup.clear()
+                batch, self.pending = self.pending, {}
+                self.sending = True
+            for key, (url, data) in batch.items():
+                try:
+                    response = self.post(url, json=data)
+                except requests.exceptions.RequestException as e:
+                    print(f"Failed to notify tracker: {e}")
+                    continue
+                if response.ok:
+                    with self.lock:
+                        self.sent[key] = data
+            with self.lock:
+                self.sending = False
+
+    def flush(self, timeout=REQUEST_TIMEOUT):
+        """ Chờ các thông báo đang xếp hàng được gửi xong (tối đa timeout giây) """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.pending and not self.sending:
+                    return True
+            time.sleep(self.notify_delay / 4)
+        return False
+
+    def reset(self):
+        """ Quên các trạng thái đã gửi (tracker có thể đã mất chúng, ví dụ sau khi connect lại) """
+        with self.lock:
+            self.sent.clear()
+            self.peer_lists.clear()
+
+    # Cache danh sách peer
+
+    def cached_peer_list(self, info_hash):
+        """ Danh sách peer lấy chưa quá peer_list_max_age giây, hoặc None """
+        with self.lock:
+            cached = self.peer_lists.get(info_hash)
+        if cached is None or time.monotonic() - cached[0] > self.peer_list_max_age:
+            return None
+        return cached[1]
+
+    def cache_peer_list(self, info_hash, peers):
+        # Danh sách rỗng không được cache để lần hỏi sau tìm lại peer ngay
+        with self.lock:
+            if peers:
+                self.peer_lists[info_hash] = (time.monotonic(), peers)
+            else:
+                self.peer_lists.pop(info_hash, None)
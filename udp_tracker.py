@@ -0,0 +1,113 @@
+import hashlib
+import hmac
+import logging
+import os
+import socket
+import time
+from threading import Thread
+
+from message.tracker2peer import (
+    ACTION_CONNECT, ACTION_ANNOUNCE, ACTION_SCRAPE, PROTOCOL_ID, MAX_DATAGRAM, TrackerError,
+    COMPACT_IPV4_LENGTH, COMPACT_IPV6_LENGTH, pack_compact_peers, canonical_host,
+    unpack_request_header, unpack_announce_request, unpack_scrape_request,
+    pack_connect_response, pack_announce_response, pack_scrape_response, pack_error,
+)
+from swarm import NUMWANT
+
+CONNECTION_ID_WINDOW = 60  # connection_id hợp lệ trong cửa sổ hiện tại và cửa sổ trước (giây)
+MAX_SCRAPE_HASHES = 74     # Số info_hash tối đa trong một scrape (BEP 15)
+
+log = logging.getLogger('udp_tracker')
+
+
+class UDPTracker:
+    """
+    Tracker UDP theo BEP 15, chạy cạnh tracker HTTP và dùng chung ShardedSwarmStore.
+    connection_id được ký bằng HMAC theo địa chỉ client và cửa sổ thời gian nên
+    server không phải lưu trạng thái cho từng client.
+    """
+
+    def __init__(self, store, host, port, interval):
+        self.store = store
+        self.interval = interval
+        self.secret = os.urandom(16)
+        family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)[0]
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        self.ipv6 = family == socket.AF_INET6
+        # Giới hạn số peer để phản hồi vừa một datagram
+        entry_length = COMPACT_IPV6_LENGTH if self.ipv6 else COMPACT_IPV4_LENGTH
+        self.max_numwant = (MAX_DATAGRAM - 20) // entry_length
+
+    def connection_id(self, addr, window):
+        digest = hmac.new(self.secret, f"{addr[0]}:{addr[1]}:{window}".encode(), hashlib.sha1).digest()
+        return int.from_bytes(digest[:8], 'big')
+
+    def valid_connection_id(self, connection_id, addr):
+        window = int(time.time() // CONNECTION_ID_WINDOW)
+        return connection_id in (self.connection_id(addr, window), self.connection_id(addr, window - 1))
+
+    def handle(self, data, addr):
+        """ Xử lý một datagram; trả về phản hồi hoặc None nếu bỏ qua """
+        try:
+            connection_id, action, transaction_id = unpack_request_header(data)
+        except TrackerError:
+            return None
+        try:
+            if action == ACTION_CONNECT:
+                if connection_id != PROTOCOL_ID:
+                    return None
+                window = int(time.time() // CONNECTION_ID_WINDOW)
+                return pack_connect_response(transaction_id, self.connection_id(addr, window))
+            if not self.valid_connection_id(connection_id, addr):
+                return pack_error(transaction_id, "Invalid connection id")
+            if action == ACTION_ANNOUNCE:
+                return self.handle_announce(transaction_id, data, addr)
+            if action == ACTION_SCRAPE:
+                return self.handle_scrape(transaction_id, data)
+            return pack_error(transaction_id, "Unknown action")
+        except TrackerError as e:
+            return pack_error(transaction_id, str(e))
+
+    def handle_announce(self, transaction_id, data, addr):
+        request = unpack_announce_request(data)
+        numwant = request['numwant']
+        numwant = NUMWANT if numwant < 0 else min(numwant, self.max_numwant)
+        # Peer được định danh bằng địa chỉ nguồn của datagram như BEP 15, ở cùng dạng với announce HTTP
+        result = self.store.announce(request['info_hash'], request['peer_id'], canonical_host(addr[0]), request['port'],
+                                     request['left'], request['event'], numwant)
+        if result is None:
+            return pack_error(transaction_id, "Torrent not registered")
+        peers, seeders, leechers = result
+        peers4, peers6 = pack_compact_peers(peers)
+        return pack_announce_response(transaction_id, self.interval, leechers, seeders,
+                                      peers6 if self.ipv6 else peers4)
+
+    def handle_scrape(self, transaction_id, data):
+        counts = []
+        for info_hash in unpack_scrape_request(data)[:MAX_SCRAPE_HASHES]:
+            counts.append(self.store.scrape_counts(info_hash) or (0, 0, 0))
+        return pack_scrape_response(transaction_id, counts)
+
+    def serve_forever(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                continue
+            try:
+                response = self.handle(data, addr)
+            except Exception:
+                # Lỗi bất ngờ (ví dụ dữ liệu sai trong store) chỉ làm hỏng datagram này
+                log.exception("Failed to handle UDP request from %s:%s", *addr[:2])
+                continue
+            if response is not None:
+                try:
+                    self.sock.sendto(response, addr)
+                except OSError:
+                    pass
+
+    def start(self):
+        """ Phục vụ trên luồng nền """
+        Thread(target=self.serve_forever, daemon=True).start()
+        log.info("UDP tracker listening on %s:%d", *self.sock.getsockname()[:2])